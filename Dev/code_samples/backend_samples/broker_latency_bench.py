@@ -0,0 +1,96 @@
+#Compares old message_broker dispatch (empty()/sleep(1ms) polling) with blocking get + stop sentinel
+#Loops are copied from Src/Backend/backend_classes.py so sample runs without PyQt
+#Usage: python broker_latency_bench.py [number_of_messages]
+from multiprocessing import Queue
+from threading import Thread
+import statistics
+import sys
+import time
+
+
+class stop_sentinel():
+    pass
+
+
+class message_():
+    def __init__(self,topic:str=None,source:str=None,data=None,optional_params=None):
+        self.topic = topic
+        self.data = data
+        self.source = source
+        self.optional_params = optional_params
+
+
+class polling_broker(Thread):
+    def __init__(self,topic_que_dict):
+        super().__init__()
+        self.control_flag = [True]
+        self.message_broker_queue = Queue()
+        self.topic_que_dict = topic_que_dict
+
+    def run(self):
+        while self.control_flag[0]:
+            if self.message_broker_queue.empty():
+                time.sleep(0.001)
+            else:
+                msg_ = self.message_broker_queue.get()
+                for subscriber_queue in self.topic_que_dict.get(msg_.topic,[]):
+                    subscriber_queue.put(msg_)
+
+    def stop_process(self):
+        self.control_flag[0] = False
+        self.join()
+
+
+class blocking_broker(Thread):
+    def __init__(self,topic_que_dict):
+        super().__init__()
+        self.message_broker_queue = Queue()
+        self.topic_que_dict = topic_que_dict
+
+    def run(self):
+        while True:
+            msg_ = self.message_broker_queue.get()
+            if isinstance(msg_,stop_sentinel):
+                break
+            for subscriber_queue in self.topic_que_dict.get(msg_.topic,[]):
+                subscriber_queue.put(msg_)
+
+    def stop_process(self):
+        self.message_broker_queue.put(stop_sentinel())
+        self.join()
+
+
+def measure_idle_cpu(broker_class,idle_time=2.0):
+    broker = broker_class({})
+    broker.start()
+    cpu_start = time.process_time()
+    time.sleep(idle_time)
+    cpu_used = time.process_time() - cpu_start
+    broker.stop_process()
+    return cpu_used / idle_time * 100
+
+
+def measure_latency(broker_class,number_of_messages):
+    subscriber_queue = Queue()
+    broker = broker_class({"bench":[subscriber_queue]})
+    broker.start()
+    latencies = []
+    for _ in range(number_of_messages):
+        #ping-pong, one message in flight - measures hop latency not throughput
+        broker.message_broker_queue.put(message_(topic="bench",source="bench",data=time.perf_counter_ns()))
+        msg = subscriber_queue.get()
+        latencies.append((time.perf_counter_ns() - msg.data) / 1000)
+        #spread messages in time like real instrument traffic
+        time.sleep(0.0003)
+    broker.stop_process()
+    return latencies
+
+
+if __name__ == "__main__":
+    number_of_messages = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    for broker_class in (polling_broker,blocking_broker):
+        latencies = measure_latency(broker_class,number_of_messages)
+        print(f"{broker_class.__name__}:")
+        print(f"  hop latency median: {statistics.median(latencies):.1f} us")
+        print(f"  hop latency p99:    {statistics.quantiles(latencies,n=100)[98]:.1f} us")
+        print(f"  idle CPU:           {measure_idle_cpu(broker_class):.2f} %")
@@ -0,0 +1,107 @@
+#Throughput of message_broker dispatch: one put per message vs batch drain-and-forward
+#Loops are copied from Src/Backend/backend_classes.py so sample runs without PyQt
+#Usage: python broker_throughput_bench.py [number_of_messages] [number_of_subscribers]
+from multiprocessing import Queue
+from queue import Empty, SimpleQueue
+from threading import Thread
+import sys
+import time
+
+
+class stop_sentinel():
+    pass
+
+
+class message_batch():
+    __slots__ = ("messages",)
+    def __init__(self,messages:list):
+        self.messages = messages
+
+
+class message_():
+    def __init__(self,topic:str=None,source:str=None,data=None,optional_params=None):
+        self.topic = topic
+        self.data = data
+        self.source = source
+        self.optional_params = optional_params
+
+
+class broker(Thread):
+    def __init__(self,topic_que_dict,batch_max_messages=1,batch_max_time_us=0,queue_class=Queue):
+        super().__init__()
+        self.message_broker_queue = queue_class()
+        self.topic_que_dict = topic_que_dict
+        self.batch_max_messages = batch_max_messages
+        self.batch_max_time_us = batch_max_time_us
+
+    def run(self):
+        while True:
+            msg_ = self.message_broker_queue.get()
+            if isinstance(msg_,stop_sentinel):
+                break
+            if self.batch_max_messages > 1:
+                if self.dispatch_batch(msg_):
+                    break
+                continue
+            for subscriber_queue in self.topic_que_dict.get(msg_.topic,[]):
+                subscriber_queue.put(msg_)
+
+    def dispatch_batch(self,first_msg):
+        batch = [first_msg]
+        stop_requested = False
+        deadline = time.perf_counter_ns() + self.batch_max_time_us * 1000
+        while len(batch) < self.batch_max_messages:
+            try:
+                remaining_ns = deadline - time.perf_counter_ns()
+                if remaining_ns > 0:
+                    msg_ = self.message_broker_queue.get(timeout=remaining_ns / 1e9)
+                else:
+                    msg_ = self.message_broker_queue.get_nowait()
+            except Empty:
+                break
+            if isinstance(msg_,stop_sentinel):
+                stop_requested = True
+                break
+            batch.append(msg_)
+        per_subscriber = {}
+        for msg_ in batch:
+            for subscriber_queue in self.topic_que_dict.get(msg_.topic,[]):
+                per_subscriber.setdefault(id(subscriber_queue),[subscriber_queue,[]])[1].append(msg_)
+        for subscriber_queue, messages in per_subscriber.values():
+            subscriber_queue.put(messages[0] if len(messages) == 1 else message_batch(messages))
+        return stop_requested
+
+
+def consume(subscriber_queue,number_of_messages):
+    received = 0
+    while received < number_of_messages:
+        msg = subscriber_queue.get()
+        received += len(msg.messages) if isinstance(msg,message_batch) else 1
+
+
+def run_bench(number_of_messages,number_of_subscribers,batch_max_messages,batch_max_time_us,queue_class):
+    subscriber_queues = [queue_class() for _ in range(number_of_subscribers)]
+    broker_instance = broker({"CAN":subscriber_queues},batch_max_messages,batch_max_time_us,queue_class)
+    consumers = [Thread(target=consume,args=(queue_obj,number_of_messages)) for queue_obj in subscriber_queues]
+    broker_instance.start()
+    for consumer in consumers:
+        consumer.start()
+    start = time.perf_counter()
+    for index in range(number_of_messages):
+        broker_instance.message_broker_queue.put(message_(topic="CAN",source="CAN",data=f"frame {index}"))
+    for consumer in consumers:
+        consumer.join()
+    elapsed = time.perf_counter() - start
+    broker_instance.message_broker_queue.put(stop_sentinel())
+    broker_instance.join()
+    return number_of_messages / elapsed
+
+
+if __name__ == "__main__":
+    number_of_messages = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    number_of_subscribers = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    #multiprocessing.Queue - "process" transport, SimpleQueue - "in_process" transport (Nodes/transport.py)
+    for transport_name, queue_class in (("process",Queue),("in_process",SimpleQueue)):
+        for batch_max_messages, batch_max_time_us in ((1,0),(64,0),(256,500)):
+            rate = run_bench(number_of_messages,number_of_subscribers,batch_max_messages,batch_max_time_us,queue_class)
+            print(f"{transport_name:<10} batch_max_messages={batch_max_messages:<4} batch_max_time_us={batch_max_time_us:<4} -> {rate:,.0f} msgs/s")
@@ -0,0 +1,157 @@
+#Thread per connection (listener + manipulator like abstract_node) vs shared io_reactor
+#Every connection is socketpair with echo instrument on other end, script sends queries and waits for answers
+#Nodes package is mapped without its __init__ so sample runs without PyQt
+#Usage: python io_reactor_bench.py [number_of_connections] [queries_per_connection]
+from pathlib import Path
+from threading import Thread
+import multiprocessing
+import queue
+import resource
+import socket
+import sys
+import threading
+import time
+import types
+
+nodes_package = types.ModuleType("Nodes")
+nodes_package.__path__ = [str(Path(__file__).resolve().parents[3] / "Src" / "Nodes")]
+sys.modules["Nodes"] = nodes_package
+
+from Nodes.reactor import *
+from Nodes.message import message_, stop_sentinel
+from Nodes.node_health import node_health
+
+
+class echo_instrument(Thread):
+    def __init__(self,sock):
+        super().__init__(daemon=True)
+        self.sock = sock
+
+    def run(self):
+        while True:
+            data = self.sock.recv(65536)
+            if not data:
+                break
+            self.sock.sendall(data)
+
+
+class bench_listener():
+    def __init__(self,answers):
+        self.answers = answers
+
+    def publish(self,msg):
+        self.answers.put(msg)
+
+
+class bench_manipulator():
+    def __init__(self,sock):
+        self.socket = sock
+
+    def dispatch(self,msg):
+        self.socket.sendall(msg.data)
+
+    def run_on_idle(self):
+        pass
+
+
+class bench_node():
+    name_of_node = "bench"
+
+    def __init__(self,sock,answers):
+        self.socket = sock
+        self.health = node_health()
+        self.listener_thread = bench_listener(answers)
+        self.manipulator_thread = bench_manipulator(sock)
+        self.own_que = reactor_outbox(queue.SimpleQueue())
+
+    def reactor_fileobj(self):
+        return self.socket
+
+    def reactor_read_into(self,view):
+        received = self.socket.recv_into(view)
+        if not received:
+            raise EOFError
+        return received
+
+    def reactor_write(self,data):
+        return self.socket.send(data)
+
+    def reactor_framer(self):
+        return line_framer()
+
+    def reactor_message(self,frame):
+        return message_(topic="bench",data=frame)
+
+    def reactor_publish(self,msgs):
+        for msg in msgs:
+            self.listener_thread.publish(msg)
+
+
+def threaded_connection(sock,node_queue,answers):
+    framer = line_framer()
+    def listener():
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                break
+            for frame in framer.feed(data):
+                answers.put(message_(topic="bench",data=frame))
+    def manipulator():
+        while True:
+            msg = node_queue.get()
+            if isinstance(msg,stop_sentinel):
+                break
+            sock.sendall(msg.data)
+    threads = [Thread(target=listener,daemon=True),Thread(target=manipulator,daemon=True)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def run(mode,number_of_connections,queries):
+    answers = queue.SimpleQueue()
+    node_queues = []
+    instruments = []
+    for _ in range(number_of_connections):
+        node_side, instrument_side = socket.socketpair()
+        instruments.append(echo_instrument(instrument_side))
+        if mode == "reactor":
+            node_side.setblocking(False)
+            node = bench_node(node_side,answers)
+            connection = reactor_connection(node,get_io_reactor())
+            node.manipulator_thread.socket = connection.writer
+            connection.reactor.add_connection(connection)
+            node_queues.append(node.own_que)
+        else:
+            node_queue = queue.SimpleQueue()
+            threaded_connection(node_side,node_queue,answers)
+            node_queues.append(node_queue)
+    for instrument in instruments:
+        instrument.start()
+    time.sleep(0.2)
+
+    usage_start = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    for _ in range(queries):
+        for node_queue in node_queues:
+            node_queue.put(message_(topic="bench",data=b"MEAS:TEMP?\n"))
+        for _ in node_queues:
+            answers.get()
+    elapsed = time.perf_counter() - start
+    usage_end = resource.getrusage(resource.RUSAGE_SELF)
+
+    switches = (usage_end.ru_nvcsw - usage_start.ru_nvcsw) + (usage_end.ru_nivcsw - usage_start.ru_nivcsw)
+    cpu = (usage_end.ru_utime - usage_start.ru_utime) + (usage_end.ru_stime - usage_start.ru_stime)
+    total = queries * number_of_connections
+    print(f"{mode:8} threads={threading.active_count() - number_of_connections - 1:4} "
+          f"{total / elapsed:9.0f} queries/s  cpu={cpu:6.2f} s  context switches/query={switches / total:6.2f}")
+
+
+if __name__ == "__main__":
+    number_of_connections = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    #each mode in own process, so threads and rusage of other mode are not counted
+    for mode in ("thread","reactor"):
+        process = multiprocessing.Process(target=run,args=(mode,number_of_connections,queries))
+        process.start()
+        process.join()
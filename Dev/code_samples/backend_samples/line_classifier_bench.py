@@ -0,0 +1,64 @@
+#Classification of console lines: regex per line vs line_classifier (one finditer per rule over whole read)
+#Nodes package is mapped without its __init__ so sample runs without PyQt
+#Usage: python line_classifier_bench.py [number_of_lines] [lines_per_read]
+from pathlib import Path
+import re
+import sys
+import time
+import types
+
+nodes_package = types.ModuleType("Nodes")
+nodes_package.__path__ = [str(Path(__file__).resolve().parents[3] / "Src" / "Nodes")]
+sys.modules["Nodes"] = nodes_package
+
+from Nodes.line_classifier import line_classifier
+
+
+rules = [("ack",r"^(OK|ACK)\b"),("error",r"ERROR|FAIL")]
+
+
+def console_lines(number_of_lines):
+    lines = [f"[{i:08d}] dbg: sensor {i % 7} value {i * 3} bus=0x{i:x}" for i in range(number_of_lines)]
+    for i in range(0,number_of_lines,50):
+        lines[i] = f"OK cmd {i}"
+    for i in range(7,number_of_lines,300):
+        lines[i] = f"scp: ERROR code {i}"
+    return lines
+
+
+def classify_per_line(lines):
+    compiled = [(class_name,re.compile(pattern)) for class_name, pattern in rules]
+    classes = []
+    for line in lines:
+        for class_name, pattern in compiled:
+            if pattern.search(line):
+                classes.append(class_name)
+                break
+        else:
+            classes.append("log")
+    return classes
+
+
+def classify_chunks(lines,lines_per_read):
+    classifier = line_classifier(rules)
+    classes = []
+    for start in range(0,len(lines),lines_per_read):
+        classes += classifier.classify(lines[start:start + lines_per_read])
+    return classes
+
+
+def main():
+    number_of_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    lines_per_read = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    lines = console_lines(number_of_lines)
+    results = {}
+    for name, func in (("per line",classify_per_line),("line_classifier",lambda lines: classify_chunks(lines,lines_per_read))):
+        start = time.perf_counter()
+        results[name] = func(lines)
+        elapsed = time.perf_counter() - start
+        print(f"{name:16} {elapsed * 1e9 / number_of_lines:7.0f} ns/line")
+    print("same classes:",results["per line"] == results["line_classifier"])
+
+
+if __name__ == "__main__":
+    main()
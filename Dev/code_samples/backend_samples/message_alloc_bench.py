@@ -0,0 +1,56 @@
+#Per-message allocation and construction cost: old dict-backed message_ vs slotted message_ (Src/Nodes/message.py)
+#Usage: python message_alloc_bench.py [number_of_messages]
+from pathlib import Path
+import importlib.util
+import pickle
+import sys
+import time
+import tracemalloc
+
+#load module file directly - importing Nodes package pulls PyQt and bus libraries
+message_path = Path(__file__).resolve().parents[3] / "Src/Nodes/message.py"
+spec = importlib.util.spec_from_file_location("message",message_path)
+message_module = importlib.util.module_from_spec(spec)
+sys.modules["message"] = message_module
+spec.loader.exec_module(message_module)
+
+
+class legacy_message_():
+    def __init__(self,topic:str=None,source:str=None,data=None,optional_params=None):
+        self.topic = topic
+        self.data = data
+        self.source = source
+        self.optional_params = optional_params
+
+
+#dict-backed message carrying same fields as slotted one
+class legacy_timed_message_():
+    def __init__(self,topic:str=None,source:str=None,data=None,optional_params=None):
+        self.topic = topic
+        self.data = data
+        self.source = source
+        self.optional_params = optional_params
+        self.correlation_id = None
+        self.timestamp_ns = time.monotonic_ns()
+        self.seq = message_module.next_sequence_number(source)
+
+
+def measure(message_class,number_of_messages):
+    tracemalloc.start()
+    kept = [message_class(topic="SCP",source="UART",data="OK",optional_params="SEND_MSG") for _ in range(number_of_messages)]
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    start = time.perf_counter()
+    for _ in range(number_of_messages):
+        message_class(topic="SCP",source="UART",data="OK",optional_params="SEND_MSG")
+    elapsed = time.perf_counter() - start
+    pickled_size = len(pickle.dumps(message_class(topic="SCP",source="UART",data="OK",optional_params="SEND_MSG")))
+    return allocated / number_of_messages, elapsed / number_of_messages * 1e9, pickled_size
+
+
+if __name__ == "__main__":
+    number_of_messages = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    for message_class in (legacy_message_,legacy_timed_message_,message_module.message_):
+        bytes_per_message, ns_per_message, pickled_size = measure(message_class,number_of_messages)
+        print(f"{message_class.__module__}.{message_class.__name__}: {bytes_per_message:.0f} B/msg, {ns_per_message:.0f} ns/msg, pickled {pickled_size} B")
@@ -0,0 +1,85 @@
+#Wall time of instrument setup sequence (many small SCPI writes + query) with and without write coalescing
+#Instrument is socket server which handles every received line in line_cost_ms (parse, I/O turnaround)
+#Nodes package is mapped without its __init__ so sample runs without PyQt
+#Usage: python scpi_coalescing_bench.py [number_of_writes] [line_cost_ms]
+from pathlib import Path
+from queue import SimpleQueue, Empty
+from threading import Thread
+import socket
+import sys
+import time
+import types
+
+nodes_package = types.ModuleType("Nodes")
+nodes_package.__path__ = [str(Path(__file__).resolve().parents[3] / "Src" / "Nodes")]
+sys.modules["Nodes"] = nodes_package
+
+from Nodes.scpi_coalescing import scpi_coalescer
+
+
+class scpi_instrument(Thread):
+    def __init__(self,sock,line_cost_s):
+        super().__init__(daemon=True)
+        self.sock = sock
+        self.line_cost_s = line_cost_s
+        self.commands = 0
+
+    def run(self):
+        buffer = b""
+        while True:
+            data = self.sock.recv(65536)
+            if not data:
+                break
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                time.sleep(self.line_cost_s)
+                self.commands += line.count(b";") + 1
+                if line.endswith(b"?"):
+                    self.sock.sendall(b"LP,IQGIGIF,0\n")
+
+
+#manipulator loop of abstract_node_manipulator_thread with idle timeout
+def manipulator(node_queue,sock,coalescer):
+    send_text = lambda text: sock.sendall(text.encode())
+    while True:
+        try:
+            timeout = coalescer.timeout() if coalescer else None
+            msg = node_queue.get() if timeout is None else node_queue.get(timeout=timeout)
+        except Empty:
+            coalescer.flush()
+            continue
+        if msg is None:
+            break
+        data, is_query = msg
+        if coalescer is None:
+            send_text(data)
+        else:
+            coalescer.write(data,is_query,send_text)
+
+
+def run(label,number_of_writes,line_cost_s,coalescer):
+    node_side, instrument_side = socket.socketpair()
+    instrument = scpi_instrument(instrument_side,line_cost_s)
+    instrument.start()
+    node_queue = SimpleQueue()
+    Thread(target=manipulator,args=(node_queue,node_side,coalescer),daemon=True).start()
+    start = time.perf_counter()
+    #ResetPlusConfigureRfSwitch style sequence: writes, then query which waits for all of them
+    node_queue.put(("*RST;*CLS;*WAI\n",False))
+    for index in range(number_of_writes):
+        node_queue.put((f"VSA1;RFC:USE \"RF{index % 4}A\",RF{index % 4}A\n",False))
+    node_queue.put(("*IDN?\n",True))
+    node_side.recv(100)
+    elapsed = time.perf_counter() - start
+    node_queue.put(None)
+    lines = f"{coalescer.lines_written} lines" if coalescer else f"{number_of_writes + 2} lines"
+    print(f"{label:12} {elapsed * 1000:8.1f} ms  {lines}")
+    node_side.close()
+
+
+if __name__ == "__main__":
+    number_of_writes = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    line_cost_s = (float(sys.argv[2]) if len(sys.argv) > 2 else 1) / 1000
+    run("one by one",number_of_writes,line_cost_s,None)
+    run("coalesced",number_of_writes,line_cost_s,scpi_coalescer(512,0.002))
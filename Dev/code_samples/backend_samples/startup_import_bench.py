@@ -0,0 +1,57 @@
+#Cold import time of Nodes package and of bus libraries which are imported only by node types that use them
+#Every measurement runs in fresh interpreter (python -X importtime), median of repeats is printed
+#Usage: python startup_import_bench.py [repeats]
+from pathlib import Path
+import statistics
+import subprocess
+import sys
+
+src_path = Path(__file__).resolve().parents[3] / "Src"
+
+bus_libraries = {
+    "can": "CAN",
+    "pyvisa": "GPIB, LAN",
+    "serial": "UART",
+    "adb_shell.adb_device": "ADB",
+    "http.client": "ETH_http",
+    "ssl": "ETH_http",
+    "debugpy": "none (debugging only)",
+}
+
+
+def cold_import_us(statement:str):
+    """Total import time in us of modules imported by statement, None when import fails"""
+    result = subprocess.run([sys.executable,"-X","importtime","-c",statement],cwd=src_path,capture_output=True,text=True)
+    if result.returncode != 0:
+        return None
+    total_us = 0
+    for line in result.stderr.splitlines():
+        #import time: self [us] | cumulative | imported package, top level imports have no indent
+        if line.startswith("import time:") and "|" in line:
+            fields = line.split("|")
+            if fields[2].startswith(" ") and not fields[2].startswith("  "):
+                try:
+                    total_us += int(fields[1])
+                except ValueError:
+                    pass
+    return total_us
+
+
+def median_import_us(statement:str,repeats:int):
+    results = [cold_import_us(statement) for _ in range(repeats)]
+    if None in results:
+        return None
+    return statistics.median(results)
+
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    for statement, label in (("import Nodes","Nodes package (node types are lazy)"),
+                             ("from Nodes.node_types import node_class_for_type; node_class_for_type('ETH_socket')","Nodes + ETH_socket node")):
+        import_us = median_import_us(statement,repeats)
+        print(f"{label:45} {'not importable here' if import_us is None else f'{import_us / 1000:8.1f} ms'}")
+    print()
+    print("Bus libraries, before registry all were imported by Nodes.priv_dependencies:")
+    for library, node_types in bus_libraries.items():
+        import_us = median_import_us(f"import {library}",repeats)
+        print(f"  {library:22} {'not installed' if import_us is None else f'{import_us / 1000:8.1f} ms':>14}   used by: {node_types}")
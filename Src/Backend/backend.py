@@ -1,4 +1,5 @@
 from Backend.backend_classes import *
+from Backend.trace_recorder import *
 from Nodes import *
 from configparser import ConfigParser
 
@@ -20,6 +21,7 @@ class Backend(QObject):
         self.user_script = None
         self.nodes_data = []
         self.nodes_list = []
+        self.node_supervisor = None
         self.topic_que_dict_class = topic_que_dict_class()
         ####################
        # self.init_backend()
@@ -36,17 +38,75 @@ class Backend(QObject):
         """Init of main backned components"""
         #self.signal_center = signal_center()
         self.init_message_broker()
+        self.init_metrics()
+        self.init_trace_recorder()
         pass
 
     def init_message_broker(self):
         self.topic_que_dict_class.clear_sub()
-        self.message_broker = message_broker(self.QThread_displayer.displayer_queue,self.topic_que_dict_class)
+        broker_config = self.load_app_config_section("Broker")
+        self.message_broker = message_broker(self.topic_que_dict_class,
+                                             batch_max_messages=int(broker_config.get("batch_max_messages",1)),
+                                             batch_max_time_us=int(broker_config.get("batch_max_time_us",0)),
+                                             transport_type=self.broker_transport_type())
         self.data_model.broker_queue_pointer.clear()
         self.data_model.broker_queue_pointer.append(self.message_broker.message_broker_queue)
         self.message_broker.start()
 
 
 
+    def init_metrics(self):
+        """[Metrics] section of app_cfg.ini: enabled, snapshot_file, snapshot_period_s"""
+        metrics_config = self.load_app_config_section("Metrics")
+        broker_metrics_instance.enabled = metrics_config.get("enabled","1") == "1"
+        self.metrics_writer = None
+        snapshot_file = metrics_config.get("snapshot_file")
+        if broker_metrics_instance.enabled and snapshot_file:
+            self.metrics_writer = metrics_snapshot_writer(Path(__file__).resolve().parent.parent / snapshot_file,
+                                                          float(metrics_config.get("snapshot_period_s",10)),
+                                                          self.get_metrics_snapshot)
+            self.metrics_writer.start()
+
+    def get_metrics_snapshot(self,previous:dict=None):
+        snapshot = broker_metrics_instance.snapshot(previous,self.topic_que_dict_class.subscriber_labels())
+        snapshot["drops"] = self.topic_que_dict_class.drop_counters()
+        return snapshot
+
+    def stop_metrics(self):
+        if getattr(self,"metrics_writer",None) is not None:
+            self.metrics_writer.stop_process()
+            self.metrics_writer = None
+
+    def init_trace_recorder(self):
+        """[Trace] section of app_cfg.ini, see Backend/trace_recorder.py"""
+        try:
+            self.trace_recorder = create_trace_recorder(self.load_app_config_section("Trace"),self.topic_que_dict_class,self.nodes_data)
+        except Exception as e:
+            self.trace_recorder = None
+            print(f"Error during init of trace recorder: {e}")
+        if self.trace_recorder is not None:
+            self.trace_recorder.start()
+
+    def stop_trace_recorder(self):
+        """Writes rest of trace and its index, trace is readable also without it"""
+        if getattr(self,"trace_recorder",None) is not None:
+            self.trace_recorder.stop_process()
+            self.trace_recorder = None
+
+    def shutdown(self):
+        """Application exit (QApplication.aboutToQuit), last trace chunk, trace index and metrics snapshot are written"""
+        self.stop_trace_recorder()
+        self.stop_metrics()
+
+    def broker_transport_type(self):
+        """Broker queue has to be process-safe only when any node runs in other process"""
+        for node_data in self.nodes_data:
+            if node_transport_type(node_data) == "process":
+                return "process"
+        return "in_process"
+
+
+
     #User script start/stop
     #########################################
     def init_script(self):
@@ -66,6 +126,16 @@ class Backend(QObject):
     def stop_user_script(self):
         self.user_script.stop_process()
 
+    def stop_message_broker(self):
+        self.message_broker.stop_process()
+
+    def get_drop_counters(self):
+        return self.topic_que_dict_class.drop_counters()
+
+    def get_nodes_health(self):
+        """node name -> health dict (state, consecutive/total errors, last error)"""
+        return {node_name:health.as_dict() for node_name, health in list(node_health_registry.items())}
+
 
         
 
@@ -75,6 +145,15 @@ class Backend(QObject):
     ##########################################
 
 
+    def load_app_config_section(self,section:str):
+        """Optional sections of app_cfg.ini, empty dict if section is missing"""
+        app_cfg_path = Path(__file__).resolve().parent.parent / "app_cfg.ini"
+        config_object = ConfigParser()
+        config_object.read_file(open(app_cfg_path,"r"))
+        if config_object.has_section(section):
+            return dict(config_object.items(section))
+        return {}
+
     def load_nodes_config(self):
         try:
             app_cfg_path = Path(__file__).resolve().parent.parent / "app_cfg.ini"
@@ -101,37 +180,53 @@ class Backend(QObject):
 
     def init_nodes(self):
         self.nodes_list = []
-        try:
-            for node_data in self.nodes_data:
-                match node_data["node_type"]:
-                    case "CAN":
-                        new_node = Can_node_thread(self.message_broker.message_broker_queue,node_data)
-                    case "UART":
-                        new_node = UART_node_thread(self.message_broker.message_broker_queue,node_data)
-                    case "ETH_socket":
-                        new_node = Eth_socket_node_thread(self.message_broker.message_broker_queue,node_data)
-                    case "ETH_http":
-                        new_node = Eth_http_node_thread(self.message_broker.message_broker_queue,node_data)
-                    case "GPIB":
-                        new_node = gpib_node_thread(self.message_broker.message_broker_queue,node_data)
-                    case "ADB":
-                        new_node = ADB_node_thread(self.message_broker.message_broker_queue,node_data)
-                    case _:
-                        new_node = None
-                
+        for node_data in self.nodes_data:
+            #one node with missing bus library does not stop the others
+            try:
+                new_node = create_node(self.message_broker.message_broker_queue,node_data)
+
                 if new_node != None:
                     self.topic_que_dict_class.add_sub({(new_node.name_of_node + "_Tx"):new_node.own_que})
                     self.nodes_list.append(new_node)
 
-        except Exception as e:
-            print(f"Error during init_of_nodes: {e}")
+            except Exception as e:
+                print(f"Error during init_of_nodes ({node_data.get('node_name')}): {e}")
 
     def start_nodes(self):
-        pass
+        self.node_supervisor = node_supervisor()
+        for node in self.nodes_list:
+            node.start_node()
+            self.node_supervisor.add_node(node)
+        self.node_supervisor.start()
 
     def stop_nodes(self):
-        for node in self.nodes_obj_list:
-            node.stop_process()
+        if self.node_supervisor is not None:
+            self.node_supervisor.stop_process()
+            self.node_supervisor.wait()
+        for node in self.nodes_list:
+            node.stop_node()
+
+    def restart_node(self,node_name:str):
+        """Close connection of node and initialize it again, eg. after instrument reboot"""
+        for node in self.nodes_list:
+            if node.name_of_node == node_name:
+                return node.restart_node()
+        return False
+
+    def get_nodes_state(self):
+        """node name -> lifecycle state (running, reconnecting, failed...)"""
+        return {node.name_of_node:node.state for node in self.nodes_list}
+
+    def get_can_stats(self,previous:dict=None):
+        """CAN node name -> bus statistics (Nodes/CAN_stats.py), previous = earlier result for bus load between calls"""
+        previous = previous or {}
+        stats = {}
+        for node in self.nodes_list:
+            if hasattr(node,"bus_stats"):
+                snapshot = node.bus_stats(previous.get(node.name_of_node))
+                if snapshot is not None:
+                    stats[node.name_of_node] = snapshot
+        return stats
 
 
         
@@ -2,39 +2,97 @@ from GUI.panels import *
 
 
 class message_broker(QThread):
-    def __init__(self,topic_que_dict_class): 
+    def __init__(self,topic_que_dict_class,batch_max_messages:int=1,batch_max_time_us:int=0,transport_type:str="in_process"): 
         super().__init__()
-        self.control_flag = [True]
-        self.message_broker_queue = Queue()
+        #process transport only if some node puts messages from other process
+        self.message_broker_queue = create_queue(transport_type)
+        #batch_max_messages > 1 -> drain up to N messages (or for T us) per wake-up and send one batch per subscriber
+        self.batch_max_messages = batch_max_messages
+        self.batch_max_time_us = batch_max_time_us
 
 
         self.topic_que_dict_class = topic_que_dict_class
+        self.metrics = broker_metrics_instance
     
     def run(self):
         #debugpy.debug_this_thread()
-        while self.control_flag[0]:
+        #Blocking get - thread sleeps until message arrives, stop_process wakes it with sentinel
+        while True:
             try:
-                if self.message_broker_queue.empty():
-                    time.sleep(0.001)
-                else:
-                    msg_ = self.message_broker_queue.get()
-                    try: 
-                        if self.topic_que_dict_class.topic_que_dict.get(msg_.topic):
-                            for subscriber_queue in self.topic_que_dict_class.topic_que_dict[msg_.topic]:
-                                subscriber_queue.put(msg_)
-
-
-
-                    except Exception as e:
-                        print(f"Msg broker, sending error: {e}")
+                msg_ = self.message_broker_queue.get()
+                if isinstance(msg_,stop_sentinel):
+                    break
+                if self.batch_max_messages > 1:
+                    if self.dispatch_batch(msg_):
+                        break
+                    continue
+                try: 
+                    self.metrics.count_message(msg_)
+                    routes = self.topic_que_dict_class.get_routes(msg_.topic)
+                    if type(msg_.data) is payload_handle:
+                        #one reference per subscriber
+                        msg_.data.retain(len(routes) - 1)
+                    for subscriber_queue in routes:
+                        subscriber_queue.put(msg_)
+                        self.metrics.record_queue_depth(subscriber_queue)
+                except Exception as e:
+                    print(f"Msg broker, sending error: {e}")
             except Exception as e:
                 print(f"Msg broker error: {e}")
 
-    def stop_process(self):
-        self.control_flag[0] = False
-        self.quit()
-        self.terminate()
+    def drain_batch(self,first_msg):
+        """Returns list of messages and flag if stop sentinel was found"""
+        batch = [first_msg]
+        deadline = time.perf_counter_ns() + self.batch_max_time_us * 1000
+        while len(batch) < self.batch_max_messages:
+            try:
+                remaining_ns = deadline - time.perf_counter_ns()
+                if remaining_ns > 0:
+                    msg_ = self.message_broker_queue.get(timeout=remaining_ns / 1e9)
+                else:
+                    msg_ = self.message_broker_queue.get_nowait()
+            except Empty:
+                break
+            if isinstance(msg_,stop_sentinel):
+                return batch, True
+            batch.append(msg_)
+        return batch, False
+
+    def dispatch_batch(self,first_msg):
+        batch, stop_requested = self.drain_batch(first_msg)
+        #id(queue) -> [queue, messages] - one put per subscriber per wake-up
+        per_subscriber = {}
+        for msg_ in batch:
+            try:
+                self.metrics.count_message(msg_)
+                routes = self.topic_que_dict_class.get_routes(msg_.topic)
+                if type(msg_.data) is payload_handle:
+                    msg_.data.retain(len(routes) - 1)
+                for subscriber_queue in routes:
+                    entry = per_subscriber.get(id(subscriber_queue))
+                    if entry is None:
+                        per_subscriber[id(subscriber_queue)] = [subscriber_queue,[msg_]]
+                    else:
+                        entry[1].append(msg_)
+            except Exception as e:
+                print(f"Msg broker, routing error: {e}")
+        for subscriber_queue, messages in per_subscriber.values():
+            try:
+                if len(messages) == 1:
+                    subscriber_queue.put(messages[0])
+                else:
+                    subscriber_queue.put(message_batch(messages))
+                self.metrics.record_queue_depth(subscriber_queue)
+            except Exception as e:
+                print(f"Msg broker, sending error: {e}")
+        return stop_requested
 
+    def stop_process(self,timeout_ms=2000):
+        #Messages queued before sentinel are still dispatched
+        self.message_broker_queue.put(stop_sentinel())
+        self.quit()
+        if not self.wait(timeout_ms):
+            print("Msg broker: dispatch loop did not stop in time")
 
 
 
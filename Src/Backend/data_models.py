@@ -14,6 +14,8 @@ import time
 from pathlib import Path
 import json
 import sys
+import re
+from threading import Lock
 
 #our libraries
 from Nodes import *
@@ -225,34 +227,137 @@ class data_models():
     
 
 
+#Routing
+######################################################################################
+def is_topic_pattern(topic:str):
+    return any(char in topic for char in "*?#")
+
+
+def compile_topic_pattern(pattern:str):
+    """
+    '#'      - every topic (loggers, traces)
+    'SCP/#'  - SCP and all of its sub-topics
+    '*', '?' - any string / any single character, eg. 'SCP*', '*_Tx'
+    """
+    if pattern == "#":
+        return re.compile(r".*",re.DOTALL)
+    suffix = ""
+    if pattern.endswith("/#"):
+        pattern = pattern[:-2]
+        suffix = r"(?:/.*)?"
+    regex = "".join(".*" if char == "*" else "." if char == "?" else re.escape(char) for char in pattern)
+    return re.compile(regex + suffix + r"\Z",re.DOTALL)
+
+
+class route_snapshot():
+    """Immutable view of subscriptions used by message broker, replaced as whole on every change"""
+    max_cached_routes = 4096
+
+    def __init__(self,exact_routes:dict,pattern_routes:tuple):
+        self.exact_routes = exact_routes
+        self.pattern_routes = pattern_routes
+        self.route_cache = {}
+        for topic in exact_routes:
+            self.resolve(topic)
+
+    def resolve(self,topic:str):
+        queues = list(self.exact_routes.get(topic,()))
+        for compiled_pattern, pattern_queues in self.pattern_routes:
+            if compiled_pattern.match(topic):
+                for queue_obj in pattern_queues:
+                    if not any(queue_obj is added for added in queues):
+                        queues.append(queue_obj)
+        routes = tuple(queues)
+        if len(self.route_cache) >= self.max_cached_routes:
+            self.route_cache.clear()
+        self.route_cache[topic] = routes
+        return routes
+
+
 class topic_que_dict_class():
+    """
+    Topic -> subscriber queues routing table.
+    add_sub/del_sub rebuild routes under lock and swap in new snapshot (copy-on-write),
+    so get_routes called from broker never takes lock and never sees half updated table.
+    """
     def __init__(self):
         self.topic_que_dict = {}
+        self.pattern_que_dict = {}
+        self.write_lock = Lock()
+        self.routes_snapshot = route_snapshot({},())
+
+
+    def get_routes(self,topic:str):
+        snapshot = self.routes_snapshot
+        routes = snapshot.route_cache.get(topic)
+        if routes is None:
+            routes = snapshot.resolve(topic)
+        return routes
 
                 
     def add_sub(self,topic_queue_dict:dict):
         topic = list(topic_queue_dict.keys())[0]
         queue_obj = list(topic_queue_dict.values())[0]
-        if topic in self.topic_que_dict:
-            if queue_obj in self.topic_que_dict[topic]:
-                pass
+        with self.write_lock:
+            subs_dict = self.pattern_que_dict if is_topic_pattern(topic) else self.topic_que_dict
+            if topic in subs_dict:
+                if queue_obj in subs_dict[topic]:
+                    pass
+                else:
+                    subs_dict[topic].append(queue_obj)
             else:
-                self.topic_que_dict[topic].append(queue_obj)
-        else:
-            self.topic_que_dict[topic] = [queue_obj]
+                subs_dict[topic] = [queue_obj]
+            self.rebuild_routes()
 
 
     def del_sub(self,topic_queue_dict:dict):
         topic = list(topic_queue_dict.keys())[0]
         queue_obj = list(topic_queue_dict.values())[0]
-
-        if topic in self.topic_que_dict:
-            if queue_obj in self.topic_que_dict[topic]:
-                self.topic_que_dict[topic].remove(queue_obj)
+        with self.write_lock:
+            subs_dict = self.pattern_que_dict if is_topic_pattern(topic) else self.topic_que_dict
+            if topic in subs_dict:
+                if queue_obj in subs_dict[topic]:
+                    subs_dict[topic].remove(queue_obj)
+                if not subs_dict[topic]:
+                    subs_dict.pop(topic)
+            self.rebuild_routes()
 
     def clear_sub(self):
-        self.topic_que_dict.clear()
-
-
-
-
+        with self.write_lock:
+            self.topic_que_dict.clear()
+            self.pattern_que_dict.clear()
+            self.rebuild_routes()
+
+    def drop_counters(self):
+        """topic -> number of messages dropped by bounded subscriber queues"""
+        counters = defaultdict(int)
+        snapshot = self.routes_snapshot
+        subscriber_queues = {}
+        for queues in snapshot.exact_routes.values():
+            for queue_obj in queues:
+                subscriber_queues[id(queue_obj)] = queue_obj
+        for _, queues in snapshot.pattern_routes:
+            for queue_obj in queues:
+                subscriber_queues[id(queue_obj)] = queue_obj
+        for queue_obj in subscriber_queues.values():
+            for topic, dropped in dict(getattr(queue_obj,"dropped_per_topic",{})).items():
+                counters[topic] += dropped
+        return dict(counters)
+
+    def subscriber_labels(self):
+        """id(queue) -> subscribed topics, names subscriber queues in metrics"""
+        labels = defaultdict(list)
+        snapshot = self.routes_snapshot
+        for topic, queues in snapshot.exact_routes.items():
+            for queue_obj in queues:
+                labels[id(queue_obj)].append(topic)
+        for pattern, queues in self.pattern_que_dict.copy().items():
+            for queue_obj in queues:
+                labels[id(queue_obj)].append(pattern)
+        return {queue_id:",".join(topics) for queue_id, topics in labels.items()}
+
+    #Call with write_lock taken
+    def rebuild_routes(self):
+        exact_routes = {topic:tuple(queues) for topic,queues in self.topic_que_dict.items()}
+        pattern_routes = tuple((compile_topic_pattern(pattern),tuple(queues)) for pattern,queues in self.pattern_que_dict.items())
+        self.routes_snapshot = route_snapshot(exact_routes,pattern_routes)
@@ -0,0 +1,100 @@
+from Nodes import *
+from Nodes.trace_log import *
+from threading import Thread
+from pathlib import Path
+import queue
+import time
+
+
+# ****************************************************************************
+#
+# Recorder of bus traffic into binary trace log (Nodes/trace_log.py).
+# Recorder is one more subscriber of message_broker, by default of topics of
+# CAN, UART and ETH_socket nodes and their sub-topics.
+#
+# app_cfg.ini:
+#   [Trace]
+#   enabled = 0 | 1
+#   directory = traces                  - relative to Src, file name is trace_<date>_<time>.ptrc
+#   topics =                            - comma separated topics/patterns, empty = topics of bus nodes
+#   chunk_kb = 256
+#   chunk_max_age_s = 1                 - open chunk is written at least this often
+#   queue_size = 65536                  - messages waiting for disk, 0 = unbounded
+#   overflow_policy = drop_oldest       - drop_oldest | drop_newest, block would stop message broker
+#
+# ****************************************************************************
+
+
+trace_node_types = ("CAN","UART","ETH_socket")
+
+
+class trace_recorder(Thread):
+    def __init__(self,path,topic_que_dict_class,topics:list,chunk_bytes:int=256 * 1024,chunk_max_age_s:float=1.0,
+                 queue_size:int=65536,overflow_policy:str="drop_oldest"):
+        super().__init__(daemon=True,name="trace_recorder")
+        self.path = path
+        self.topic_que_dict_class = topic_que_dict_class
+        self.topics = topics
+        self.chunk_max_age_s = chunk_max_age_s
+        self.writer = trace_writer(path,chunk_bytes,chunk_max_age_s)
+        check_broker_fed_queue(queue_size,overflow_policy,"trace_recorder")
+        self.queue = create_queue("in_process",queue_size,overflow_policy,label="trace_recorder")
+        for topic in self.topics:
+            self.topic_que_dict_class.add_sub({topic:self.queue})
+
+    def run(self):
+        while True:
+            try:
+                msg = self.queue.get(timeout=self.chunk_max_age_s)
+            except queue.Empty:
+                self.writer.flush_if_old()
+                continue
+            if isinstance(msg,stop_sentinel):
+                break
+            for msg in (msg.messages if isinstance(msg,message_batch) else (msg,)):
+                try:
+                    self.record(msg)
+                except Exception as e:
+                    print(f"Trace recorder: {type(e).__name__}: {e}")
+            self.writer.flush_if_old()
+        self.writer.close()
+
+    def record(self,msg):
+        if type(msg.data) is payload_handle:
+            #shared memory block is not part of message bytes, payload is copied into trace
+            handle = msg.data
+            msg = message_(topic=msg.topic,source=msg.source,data=handle.tobytes(),optional_params=msg.optional_params,
+                           correlation_id=msg.correlation_id,timestamp_ns=msg.timestamp_ns,seq=msg.seq)
+            handle.release()
+        self.writer.write(msg)
+
+    def stop_process(self,timeout_s:float=5):
+        for topic in self.topics:
+            self.topic_que_dict_class.del_sub({topic:self.queue})
+        #messages already queued are still written
+        self.queue.put(stop_sentinel())
+        self.join(timeout_s)
+
+
+
+def trace_topics(nodes_data:list):
+    """Topics of bus nodes and their sub-topics (eg. classified UART lines, DBC signals)"""
+    topics = []
+    for node_data in nodes_data:
+        if node_data.get("node_type") in trace_node_types and "node_name" in node_data:
+            topics += [node_data["node_name"],node_data["node_name"] + "/#"]
+    return topics
+
+
+def create_trace_recorder(trace_config:dict,topic_que_dict_class,nodes_data:list):
+    if trace_config.get("enabled","0") != "1":
+        return None
+    directory = Path(__file__).resolve().parent.parent / trace_config.get("directory","traces")
+    directory.mkdir(parents=True,exist_ok=True)
+    path = directory / time.strftime("trace_%Y%m%d_%H%M%S.ptrc")
+    topics = [topic.strip() for topic in trace_config.get("topics","").split(",") if topic.strip()] or trace_topics(nodes_data)
+    return trace_recorder(path,topic_que_dict_class,topics,
+                          int(trace_config.get("chunk_kb",256)) * 1024,
+                          float(trace_config.get("chunk_max_age_s",1)),
+                          int(trace_config.get("queue_size",65536)),
+                          trace_config.get("overflow_policy","drop_oldest"))
@@ -1,4 +1,5 @@
 from Nodes.nodes_abstract import *
+from adb_shell.adb_device import AdbDeviceTcp, AdbDeviceUsb
 
 class ADB_node_thread(abstract_node):
     def __init__(self,message_broker_queue:Queue,config:dict):
@@ -39,7 +40,7 @@ class ADB_node_listener_thread(abstract_node_listener_thread):
         msg_from_bus = self.adbBus.read()
         # msg_from_bus = msg_from_bus.decode('utf-8').strip()
         msg_to_send = message_(topic=self.name,source="ADB",data=msg_from_bus)
-        self.message_broker_queue.put(msg_to_send)
+        self.publish(msg_to_send)
 
 class ADB_node_manipulator_thread(abstract_node_manipulator_thread):
     def __init__(self,node_queue: Queue,adbBus): #*args
@@ -0,0 +1,218 @@
+from Nodes.CAN_frames import can_frame, CAN_FLAG_EXTENDED
+from Nodes.metrics import latency_histogram
+from threading import Thread, Event, Lock
+import time
+
+
+# ****************************************************************************
+#
+# Cyclic transmit of CAN frames (keep-alive, NM messages of ECUs at 10/20/100 ms)
+# run by CAN node itself, user script only starts, updates and stops them.
+#
+# Every cyclic frame has absolute deadline, next deadline = previous deadline +
+# period, so late wake-up does not move following transmissions (no drift).
+# Cycles missed by more than one period are skipped and counted.
+#
+# Backend with own periodic send (python-can bus overriding _send_periodic_internal,
+# eg. SocketCAN broadcast manager, IXXAT) transmits frame in driver/hardware,
+# otherwise frame is sent by scheduler thread of node.
+#
+# Commands (optional_params of message to '<node>_Tx', data is dict), answer is
+# published on node topic with correlation_id of command (send_querry):
+#   CYCLIC_START   {"arbitration_id": 0x123, "data": "01 02" | b"..", "period_ms": 10, "is_extended_id": False}
+#   CYCLIC_UPDATE  {"arbitration_id": 0x123, "data": ..., "period_ms": 20}   - data and/or period
+#   CYCLIC_STOP    {"arbitration_id": 0x123} | None (all)
+#   CYCLIC_STATS   None -> {"0x123": {"mode", "period_ms", "sent", "missed", "errors", "last_error", "lateness_us": {...}}}
+#                  native mode: timing is done by interface, "timing": "interface" and no sent/missed/lateness
+#
+# CYCLIC_UPDATE of period keeps phase in software mode, next frame is sent
+# one new period after last deadline.
+#
+# Failed send (bus off, full TX buffer) is counted in errors of entry and in
+# health of node, deadline moves on and scheduler keeps running.
+#
+# Node config keys (CAN):
+#   cyclic_mode = auto | software | native
+#   cyclic_spin_us = 0              - software: last part of wait is polled (OS sleep granularity), poll yields GIL
+#
+# ****************************************************************************
+
+
+class cyclic_entry():
+    def __init__(self,frame:can_frame,period_s:float):
+        self.frame = frame
+        self.period_s = period_s
+        self.deadline = time.perf_counter()
+        #python-can CyclicSendTask in native mode
+        self.task = None
+        self.sent = 0
+        self.missed = 0
+        self.errors = 0
+        self.last_error = None
+        #ns between deadline and send
+        self.lateness = latency_histogram()
+
+    def stats(self):
+        if self.task is not None:
+            #interface owns timing, nothing is measured by node
+            return {"mode":"native","period_ms":self.period_s * 1000,"timing":"interface"}
+        return {"mode":"software","period_ms":self.period_s * 1000,
+                "sent":self.sent,"missed":self.missed,"errors":self.errors,"last_error":self.last_error,
+                "lateness_us":self.lateness.summary_us()}
+
+
+
+class cyclic_scheduler(Thread):
+    def __init__(self,bus,send_lock:Lock,mode:str="auto",spin_s:float=0.0):
+        super().__init__(daemon=True,name="can_cyclic")
+        self.bus = bus
+        #bus is shared with manipulator one-shot sends
+        self.send_lock = send_lock
+        self.mode = mode
+        self.spin_s = spin_s
+        #arbitration id -> cyclic_entry
+        self.entries = {}
+        self.lock = Lock()
+        self.wakeup = Event()
+        self.running = True
+        #node_health of CAN node, set by node
+        self.health = None
+
+    def native_supported(self):
+        if self.mode == "software":
+            return False
+        try:
+            from can import BusABC
+        except ImportError:
+            return False
+        native = type(self.bus)._send_periodic_internal is not BusABC._send_periodic_internal
+        if self.mode == "native" and not native:
+            raise ValueError(f"CAN interface {type(self.bus).__name__} has no native periodic send")
+        return native
+
+    def start_cyclic(self,frame:can_frame,period_s:float):
+        if period_s <= 0:
+            raise ValueError("period_ms has to be positive")
+        if not self.running:
+            #thread can not be started again after stop_process
+            raise RuntimeError("CAN node is stopped")
+        self.stop_cyclic(frame.arbitration_id)
+        entry = cyclic_entry(frame,period_s)
+        if self.native_supported():
+            entry.task = self.bus.send_periodic(frame.to_can_message(),period_s)
+        with self.lock:
+            self.entries[frame.arbitration_id] = entry
+        if entry.task is None:
+            if self.ident is None:
+                self.start()
+            elif not self.is_alive():
+                raise RuntimeError("Cyclic scheduler thread ended")
+            self.wakeup.set()
+
+    def update_cyclic(self,arbitration_id:int,data:bytes=None,period_s:float=None):
+        with self.lock:
+            entry = self.entries.get(arbitration_id)
+        if entry is None:
+            raise KeyError(f"No cyclic message with id 0x{arbitration_id:x}")
+        if period_s is not None and period_s != entry.period_s:
+            if period_s <= 0:
+                raise ValueError("period_ms has to be positive")
+            if entry.task is None:
+                with self.lock:
+                    #phase continues from last deadline instead of restarting now
+                    entry.deadline = max(entry.deadline + period_s - entry.period_s,time.perf_counter())
+                    entry.period_s = period_s
+                self.wakeup.set()
+            else:
+                #native task can not change period, new one is started
+                frame = entry.frame if data is None else can_frame(arbitration_id,data,entry.frame.flags)
+                self.start_cyclic(frame,period_s)
+                return
+        if data is None:
+            return
+        #frame object is replaced, scheduler thread sends old or new frame, never mixed one
+        entry.frame = can_frame(arbitration_id,data,entry.frame.flags)
+        if entry.task is not None:
+            if hasattr(entry.task,"modify_data"):
+                entry.task.modify_data(entry.frame.to_can_message())
+            else:
+                self.start_cyclic(entry.frame,entry.period_s)
+
+    def stop_cyclic(self,arbitration_id:int=None):
+        with self.lock:
+            if arbitration_id is None:
+                stopped = list(self.entries.values())
+                self.entries.clear()
+            else:
+                stopped = [self.entries.pop(arbitration_id)] if arbitration_id in self.entries else []
+        for entry in stopped:
+            if entry.task is not None:
+                entry.task.stop()
+        self.wakeup.set()
+
+    def stats(self):
+        with self.lock:
+            return {f"0x{arbitration_id:x}":entry.stats() for arbitration_id, entry in self.entries.items()}
+
+    def stop_process(self):
+        self.running = False
+        self.stop_cyclic()
+
+    def run(self):
+        while self.running:
+            with self.lock:
+                software_entries = [entry for entry in self.entries.values() if entry.task is None]
+            if not software_entries:
+                self.wakeup.wait()
+                self.wakeup.clear()
+                continue
+            entry = min(software_entries,key=lambda entry: entry.deadline)
+            remaining = entry.deadline - time.perf_counter()
+            if remaining > self.spin_s:
+                #start, update or stop of other entry ends the wait
+                if self.wakeup.wait(remaining - self.spin_s):
+                    self.wakeup.clear()
+                    continue
+            while time.perf_counter() < entry.deadline:
+                #sleep(0) releases GIL, listener and broker threads run during poll
+                time.sleep(0)
+            with self.lock:
+                stopped = self.entries.get(entry.frame.arbitration_id) is not entry
+            if not stopped:
+                self.send_due(entry)
+
+    def send_due(self,entry:cyclic_entry):
+        now = time.perf_counter()
+        entry.lateness.record(int((now - entry.deadline) * 1e9))
+        try:
+            with self.send_lock:
+                self.bus.send(entry.frame.to_can_message())
+            entry.sent += 1
+        except Exception as e:
+            if entry.errors == 0:
+                print(f"Cyclic send of 0x{entry.frame.arbitration_id:x} failed: {e}")
+            entry.errors += 1
+            entry.last_error = f"{type(e).__name__}: {e}"
+            if self.health is not None:
+                self.health.mark_error(e)
+        entry.deadline += entry.period_s
+        if entry.deadline < now:
+            #more than one period late, missed cycles are not sent in burst
+            missed = int((now - entry.deadline) / entry.period_s) + 1
+            entry.missed += missed
+            entry.deadline += missed * entry.period_s
+
+
+
+def cyclic_frame_from_command(data:dict):
+    payload = data.get("data",b"")
+    if isinstance(payload,str):
+        payload = bytes.fromhex(payload)
+    arbitration_id = int(data["arbitration_id"])
+    extended = data.get("is_extended_id",arbitration_id > 0x7FF)
+    return can_frame(arbitration_id,bytes(payload),CAN_FLAG_EXTENDED if extended else 0)
+
+
+def create_cyclic_scheduler(config:dict,bus,send_lock:Lock):
+    config = config or {}
+    return cyclic_scheduler(bus,send_lock,config.get("cyclic_mode","auto"),float(config.get("cyclic_spin_us",0)) / 1e6)
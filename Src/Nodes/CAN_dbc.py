@@ -0,0 +1,189 @@
+from pathlib import Path
+from threading import Lock
+
+#NumPy is optional, without it batches are decoded per frame
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# ****************************************************************************
+#
+# DBC signal decoding for CAN node. Database (cantools) is loaded once per
+# file and decoder of arbitration id is compiled with first frame of that id:
+# every signal becomes (shift, mask, sign, scale, offset) applied to payload
+# read as one integer, so no per-bit parsing runs for received frames.
+#
+# Batch of frames (can_batch_size > 1) is grouped by id and decoded into one
+# column per signal, with NumPy all frames of id are decoded by few array
+# operations (payloads up to 8 bytes).
+#
+# Decoded values are published on '<node>/<message>/<signal>':
+#   - single frame -> value (float)
+#   - batch        -> values of frames with this id in receive order
+#                     (NumPy array when NumPy is installed, list otherwise)
+#
+# Multiplexed messages and float signals are decoded by cantools per frame.
+#
+# Node config keys (CAN):
+#   dbc_file = User/configs/vehicle.dbc     - relative to Src or absolute
+#   dbc_publish_frames = 1          - 0: only decoded signals are published
+#
+# ****************************************************************************
+
+
+class dbc_signal():
+    __slots__ = ("name","topic","shift","mask","sign_bit","scale","offset")
+    def __init__(self,name:str,topic:str,shift:int,mask:int,sign_bit:int,scale:float,offset:float):
+        self.name = name
+        self.topic = topic
+        #raw value = (payload integer >> shift) & mask
+        self.shift = shift
+        self.mask = mask
+        #0 for unsigned signals
+        self.sign_bit = sign_bit
+        self.scale = scale
+        self.offset = offset
+
+
+class dbc_message_decoder():
+    """Compiled decoder of one DBC message"""
+    def __init__(self,message,topic_prefix:str):
+        self.message = message
+        self.length = message.length
+        #multiplexed and float signals need cantools itself
+        self.use_cantools = message.is_multiplexed() or any(signal.is_float for signal in message.signals)
+        self.topics = {signal.name:f"{topic_prefix}/{message.name}/{signal.name}" for signal in message.signals}
+        self.little_endian = []
+        self.big_endian = []
+        self.signal_groups = []
+        #payload fits uint64 column and raw values fit int64
+        self.numpy_capable = self.length <= 8 and all(signal.length < 64 for signal in message.signals)
+        if self.use_cantools:
+            return
+        for signal in message.signals:
+            if signal.byte_order == "little_endian":
+                shift = signal.start
+                self.little_endian.append(self.compile_signal(signal,shift))
+            else:
+                #start is MSB in DBC sawtooth numbering, payload is read as big endian integer
+                msb = (self.length - 1 - signal.start // 8) * 8 + signal.start % 8
+                self.big_endian.append(self.compile_signal(signal,msb - signal.length + 1))
+        #plain tuples for per frame decoding, attribute access costs more than bit operations
+        self.signal_groups = [([(signal.topic,signal.shift,signal.mask,signal.sign_bit,signal.scale,signal.offset) for signal in signals],byteorder)
+                              for signals, byteorder in ((self.little_endian,"little"),(self.big_endian,"big")) if signals]
+
+    def compile_signal(self,signal,shift:int):
+        mask = (1 << signal.length) - 1
+        sign_bit = 1 << (signal.length - 1) if signal.is_signed else 0
+        return dbc_signal(signal.name,self.topics[signal.name],shift,mask,sign_bit,signal.scale,signal.offset)
+
+    def decode(self,data:bytes):
+        """[(topic, value)] of one payload"""
+        if self.use_cantools:
+            decoded = self.message.decode(data,decode_choices=False)
+            return [(self.topics[name],value) for name, value in decoded.items()]
+        if len(data) != self.length:
+            data = data.ljust(self.length,b"\0")[:self.length]
+        values = []
+        for signals, byteorder in self.signal_groups:
+            payload = int.from_bytes(data,byteorder)
+            for topic, shift, mask, sign_bit, scale, offset in signals:
+                raw = (payload >> shift) & mask
+                if raw & sign_bit:
+                    raw -= mask + 1
+                values.append((topic,raw * scale + offset))
+        return values
+
+    def decode_columns(self,payloads:list):
+        """[(topic, column)] of payloads with this id, one value per payload"""
+        if np is not None and not self.use_cantools and self.numpy_capable:
+            return self.decode_columns_numpy(payloads)
+        columns = {}
+        for data in payloads:
+            for topic, value in self.decode(data):
+                columns.setdefault(topic,[]).append(value)
+        return list(columns.items())
+
+    def decode_columns_numpy(self,payloads:list):
+        #payloads padded to 8 bytes, big endian signals are shifted to same positions as in int.from_bytes(data[:length])
+        padding = 8 - self.length
+        records = b"".join([data.ljust(self.length,b"\0")[:self.length] + b"\0" * padding for data in payloads])
+        columns = []
+        for signals, dtype, extra_shift in ((self.little_endian,"<u8",0),(self.big_endian,">u8",padding * 8)):
+            if not signals:
+                continue
+            words = np.frombuffer(records,dtype=dtype).astype(np.uint64)
+            for signal in signals:
+                raw = (words >> np.uint64(signal.shift + extra_shift)) & np.uint64(signal.mask)
+                if signal.sign_bit:
+                    #sign bit moved to bit 63 and shifted back arithmetically, raw - (mask + 1) overflows int64 for 63 bit signals
+                    unused_bits = np.uint64(64 - signal.sign_bit.bit_length())
+                    raw = (raw << unused_bits).astype(np.int64) >> np.int64(unused_bits)
+                columns.append((signal.topic,raw * signal.scale + signal.offset))
+        return columns
+
+
+
+class dbc_decoder():
+    def __init__(self,database,topic_prefix:str):
+        self.database = database
+        self.topic_prefix = topic_prefix
+        #arbitration id -> dbc_message_decoder, None for ids not in database
+        self.decoders = {}
+
+    def decoder_for(self,arbitration_id:int):
+        try:
+            return self.decoders[arbitration_id]
+        except KeyError:
+            pass
+        try:
+            decoder = dbc_message_decoder(self.database.get_message_by_frame_id(arbitration_id),self.topic_prefix)
+        except KeyError:
+            decoder = None
+        self.decoders[arbitration_id] = decoder
+        return decoder
+
+    def decode_frame(self,frame):
+        """[(topic, value)] of can_frame"""
+        decoder = self.decoder_for(frame.arbitration_id)
+        if decoder is None or frame.is_error_frame:
+            return []
+        return decoder.decode(frame.data)
+
+    def decode_frames(self,frames):
+        """[(topic, column)] of frames from one burst"""
+        payloads_per_id = {}
+        for frame in frames:
+            if not frame.is_error_frame:
+                payloads_per_id.setdefault(frame.arbitration_id,[]).append(frame.data)
+        columns = []
+        for arbitration_id, payloads in payloads_per_id.items():
+            decoder = self.decoder_for(arbitration_id)
+            if decoder is not None:
+                columns += decoder.decode_columns(payloads)
+        return columns
+
+
+
+#One database object per file for all CAN nodes
+dbc_databases = {}
+dbc_databases_lock = Lock()
+
+def load_dbc(path:str):
+    with dbc_databases_lock:
+        database = dbc_databases.get(path)
+        if database is None:
+            import cantools
+            database = dbc_databases[path] = cantools.database.load_file(path)
+        return database
+
+
+def create_dbc_decoder(config:dict,topic_prefix:str):
+    if not config or not config.get("dbc_file"):
+        return None
+    dbc_file = Path(config["dbc_file"])
+    if not dbc_file.is_absolute():
+        dbc_file = Path(__file__).resolve().parent.parent / dbc_file
+    return dbc_decoder(load_dbc(str(dbc_file)),topic_prefix)
@@ -0,0 +1,193 @@
+from Nodes.message import register_payload_codec
+import struct
+
+
+# ****************************************************************************
+#
+# Structured CAN frames published by CAN node. Typed fields travel through
+# broker instead of str(can.Message), consumers read arbitration_id and data
+# directly and str(frame) is formatted only when somebody asks for text.
+#
+# Frames received in one recv burst can be published together as
+# can_frame_batch (list of frames) or as NumPy structured array (can_frame_dtype()).
+#
+# Both types have binary payload codec (Nodes/message.py), so they cross
+# process boundary (hosted nodes, shared memory transport) without pickle.
+#
+# Node config keys:
+#   channel = 1
+#   bustype = vector                - python-can interface
+#   bitrate = 500000
+#   data_bitrate = 2000000          - CAN FD data phase, used with can_fd = 1
+#   can_fd = 0 | 1
+#   app_name = pycan                - Vector application name
+#   can_batch_size = 1              - >1: up to N frames of one burst published as one message
+#   can_batch_format = frames | numpy
+#
+# ****************************************************************************
+
+
+CAN_FLAG_EXTENDED = 0x01
+CAN_FLAG_REMOTE = 0x02
+CAN_FLAG_ERROR = 0x04
+CAN_FLAG_FD = 0x08
+CAN_FLAG_BRS = 0x10
+CAN_FLAG_ESI = 0x20
+CAN_FLAG_TX = 0x40
+
+
+class can_frame():
+    """
+    timestamp - bus timestamp of frame in seconds (python-can Message.timestamp)
+    flags - CAN_FLAG_* bits
+    data - payload bytes, len(data) can differ from dlc for remote frames
+    """
+    __slots__ = ("timestamp","arbitration_id","flags","dlc","data")
+
+    def __init__(self,arbitration_id:int,data:bytes=b"",flags:int=0,dlc:int=None,timestamp:float=0.0):
+        self.timestamp = timestamp
+        self.arbitration_id = arbitration_id
+        self.flags = flags
+        self.dlc = len(data) if dlc is None else dlc
+        self.data = data
+
+    @staticmethod
+    def from_can_message(msg):
+        flags = ((CAN_FLAG_EXTENDED if msg.is_extended_id else 0) | (CAN_FLAG_REMOTE if msg.is_remote_frame else 0)
+                 | (CAN_FLAG_ERROR if msg.is_error_frame else 0) | (CAN_FLAG_FD if msg.is_fd else 0)
+                 | (CAN_FLAG_BRS if msg.bitrate_switch else 0) | (CAN_FLAG_ESI if msg.error_state_indicator else 0)
+                 | (0 if msg.is_rx else CAN_FLAG_TX))
+        return can_frame(msg.arbitration_id,bytes(msg.data),flags,msg.dlc,msg.timestamp)
+
+    def to_can_message(self):
+        from can import Message
+        #every flag of from_can_message, replayed / recorded frame stays same frame
+        return Message(timestamp=self.timestamp,arbitration_id=self.arbitration_id,data=self.data,dlc=self.dlc,
+                       is_extended_id=bool(self.flags & CAN_FLAG_EXTENDED),is_remote_frame=bool(self.flags & CAN_FLAG_REMOTE),
+                       is_error_frame=bool(self.flags & CAN_FLAG_ERROR),is_fd=bool(self.flags & CAN_FLAG_FD),
+                       bitrate_switch=bool(self.flags & CAN_FLAG_BRS),error_state_indicator=bool(self.flags & CAN_FLAG_ESI),
+                       is_rx=not self.flags & CAN_FLAG_TX)
+
+    @property
+    def is_extended_id(self):
+        return bool(self.flags & CAN_FLAG_EXTENDED)
+
+    @property
+    def is_error_frame(self):
+        return bool(self.flags & CAN_FLAG_ERROR)
+
+    def __eq__(self,other):
+        if not isinstance(other,can_frame):
+            return NotImplemented
+        return (self.arbitration_id,self.data,self.flags,self.dlc,self.timestamp) == (other.arbitration_id,other.data,other.flags,other.dlc,other.timestamp)
+
+    def __repr__(self):
+        return f"can_frame(arbitration_id=0x{self.arbitration_id:x}, data={self.data.hex(' ')!r}, flags=0x{self.flags:x}, dlc={self.dlc}, timestamp={self.timestamp})"
+
+    #Text similar to str(can.Message) published before, formatted on demand
+    def __str__(self):
+        arbitration_id = f"{self.arbitration_id:08x}" if self.flags & CAN_FLAG_EXTENDED else f"{self.arbitration_id:04x}"
+        return (f"Timestamp: {self.timestamp:>15.6f}    ID: {arbitration_id}    "
+                f"{'E' if self.flags & CAN_FLAG_ERROR else ' '}{'R' if self.flags & CAN_FLAG_REMOTE else ' '}    "
+                f"DL: {self.dlc:2d}    {self.data.hex(' ')}")
+
+    #read_message_from_buffer(data_to_search=...) of user script: text, arbitration id or payload bytes
+    def __contains__(self,item):
+        if isinstance(item,str):
+            return item in str(self)
+        if isinstance(item,int):
+            return item == self.arbitration_id
+        return item in self.data
+
+
+
+class can_frame_batch():
+    """Frames of one recv burst in receive order"""
+    __slots__ = ("frames",)
+
+    def __init__(self,frames:list):
+        self.frames = frames
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __iter__(self):
+        return iter(self.frames)
+
+    def __getitem__(self,index):
+        return self.frames[index]
+
+    def __contains__(self,item):
+        return any(item in frame for frame in self.frames)
+
+    def __repr__(self):
+        return f"can_frame_batch({len(self.frames)} frames)"
+
+    def as_array(self):
+        """NumPy structured array with can_frame_dtype()"""
+        return frames_to_array(self.frames)
+
+
+
+#NumPy form of batch, dtype is created with first use so NumPy is needed only by users of this form
+#record layout matches can_frame_dtype(), array is built from one bytes object
+can_frame_record = struct.Struct("<dIHBB64s")
+can_frame_dtype_cache = None
+
+def can_frame_dtype():
+    global can_frame_dtype_cache
+    if can_frame_dtype_cache is None:
+        import numpy as np
+        can_frame_dtype_cache = np.dtype([("timestamp","<f8"),("arbitration_id","<u4"),("flags","<u2"),
+                                          ("dlc","u1"),("length","u1"),("data","u1",(64,))])
+    return can_frame_dtype_cache
+
+
+def frames_to_array(frames:list):
+    import numpy as np
+    pack = can_frame_record.pack
+    records = b"".join([pack(frame.timestamp,frame.arbitration_id,frame.flags,frame.dlc,len(frame.data),frame.data) for frame in frames])
+    return np.frombuffer(records,dtype=can_frame_dtype()).copy()
+
+
+
+#Binary codecs
+#frame: timestamp | arbitration_id | flags | dlc | data length | data
+#batch: count | frames
+###################################################################################
+PAYLOAD_CAN_FRAME = 16
+PAYLOAD_CAN_FRAME_BATCH = 17
+
+can_frame_header = struct.Struct("<dIHBB")
+can_batch_header = struct.Struct("<I")
+
+def encode_can_frame(frame:can_frame):
+    return can_frame_header.pack(frame.timestamp,frame.arbitration_id,frame.flags,frame.dlc,len(frame.data)) + frame.data
+
+
+def decode_can_frame_at(buffer,offset:int):
+    timestamp, arbitration_id, flags, dlc, length = can_frame_header.unpack_from(buffer,offset)
+    offset += can_frame_header.size
+    frame = can_frame(arbitration_id,bytes(buffer[offset:offset + length]),flags,dlc,timestamp)
+    return frame, offset + length
+
+
+def decode_can_frame(buffer):
+    return decode_can_frame_at(buffer,0)[0]
+
+
+def encode_can_frame_batch(batch:can_frame_batch):
+    return can_batch_header.pack(len(batch.frames)) + b"".join([encode_can_frame(frame) for frame in batch.frames])
+
+
+def decode_can_frame_batch(buffer):
+    frames = []
+    offset = can_batch_header.size
+    for _ in range(can_batch_header.unpack_from(buffer,0)[0]):
+        frame, offset = decode_can_frame_at(buffer,offset)
+        frames.append(frame)
+    return can_frame_batch(frames)
+
+
+register_payload_codec(PAYLOAD_CAN_FRAME,can_frame,encode_can_frame,decode_can_frame)
+register_payload_codec(PAYLOAD_CAN_FRAME_BATCH,can_frame_batch,encode_can_frame_batch,decode_can_frame_batch)
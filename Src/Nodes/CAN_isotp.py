@@ -0,0 +1,297 @@
+from Nodes.CAN_frames import can_frame, CAN_FLAG_EXTENDED
+from Nodes.message import message_
+from threading import Thread
+import queue
+import time
+
+
+# ****************************************************************************
+#
+# ISO-TP (ISO 15765-2) segmentation/reassembly and UDS (ISO 14229) client
+# running inside CAN node. Received frames of diagnostic id are handled by
+# node listener thread, so flow control answers first frame without broker
+# round trip, consecutive frames are sent by diagnostic worker thread of node
+# with block size and STmin of receiver.
+#
+# Classic CAN frames (8 bytes), normal addressing, payload up to 4 GB
+# (first frame with 32 bit length above 4095 bytes).
+#
+# Command (optional_params of message to '<node>_Tx'), answered on node topic
+# with correlation_id of command (send_querry):
+#   UDS_REQUEST  {"data": "22 F1 90" | b"..", "tx_id": 0x7E0, "rx_id": 0x7E8, "timeout_s": 1}
+#             -> {"status": "OK" | "NEGATIVE" | "ERROR", "data": response bytes, "nrc": code of negative response,
+#                 "tx_bytes", "rx_bytes", "duration_ms", "throughput_kB_s"}
+#
+# Node config keys (CAN):
+#   isotp_tx_id = 0x7E0             - default ids of UDS_REQUEST
+#   isotp_rx_id = 0x7E8
+#   isotp_block_size = 0            - flow control sent by node: frames per block (0 = no further flow control)
+#   isotp_stmin = 0                 - flow control sent by node: ms between consecutive frames
+#   isotp_padding = 0xCC            - empty = frames are not padded to 8 bytes
+#   isotp_timeout_s = 1             - N_Bs / N_Cr, wait for flow control or next consecutive frame
+#
+# ****************************************************************************
+
+
+ISOTP_SINGLE_FRAME = 0x0
+ISOTP_FIRST_FRAME = 0x1
+ISOTP_CONSECUTIVE_FRAME = 0x2
+ISOTP_FLOW_CONTROL = 0x3
+
+FLOW_STATUS_CONTINUE = 0
+FLOW_STATUS_WAIT = 1
+FLOW_STATUS_OVERFLOW = 2
+
+UDS_NEGATIVE_RESPONSE = 0x7F
+UDS_RESPONSE_PENDING = 0x78
+#P2* server time after response pending
+UDS_PENDING_TIMEOUT_S = 5.0
+#flow control WAIT frames accepted before transfer is aborted
+ISOTP_MAX_WAIT_FRAMES = 10
+
+
+class isotp_error(Exception):
+    pass
+
+
+def stmin_to_s(stmin:int):
+    if stmin <= 0x7F:
+        return stmin / 1000
+    if 0xF1 <= stmin <= 0xF9:
+        return (stmin - 0xF0) / 10000
+    #reserved values mean maximum
+    return 0.127
+
+
+def stmin_from_ms(stmin_ms:float):
+    if stmin_ms <= 0:
+        return 0
+    if stmin_ms < 1:
+        #0xF1-0xF9 = 100-900 us
+        return 0xF0 + max(1,min(9,round(stmin_ms * 10)))
+    return min(int(stmin_ms),0x7F)
+
+
+def wait_until(deadline:float):
+    """Sleep to deadline (time.perf_counter), last ms is polled because of OS sleep granularity"""
+    remaining = deadline - time.perf_counter()
+    if remaining > 0.002:
+        time.sleep(remaining - 0.001)
+    while time.perf_counter() < deadline:
+        #sleep(0) releases GIL, listener receiving flow control runs during poll
+        time.sleep(0)
+
+
+
+class isotp_channel():
+    """One tx_id/rx_id pair. on_frame() is called by listener thread, send()/receive() by worker thread"""
+    def __init__(self,tx_id:int,rx_id:int,send_frame,block_size:int=0,stmin_ms:float=0,padding:int=0xCC,timeout_s:float=1.0):
+        self.tx_id = tx_id
+        self.rx_id = rx_id
+        self.tx_flags = CAN_FLAG_EXTENDED if tx_id > 0x7FF else 0
+        #send_frame(can_frame) writes frame to bus
+        self.send_frame = send_frame
+        self.block_size = block_size
+        self.stmin = stmin_from_ms(stmin_ms)
+        self.padding = padding
+        self.timeout_s = timeout_s
+        #reassembled payloads and flow control frames for worker thread
+        self.rx_queue = queue.SimpleQueue()
+        self.flow_control_queue = queue.SimpleQueue()
+        #reassembly state, touched only by listener thread
+        self.rx_buffer = None
+        self.rx_length = 0
+        self.rx_sequence = 0
+        self.rx_block_count = 0
+        self.rx_deadline = 0.0
+
+    def frame(self,data:bytes):
+        if self.padding is not None and len(data) < 8:
+            data = data + bytes((self.padding,)) * (8 - len(data))
+        return can_frame(self.tx_id,data,self.tx_flags)
+
+    #Listener thread
+    def on_frame(self,frame:can_frame):
+        data = frame.data
+        if not data:
+            return
+        frame_type = data[0] >> 4
+        if frame_type == ISOTP_FLOW_CONTROL:
+            self.flow_control_queue.put(data)
+        elif frame_type == ISOTP_SINGLE_FRAME:
+            length = data[0] & 0x0F
+            if 0 < length <= len(data) - 1:
+                self.rx_buffer = None
+                self.rx_queue.put(bytes(data[1:1 + length]))
+        elif frame_type == ISOTP_FIRST_FRAME:
+            length = ((data[0] & 0x0F) << 8) | data[1]
+            header = 2
+            if length == 0:
+                length = int.from_bytes(data[2:6],"big")
+                header = 6
+            self.rx_buffer = bytearray(data[header:])
+            self.rx_length = length
+            self.rx_sequence = 1
+            self.rx_block_count = 0
+            self.rx_deadline = time.monotonic() + self.timeout_s
+            self.send_frame(self.frame(bytes((0x30 | FLOW_STATUS_CONTINUE,self.block_size,self.stmin))))
+        elif frame_type == ISOTP_CONSECUTIVE_FRAME:
+            if self.rx_buffer is None:
+                return
+            if (data[0] & 0x0F) != self.rx_sequence or time.monotonic() > self.rx_deadline:
+                #lost frame or sender gave up, message can not be completed
+                self.rx_buffer = None
+                return
+            self.rx_sequence = (self.rx_sequence + 1) & 0x0F
+            self.rx_buffer += data[1:1 + self.rx_length - len(self.rx_buffer)]
+            self.rx_deadline = time.monotonic() + self.timeout_s
+            if len(self.rx_buffer) >= self.rx_length:
+                self.rx_queue.put(bytes(self.rx_buffer))
+                self.rx_buffer = None
+                return
+            self.rx_block_count += 1
+            if self.block_size and self.rx_block_count >= self.block_size:
+                self.rx_block_count = 0
+                self.send_frame(self.frame(bytes((0x30 | FLOW_STATUS_CONTINUE,self.block_size,self.stmin))))
+
+    #Worker thread
+    def send(self,payload:bytes):
+        if len(payload) <= 7:
+            self.send_frame(self.frame(bytes((len(payload),)) + payload))
+            return
+        while not self.flow_control_queue.empty():
+            self.flow_control_queue.get_nowait()
+        if len(payload) <= 0xFFF:
+            self.send_frame(self.frame(bytes((0x10 | (len(payload) >> 8),len(payload) & 0xFF)) + payload[:6]))
+            position = 6
+        else:
+            self.send_frame(self.frame(b"\x10\x00" + len(payload).to_bytes(4,"big") + payload[:2]))
+            position = 2
+        sequence = 1
+        while position < len(payload):
+            block_size, separation_s = self.wait_flow_control()
+            next_send = 0.0
+            sent_in_block = 0
+            while position < len(payload) and (block_size == 0 or sent_in_block < block_size):
+                if separation_s:
+                    wait_until(next_send)
+                    #STmin is minimum gap, late frame does not shorten gap to next one
+                    next_send = time.perf_counter() + separation_s
+                self.send_frame(self.frame(bytes((0x20 | sequence,)) + payload[position:position + 7]))
+                position += 7
+                sequence = (sequence + 1) & 0x0F
+                sent_in_block += 1
+
+    def wait_flow_control(self):
+        for _ in range(ISOTP_MAX_WAIT_FRAMES + 1):
+            try:
+                data = self.flow_control_queue.get(timeout=self.timeout_s)
+            except queue.Empty:
+                raise isotp_error(f"No flow control from 0x{self.rx_id:x} in {self.timeout_s} s")
+            flow_status = data[0] & 0x0F
+            if flow_status == FLOW_STATUS_CONTINUE:
+                return data[1], stmin_to_s(data[2])
+            if flow_status == FLOW_STATUS_OVERFLOW:
+                raise isotp_error(f"Receiver 0x{self.rx_id:x} reported overflow")
+        raise isotp_error(f"Receiver 0x{self.rx_id:x} sent too many flow control WAIT frames")
+
+    def receive(self,timeout_s:float):
+        return self.rx_queue.get(timeout=timeout_s)
+
+    def clear(self):
+        while not self.rx_queue.empty():
+            self.rx_queue.get_nowait()
+
+
+
+class uds_client():
+    def __init__(self,channel:isotp_channel):
+        self.channel = channel
+
+    def request(self,request:bytes,timeout_s:float=1.0):
+        """Complete response of server with transfer statistics"""
+        self.channel.clear()
+        started = time.perf_counter()
+        self.channel.send(request)
+        deadline = time.perf_counter() + timeout_s
+        while True:
+            try:
+                response = self.channel.receive(max(deadline - time.perf_counter(),0))
+            except queue.Empty:
+                raise isotp_error(f"No response to service 0x{request[0]:02x} in {timeout_s} s")
+            if len(response) >= 3 and response[0] == UDS_NEGATIVE_RESPONSE and response[2] == UDS_RESPONSE_PENDING:
+                #server needs more time (erase, flash), wait for final response
+                deadline = time.perf_counter() + UDS_PENDING_TIMEOUT_S
+                continue
+            break
+        duration_s = time.perf_counter() - started
+        result = {"status":"OK","data":response,"tx_bytes":len(request),"rx_bytes":len(response),
+                  "duration_ms":duration_s * 1000,
+                  "throughput_kB_s":(len(request) + len(response)) / duration_s / 1000 if duration_s > 0 else None}
+        if response and response[0] == UDS_NEGATIVE_RESPONSE:
+            result["status"] = "NEGATIVE"
+            result["nrc"] = response[2] if len(response) >= 3 else None
+        return result
+
+
+
+class diagnostic_worker(Thread):
+    """Runs UDS requests of CAN node one after another, listener thread keeps receiving meanwhile"""
+    def __init__(self,listener,send_frame,name:str,config:dict):
+        super().__init__(daemon=True,name=f"{name}_diagnostic")
+        self.listener = listener
+        self.send_frame = send_frame
+        self.name_of_node = name
+        config = config or {}
+        self.default_tx_id = int(config.get("isotp_tx_id","0x7E0"),0)
+        self.default_rx_id = int(config.get("isotp_rx_id","0x7E8"),0)
+        self.block_size = int(config.get("isotp_block_size",0))
+        self.stmin_ms = float(config.get("isotp_stmin",0))
+        padding = config.get("isotp_padding","0xCC")
+        self.padding = int(padding,0) if padding else None
+        self.timeout_s = float(config.get("isotp_timeout_s",1))
+        self.requests = queue.SimpleQueue()
+        #thread can not be started again after stop_process
+        self.stopped = False
+
+    def channel(self,tx_id:int,rx_id:int):
+        channel = self.listener.isotp_channels.get(rx_id)
+        if channel is None or channel.tx_id != tx_id:
+            channel = isotp_channel(tx_id,rx_id,self.send_frame,self.block_size,self.stmin_ms,self.padding,self.timeout_s)
+            #listener reads dict without lock, new dict is swapped in
+            self.listener.isotp_channels = {**self.listener.isotp_channels,rx_id:channel}
+        return channel
+
+    def submit(self,msg:message_):
+        if self.stopped:
+            #request queued in manipulator while node was stopping
+            self.reply(msg,{"status":"ERROR","error":"CAN node is stopped"})
+            return
+        if not self.is_alive():
+            self.start()
+        self.requests.put(msg)
+
+    def stop_process(self):
+        self.stopped = True
+        self.requests.put(None)
+
+    def reply(self,msg:message_,response:dict):
+        if msg.correlation_id is not None:
+            self.listener.publish(message_(topic=self.name_of_node,source="CAN",data=response,correlation_id=msg.correlation_id))
+
+    def run(self):
+        while True:
+            msg = self.requests.get()
+            if msg is None:
+                break
+            data = msg.data or {}
+            try:
+                request = data["data"]
+                if isinstance(request,str):
+                    request = bytes.fromhex(request)
+                tx_id = int(data.get("tx_id",self.default_tx_id))
+                rx_id = int(data.get("rx_id",self.default_rx_id))
+                response = uds_client(self.channel(tx_id,rx_id)).request(bytes(request),float(data.get("timeout_s",self.timeout_s)))
+            except Exception as e:
+                response = {"status":"ERROR","error":f"{type(e).__name__}: {e}"}
+            self.reply(msg,response)
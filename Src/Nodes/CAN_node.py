@@ -1,49 +1,209 @@
 from Nodes.nodes_abstract import *
+from Nodes.CAN_dbc import *
+from Nodes.CAN_cyclic import *
+from Nodes.CAN_isotp import *
+from Nodes.CAN_stats import *
+from can import interface
+
+# ****************************************************************************
+#
+# Received frames are published as can_frame (can_batch_size = 1) or as
+# can_frame_batch / NumPy array of frames from one recv burst, config keys
+# are described in Nodes/CAN_frames.py.
+#
+# With dbc_file in config, signals are decoded and published on
+# '<node>/<message>/<signal>', see Nodes/CAN_dbc.py.
+#
+# SEND_MSG accepts can.Message, can_frame or can_frame_batch.
+# CYCLIC_START / CYCLIC_UPDATE / CYCLIC_STOP / CYCLIC_STATS control cyclic
+# transmit, see Nodes/CAN_cyclic.py.
+# UDS_REQUEST runs ISO-TP/UDS request in node, see Nodes/CAN_isotp.py.
+# CAN_STATS answers per-id rate/jitter and bus load, see Nodes/CAN_stats.py.
+#
+# ****************************************************************************
 
 
 class Can_node_thread(abstract_node):
+    #received frames are not answers to queries, commands are answered by manipulator itself
+    default_response_matcher = "none"
+    answered_commands = ("CYCLIC_START","CYCLIC_UPDATE","CYCLIC_STOP","CYCLIC_STATS","CAN_STATS","UDS_REQUEST")
     def __init__(self,message_broker_queue:Queue,config:dict):
         super().__init__(message_broker_queue,config)
 
     def init_configuration(self):
         self.name_of_node = self.config["node_name"]
         self.channel = self.config["channel"]
-        self.bus = interface.Bus(bustype='vector', channel=self.channel, bitrate=500000, app_name='pycan')
+        self.bus = interface.Bus(**self.bus_kwargs())
+
+    def bus_kwargs(self):
+        bustype = self.config.get("bustype","vector")
+        kwargs = {"bustype":bustype,"channel":self.channel,"bitrate":int(self.config.get("bitrate",500000))}
+        if self.config.get("can_fd","0") == "1":
+            kwargs["fd"] = True
+            kwargs["data_bitrate"] = int(self.config.get("data_bitrate",2000000))
+        if bustype == "vector":
+            kwargs["app_name"] = self.config.get("app_name","pycan")
+        return kwargs
 
     def create_sub_threads(self): 
         self.manipulator_thread = can_node_manipulator_thread(self.own_que,self.bus)
-        self.listener_thread = can_node_lisener_thread(self.message_broker_queue,self.bus,self.name_of_node)
+        self.manipulator_thread.name = self.name_of_node
+        self.manipulator_thread.cyclic_scheduler = create_cyclic_scheduler(self.config,self.bus,self.manipulator_thread.send_lock)
+        self.manipulator_thread.cyclic_scheduler.health = self.health
+        self.listener_thread = can_node_lisener_thread(self.message_broker_queue,self.bus,self.name_of_node,
+                                                       int(self.config.get("can_batch_size",1)),self.config.get("can_batch_format","frames"))
+        #answers of commands are published by listener
+        self.manipulator_thread.listener = self.listener_thread
+        self.listener_thread.dbc_decoder = create_dbc_decoder(self.config,self.name_of_node)
+        self.listener_thread.publish_frames = self.config.get("dbc_publish_frames","1") == "1"
+        self.listener_thread.bus_stats = self.manipulator_thread.bus_stats = create_can_bus_stats(self.config)
+        self.manipulator_thread.diagnostic_worker = diagnostic_worker(self.listener_thread,self.manipulator_thread.send_message,
+                                                                      self.name_of_node,self.config)
 
     def end_func(self):
-        self.bus.shutdown()
+        #sub-threads do not exist when init failed (stop/restart of node which never ran)
+        if self.manipulator_thread is not None:
+            if self.manipulator_thread.cyclic_scheduler is not None:
+                self.manipulator_thread.cyclic_scheduler.stop_process()
+            if self.manipulator_thread.diagnostic_worker is not None:
+                self.manipulator_thread.diagnostic_worker.stop_process()
+        if getattr(self,"bus",None) is not None:
+            self.bus.shutdown()
+
+    def cyclic_stats(self):
+        if self.manipulator_thread is None or self.manipulator_thread.cyclic_scheduler is None:
+            return {}
+        return self.manipulator_thread.cyclic_scheduler.stats()
+
+    def bus_stats(self,previous:dict=None):
+        """Snapshot of per-id statistics and bus load, None when can_stats = 0"""
+        if self.listener_thread is None or self.listener_thread.bus_stats is None:
+            return None
+        return self.listener_thread.bus_stats.snapshot(previous)
 
 
 class can_node_lisener_thread(abstract_node_listener_thread):
-    def __init__(self,message_broker_queue, bus,name_of_node:str): #*args
+    def __init__(self,message_broker_queue, bus,name_of_node:str,batch_size:int=1,batch_format:str="frames"): #*args
         super().__init__()
         self.message_broker_queue = message_broker_queue
         self.bus = bus
         self.name = name_of_node
+        self.batch_size = max(batch_size,1)
+        self.batch_format = batch_format
+        self.dbc_decoder = None
+        self.publish_frames = True
+        #rx id -> isotp_channel, replaced as whole by diagnostic worker
+        self.isotp_channels = {}
+        self.bus_stats = None
     
     def main_func(self):
         msg_from_bus = self.bus.recv(1)
-        if msg_from_bus != None:
-            msg_to_send = message_(topic=self.name,source="CAN",data=str(msg_from_bus))
-            self.message_broker_queue.put(msg_to_send)
+        if msg_from_bus is None:
+            return
+        capture_ns = time.monotonic_ns()
+        if self.batch_size == 1:
+            frame = can_frame.from_can_message(msg_from_bus)
+            if self.bus_stats is not None:
+                self.bus_stats.update(frame,capture_ns)
+            if self.isotp_channels:
+                self.handle_isotp(frame)
+            if self.publish_frames:
+                self.publish(message_(topic=self.name,source="CAN",data=frame,timestamp_ns=capture_ns))
+            if self.dbc_decoder is not None:
+                self.publish_signals(self.dbc_decoder.decode_frame(frame),capture_ns)
+            return
+        #rest of burst is already in driver queue, recv(0) does not wait
+        frames = [can_frame.from_can_message(msg_from_bus)]
+        while len(frames) < self.batch_size:
+            msg_from_bus = self.bus.recv(0)
+            if msg_from_bus is None:
+                break
+            frames.append(can_frame.from_can_message(msg_from_bus))
+        if self.bus_stats is not None:
+            for frame in frames:
+                self.bus_stats.update(frame,capture_ns)
+        if self.isotp_channels:
+            for frame in frames:
+                self.handle_isotp(frame)
+        if self.publish_frames:
+            data = frames_to_array(frames) if self.batch_format == "numpy" else can_frame_batch(frames)
+            self.publish(message_(topic=self.name,source="CAN",data=data,timestamp_ns=capture_ns))
+        if self.dbc_decoder is not None:
+            self.publish_signals(self.dbc_decoder.decode_frames(frames),capture_ns)
+
+    def handle_isotp(self,frame:can_frame):
+        channel = self.isotp_channels.get(frame.arbitration_id)
+        if channel is not None:
+            channel.on_frame(frame)
+
+    def publish_signals(self,signals:list,capture_ns:int):
+        for topic, value in signals:
+            self.publish(message_(topic=topic,source="CAN",data=value,timestamp_ns=capture_ns))
 
 
 class can_node_manipulator_thread(abstract_node_manipulator_thread):
     def __init__(self,node_queue: Queue,bus): #*args
         super().__init__(node_queue)
         self.bus = bus
+        self.send_lock = Lock()
+        self.listener = None
+        self.name = None
+        self.cyclic_scheduler = None
+        self.diagnostic_worker = None
+        self.bus_stats = None
 
     def callback_router(self,msg):
         match msg.optional_params:
             case "SEND_MSG":
                 self.send_message(msg.data)
                 pass
+            case "CYCLIC_START" | "CYCLIC_UPDATE" | "CYCLIC_STOP" | "CYCLIC_STATS":
+                self.cyclic_command(msg)
+            case "CAN_STATS":
+                if self.bus_stats is None:
+                    self.reply(msg,{"status":"ERROR","error":"can_stats = 0 in node config"})
+                else:
+                    self.reply(msg,{"status":"OK","stats":self.bus_stats.snapshot(msg.data or None)})
+            case "UDS_REQUEST":
+                #transfer can take minutes (flashing), manipulator keeps serving other messages
+                self.diagnostic_worker.submit(msg)
             case _ :
                 pass
 
     def send_message(self,payload_to_send):
-        self.bus.send(payload_to_send)
+        if isinstance(payload_to_send,can_frame_batch):
+            with self.send_lock:
+                for frame in payload_to_send:
+                    self.bus.send(frame.to_can_message())
+            return
+        if isinstance(payload_to_send,can_frame):
+            payload_to_send = payload_to_send.to_can_message()
+        with self.send_lock:
+            self.bus.send(payload_to_send)
+
+    def cyclic_command(self,msg):
+        data = msg.data or {}
+        try:
+            match msg.optional_params:
+                case "CYCLIC_START":
+                    self.cyclic_scheduler.start_cyclic(cyclic_frame_from_command(data),float(data["period_ms"]) / 1000)
+                    response = {"status":"OK"}
+                case "CYCLIC_UPDATE":
+                    payload = data.get("data")
+                    self.cyclic_scheduler.update_cyclic(int(data["arbitration_id"]),
+                                                        bytes.fromhex(payload) if isinstance(payload,str) else payload,
+                                                        float(data["period_ms"]) / 1000 if "period_ms" in data else None)
+                    response = {"status":"OK"}
+                case "CYCLIC_STOP":
+                    self.cyclic_scheduler.stop_cyclic(int(data["arbitration_id"]) if "arbitration_id" in data else None)
+                    response = {"status":"OK"}
+                case _:
+                    response = {"status":"OK","stats":self.cyclic_scheduler.stats()}
+        except Exception as e:
+            response = {"status":"ERROR","error":f"{type(e).__name__}: {e}"}
+        self.reply(msg,response)
+
+    #answer of command sent with send_querry
+    def reply(self,msg,response:dict):
+        if msg.correlation_id is not None and self.listener is not None:
+            self.listener.publish(message_(topic=self.name,source="CAN",data=response,correlation_id=msg.correlation_id))
@@ -0,0 +1,151 @@
+from Nodes.CAN_frames import can_frame, CAN_FLAG_EXTENDED, CAN_FLAG_ERROR, CAN_FLAG_FD, CAN_FLAG_BRS, CAN_FLAG_REMOTE
+import math
+import time
+
+
+# ****************************************************************************
+#
+# Incremental statistics of CAN bus kept by node listener, O(1) work per
+# frame and no stored frames:
+#   - per arbitration id: count, rate, inter-arrival min/mean/max, jitter
+#     (standard deviation of inter-arrival), last payload, age of last frame
+#   - bus load estimated from frame lengths and bitrate
+#   - error frames
+#
+# Rate is from exponentially weighted inter-arrival (last ~16 frames), so
+# drift of cyclic message shows as rate_hz moving away from 1000 / mean_ms,
+# stopped message shows as growing age_ms.
+#
+# Snapshot: Can_node_thread.bus_stats(previous) / CAN_STATS command /
+# Backend.get_can_stats(). Bus load is average since previous snapshot
+# (since start without it).
+#
+# Node config keys (CAN):
+#   can_stats = 1 | 0
+#
+# ****************************************************************************
+
+
+#frame bits without stuff bits (SOF..EOF + intermission)
+CAN_FRAME_OVERHEAD_BITS = 47
+CAN_EXTENDED_FRAME_OVERHEAD_BITS = 67
+#CAN FD: arbitration phase at nominal bitrate, data phase (DLC, data, CRC) at data bitrate
+CANFD_ARBITRATION_BITS = 30
+CANFD_EXTENDED_ARBITRATION_BITS = 49
+CANFD_DATA_OVERHEAD_BITS = 28
+#weight of newest inter-arrival in rate estimate
+RATE_EWMA_WEIGHT = 1 / 16
+
+
+class can_id_stats():
+    __slots__ = ("count","last_timestamp","last_seen_ns","min_interval","max_interval","mean_interval",
+                 "interval_m2","ewma_interval","last_data","dlc")
+
+    def __init__(self):
+        self.count = 0
+        self.last_timestamp = 0.0
+        self.last_seen_ns = 0
+        self.min_interval = math.inf
+        self.max_interval = 0.0
+        #Welford running mean and sum of squared differences
+        self.mean_interval = 0.0
+        self.interval_m2 = 0.0
+        self.ewma_interval = 0.0
+        self.last_data = b""
+        self.dlc = 0
+
+    def as_dict(self,now_ns:int):
+        intervals = self.count - 1
+        result = {"count":self.count,"dlc":self.dlc,"last_data":self.last_data.hex(" "),
+                  "age_ms":(now_ns - self.last_seen_ns) / 1e6,
+                  "rate_hz":1 / self.ewma_interval if self.ewma_interval > 0 else None}
+        if intervals > 0:
+            result["interval_ms"] = {"min":self.min_interval * 1000,"mean":self.mean_interval * 1000,"max":self.max_interval * 1000,
+                                     "jitter":math.sqrt(self.interval_m2 / intervals) * 1000}
+        return result
+
+
+
+class can_bus_stats():
+    def __init__(self,bitrate:int=500000,data_bitrate:int=None):
+        self.bitrate = bitrate
+        self.data_bitrate = data_bitrate or bitrate
+        #arbitration id -> can_id_stats
+        self.ids = {}
+        self.frames = 0
+        self.error_frames = 0
+        #seconds of bus occupied by counted frames
+        self.busy_s = 0.0
+        self.started_ns = time.monotonic_ns()
+
+    def update(self,frame:can_frame,capture_ns:int):
+        flags = frame.flags
+        if flags & CAN_FLAG_ERROR:
+            self.error_frames += 1
+            return
+        self.frames += 1
+        data_length = 0 if flags & CAN_FLAG_REMOTE else len(frame.data)
+        if flags & CAN_FLAG_FD:
+            arbitration_bits = CANFD_EXTENDED_ARBITRATION_BITS if flags & CAN_FLAG_EXTENDED else CANFD_ARBITRATION_BITS
+            data_bits = CANFD_DATA_OVERHEAD_BITS + 8 * data_length
+            self.busy_s += arbitration_bits / self.bitrate + data_bits / (self.data_bitrate if flags & CAN_FLAG_BRS else self.bitrate)
+        else:
+            overhead_bits = CAN_EXTENDED_FRAME_OVERHEAD_BITS if flags & CAN_FLAG_EXTENDED else CAN_FRAME_OVERHEAD_BITS
+            self.busy_s += (overhead_bits + 8 * data_length) / self.bitrate
+
+        stats = self.ids.get(frame.arbitration_id)
+        if stats is None:
+            stats = self.ids[frame.arbitration_id] = can_id_stats()
+        #bus timestamp is more precise than time of read, capture time is used when backend has none
+        timestamp = frame.timestamp or capture_ns / 1e9
+        if stats.count:
+            interval = timestamp - stats.last_timestamp
+            if interval >= 0:
+                if interval < stats.min_interval:
+                    stats.min_interval = interval
+                if interval > stats.max_interval:
+                    stats.max_interval = interval
+                intervals = stats.count
+                delta = interval - stats.mean_interval
+                stats.mean_interval += delta / intervals
+                stats.interval_m2 += delta * (interval - stats.mean_interval)
+                if stats.ewma_interval:
+                    stats.ewma_interval += (interval - stats.ewma_interval) * RATE_EWMA_WEIGHT
+                else:
+                    stats.ewma_interval = interval
+        stats.count += 1
+        stats.last_timestamp = timestamp
+        stats.last_seen_ns = capture_ns
+        stats.last_data = frame.data
+        stats.dlc = frame.dlc
+
+    def snapshot(self,previous:dict=None):
+        """Cheap copy of counters, previous snapshot gives bus load of interval between them"""
+        now_ns = time.monotonic_ns()
+        since_ns, busy_before = self.started_ns, 0.0
+        if previous:
+            since_ns, busy_before = previous["timestamp_ns"], previous["busy_s"]
+        elapsed_s = (now_ns - since_ns) / 1e9
+        return {
+            "timestamp_ns": now_ns,
+            "busy_s": self.busy_s,
+            "bus_load_percent": (self.busy_s - busy_before) / elapsed_s * 100 if elapsed_s > 0 else 0.0,
+            "frames": self.frames,
+            "error_frames": self.error_frames,
+            "ids": {f"0x{arbitration_id:x}":stats.as_dict(now_ns) for arbitration_id, stats in list(self.ids.items())},
+        }
+
+    def reset(self):
+        self.ids = {}
+        self.frames = 0
+        self.error_frames = 0
+        self.busy_s = 0.0
+        self.started_ns = time.monotonic_ns()
+
+
+def create_can_bus_stats(config:dict):
+    config = config or {}
+    if config.get("can_stats","1") != "1":
+        return None
+    data_bitrate = int(config.get("data_bitrate",2000000)) if config.get("can_fd","0") == "1" else None
+    return can_bus_stats(int(config.get("bitrate",500000)),data_bitrate)
@@ -1,7 +1,10 @@
 from Nodes.nodes_abstract import *
+import http.client as http
+import ssl
 
 
 class Eth_http_node_thread(abstract_node):
+    default_response_matcher = "jsonrpc"
     def __init__(self, message_broker_queue:Queue, config: dict):
         super().__init__(message_broker_queue,config)
 
@@ -51,7 +54,7 @@ class eth_http_node_lisener_thread(abstract_node_listener_thread):
         if msg_from_bus_raw != None:
             respData = json.loads(msg_from_bus_raw.read())
             msg_to_send = message_(topic=self.name, source=self.name, data=respData)
-            self.message_broker_queue.put(msg_to_send)
+            self.publish(msg_to_send)
 
 
 class eth_http_node_manipulator_thread(abstract_node_manipulator_thread):
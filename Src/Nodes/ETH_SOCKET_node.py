@@ -1,7 +1,40 @@
 from Nodes.nodes_abstract import *
 
+# ****************************************************************************
+#
+# TCP client node. Received stream is read into buffer of framer (no copy per
+# read) and split into messages, see Nodes/stream_framing.py. Peer closing
+# connection raises EOFError, node health goes down and node_supervisor
+# reconnects.
+#
+# Node config keys:
+#   socket_server_address = 192.168.0.10
+#   socket_server_port = 5025
+#   socket_nodelay = 1                - TCP_NODELAY, short SCPI writes are not held back by Nagle algorithm
+#   socket_keepalive = 1              - dead peer (cable, power) is detected without traffic
+#   socket_keepalive_idle_s = 10      - keepalive timing, where OS supports setting it
+#   socket_keepalive_interval_s = 5
+#   socket_keepalive_count = 3
+#   socket_connect_timeout_s = 5
+#
+# ****************************************************************************
+
+
+def set_socket_options(sock:socket.socket,config:dict):
+    if config.get("socket_nodelay","1") == "1":
+        sock.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,1)
+    if config.get("socket_keepalive","1") == "1":
+        sock.setsockopt(socket.SOL_SOCKET,socket.SO_KEEPALIVE,1)
+        #TCP_KEEPIDLE is missing on macOS / older Windows, system defaults are used there
+        for option, key, default in (("TCP_KEEPIDLE","socket_keepalive_idle_s",10),
+                                     ("TCP_KEEPINTVL","socket_keepalive_interval_s",5),
+                                     ("TCP_KEEPCNT","socket_keepalive_count",3)):
+            if hasattr(socket,option):
+                sock.setsockopt(socket.IPPROTO_TCP,getattr(socket,option),int(config.get(key,default)))
+
 
 class Eth_socket_node_thread(abstract_node):
+    reactor_capable = True
     def __init__(self, message_broker_queue:Queue, config:dict):
         super().__init__(message_broker_queue,config)
 
@@ -11,33 +44,67 @@ class Eth_socket_node_thread(abstract_node):
         self.socket_server_port = int(self.config["socket_server_port"])
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
+            set_socket_options(self.socket,self.config)
+            self.socket.settimeout(float(self.config.get("socket_connect_timeout_s",5)))
             self.socket.connect((self.socket_server_address, self.socket_server_port))
+            self.socket.settimeout(None)
             return True
         except:
             print("ETH_socket node: connection to server failed!")
+            self.socket.close()
             return False
 
     def create_sub_threads(self): 
         self.manipulator_thread = eth_socket_node_manipulator_thread(self.own_que,self.socket)
-        self.listener_thread = eth_socket_node_lisener_thread(self.message_broker_queue,self.socket,self.name_of_node)
+        self.listener_thread = eth_socket_node_lisener_thread(self.message_broker_queue,self.socket,self.name_of_node,create_framer(self.config,self.default_framing))
 
     def end_func(self):
-        print("closing use_script")
+        try:
+            #wakes up listener blocked in recv
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
         self.socket.close()
 
+    def reactor_prepare(self):
+        self.socket.setblocking(False)
+
+    def reactor_fileobj(self):
+        return self.socket
+
+    def reactor_read_into(self,view):
+        received = self.socket.recv_into(view)
+        if not received:
+            raise EOFError("connection closed by server")
+        return received
+
+    def reactor_write(self,data):
+        return self.socket.send(data)
+
+    def reactor_message(self,frame_data):
+        return message_(topic=self.name_of_node,source=self.name_of_node,data=frame_data)
+
+    def reactor_bind_writer(self,writer):
+        self.manipulator_thread.socket = writer
+
 
 class eth_socket_node_lisener_thread(abstract_node_listener_thread):
-    def __init__(self,message_broker_queue, socket: socket, name_of_node:str): #*args
+    def __init__(self,message_broker_queue, socket: socket, name_of_node:str, framer:stream_framer=None): #*args
         super().__init__()
         self.message_broker_queue = message_broker_queue
         self.socket = socket
         self.name = name_of_node
+        self.framer = framer if framer is not None else raw_framer()
 
     def main_func(self):
-        msg_from_bus = self.socket.recv(1024).decode()
-        if msg_from_bus != None:
+        #received bytes go directly into framer buffer, only complete frames are published
+        with self.framer.write_view() as view:
+            received = self.socket.recv_into(view)
+        if not received:
+            raise EOFError("connection closed by server")
+        for msg_from_bus in self.framer.commit(received):
             msg_to_send = message_(topic=self.name,source=self.name,data=msg_from_bus)
-            self.message_broker_queue.put(msg_to_send)
+            self.publish(msg_to_send)
 
 
 class eth_socket_node_manipulator_thread(abstract_node_manipulator_thread):
@@ -46,11 +113,14 @@ class eth_socket_node_manipulator_thread(abstract_node_manipulator_thread):
         self.socket = socket
 
     def callback_router(self,msg):
-        self.send_message(msg)
+        self.write_scpi(msg,self.send_text)
 
     def send_message(self,payload_to_send):
+        self.send_text(payload_to_send.data)
+
+    def send_text(self,text:str):
         try:
-            self.socket.sendall(payload_to_send.data.encode())
+            self.socket.sendall(text.encode())
         except:
             print("eth_socket_node_mainpulator_thread: sendall Error!")
 
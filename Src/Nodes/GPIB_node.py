@@ -1,4 +1,5 @@
 from Nodes.nodes_abstract import *
+import pyvisa
 
 
 class gpib_node_thread(abstract_node):
@@ -38,7 +39,7 @@ class gpib_node_lisener_thread(abstract_node_listener_thread):
         msg_from_bus = self.instrument.read()
         if msg_from_bus != None:
             msg_to_send = message_(topic=self.name,source=self.name,data=msg_from_bus)
-            self.message_broker_queue.put(msg_to_send)
+            self.publish(msg_to_send)
 
 
 class gpib_node_manipulator_thread(abstract_node_manipulator_thread):
@@ -49,8 +50,7 @@ class gpib_node_manipulator_thread(abstract_node_manipulator_thread):
     def callback_router(self,msg):
         match msg.optional_params:
             case "SEND_MSG":
-                self.send_message(msg.data)
-                pass
+                self.write_scpi(msg,self.send_message)
             case _ :
                 pass
 
@@ -1,4 +1,5 @@
 from Nodes.nodes_abstract import *
+import pyvisa
 
 # ****************************************************************************
 #
@@ -17,6 +18,7 @@ class lan_node_thread(abstract_node):
     def init_configuration(self):
         # set node name used by message broker
         self.node_name = self.config["node_name"]
+        self.name_of_node = self.node_name
         # set instrument name used by resource manager.
         # It can be found as VISA Resource Name in NI MAX
         # (e.g. 'GPIB0::29::INSTR')
@@ -52,7 +54,7 @@ class lan_node_lisener_thread(abstract_node_listener_thread):
         if msg_from_bus != None:
             msg_to_send = message_(
                 topic=self.name, source=self.name, data=msg_from_bus)
-            self.message_broker_queue.put(msg_to_send)
+            self.publish(msg_to_send)
 
 
 class lan_node_manipulator_thread(abstract_node_manipulator_thread):
@@ -63,8 +65,7 @@ class lan_node_manipulator_thread(abstract_node_manipulator_thread):
     def callback_router(self, msg):
         match msg.optional_params:
             case "SEND_MSG":
-                self.send_message(msg.data)
-                pass
+                self.write_scpi(msg,self.send_message)
             case _:
                 pass
 
@@ -0,0 +1,125 @@
+from Nodes.nodes_abstract import *
+from Nodes.trace_log import *
+
+# ****************************************************************************
+#
+# Replay of trace log (Nodes/trace_log.py, recorded by Backend/trace_recorder.py).
+# Recorded messages are published again on their original topics, so user
+# script and GUI see replayed bus as live one, without DUT.
+#
+# Node config keys:
+#   node_type = REPLAY
+#   trace_file = traces/trace_20260101_120000.ptrc    - relative to Src or absolute
+#   replay_speed = 1            - 1 = original timing, 2 = twice as fast, 0 = as fast as possible
+#   replay_topics =             - comma separated topics/patterns, empty = all
+#   replay_start_s = 0          - seconds from start of trace
+#   replay_end_s =              - empty = to end of trace
+#   replay_loop = 0 | 1
+#   replay_topic_prefix =       - eg. 'replay/' -> CAN1 is published as replay/CAN1
+#
+# Commands (optional_params): REPLAY_RESTART
+#
+# ****************************************************************************
+
+
+class Replay_node_thread(abstract_node):
+    #file does not break like bus connection
+    supports_reconnect = False
+    default_response_matcher = "none"
+    def __init__(self,message_broker_queue:Queue,config:dict):
+        super().__init__(message_broker_queue,config)
+
+    def init_configuration(self):
+        self.name_of_node = self.config["node_name"]
+        trace_file = Path(self.config["trace_file"])
+        if not trace_file.is_absolute():
+            trace_file = Path(__file__).resolve().parent.parent / trace_file
+        self.reader = trace_reader(trace_file)
+        return True
+
+    def create_sub_threads(self):
+        topics = [topic.strip() for topic in self.config.get("replay_topics","").split(",") if topic.strip()]
+        self.listener_thread = replay_node_listener_thread(self.message_broker_queue,self.reader,self.name_of_node,
+                                                           float(self.config.get("replay_speed",1)),topics,
+                                                           self.config.get("replay_loop","0") == "1",
+                                                           self.config.get("replay_topic_prefix",""))
+        self.listener_thread.set_range(float(self.config.get("replay_start_s") or 0),
+                                       float(self.config["replay_end_s"]) if self.config.get("replay_end_s") else None)
+        self.manipulator_thread = replay_node_manipulator_thread(self.own_que,self.listener_thread)
+
+    def end_func(self):
+        self.reader.close()
+
+
+class replay_node_listener_thread(abstract_node_listener_thread):
+    def __init__(self,message_broker_queue,reader:trace_reader,name_of_node:str,speed:float=1,topics:list=None,loop:bool=False,topic_prefix:str=""):
+        super().__init__()
+        self.message_broker_queue = message_broker_queue
+        self.reader = reader
+        self.name = name_of_node
+        self.speed = speed
+        self.topics = topics
+        self.loop = loop
+        self.topic_prefix = topic_prefix
+        self.start_ns = None
+        self.end_ns = None
+        self.messages = None
+        self.trace_origin_ns = None
+        self.replay_origin_ns = 0
+        self.restart_requested = False
+        self.replayed = 0
+
+    def set_range(self,start_s:float=0,end_s:float=None):
+        time_range = self.reader.time_range()
+        if time_range is None:
+            return
+        self.start_ns = time_range[0] + int(start_s * 1e9)
+        self.end_ns = time_range[0] + int(end_s * 1e9) if end_s is not None else None
+
+    def restart(self):
+        self.restart_requested = True
+        self.stop_event.set()
+
+    def main_func(self):
+        if self.restart_requested:
+            self.restart_requested = False
+            self.stop_event.clear()
+            self.messages = None
+        if self.messages is None:
+            self.messages = self.reader.messages(self.start_ns,self.end_ns,self.topics)
+            #replay time 0 = first replayed message
+            self.trace_origin_ns = None
+        msg = next(self.messages,None)
+        if msg is None:
+            if self.loop:
+                self.messages = None
+            else:
+                #end of trace, wait for REPLAY_RESTART or stop
+                self.stop_event.wait(1)
+            return
+        if self.trace_origin_ns is None:
+            self.trace_origin_ns = msg.timestamp_ns
+            self.replay_origin_ns = time.monotonic_ns()
+        if self.speed > 0:
+            due_ns = self.replay_origin_ns + (msg.timestamp_ns - self.trace_origin_ns) / self.speed
+            delay_s = (due_ns - time.monotonic_ns()) / 1e9
+            if delay_s > 0 and self.stop_event.wait(delay_s):
+                #stop or restart, message is not published
+                return
+        #captured now, latency metrics and scripts see replay time
+        self.publish(message_(topic=self.topic_prefix + (msg.topic or ""),source=msg.source,data=msg.data,
+                              optional_params=msg.optional_params))
+        self.replayed += 1
+
+
+class replay_node_manipulator_thread(abstract_node_manipulator_thread):
+    def __init__(self,node_queue: Queue,listener:replay_node_listener_thread): #*args
+        super().__init__(node_queue)
+        self.listener = listener
+
+    def callback_router(self,msg):
+        match msg.optional_params:
+            case "REPLAY_RESTART":
+                self.listener.restart()
+            case _ :
+                pass
@@ -1,8 +1,27 @@
 from Nodes.nodes_abstract import *
+from serial import Serial
 
+# ****************************************************************************
+#
+# Node config keys:
+#   uart_mode = line | raw      - raw: every read is published as bytes, decoding is left to consumers
+#   framing = ...               - line mode framing, see Nodes/stream_framing.py
+#   console_echo = 0 | 1        - rate limited mirror of received data, see Nodes/console_mirror.py
+#   classify_<class> = regex    - line mode: lines published on '<node>/<class>', see Nodes/line_classifier.py
+#   response_matcher = none     - DUT logging is not answer to query, set fifo (every line answers) or
+#                                 regex + response_pattern to use send_querry, see Nodes/correlation.py
+#
+# Message timestamp_ns is time of read which returned the data.
+#
+# ****************************************************************************
 
 
 class UART_node_thread(abstract_node):
+    reactor_capable = True
+    #same messages as readline() before framing was configurable
+    default_framing = "line"
+    #unsolicited log line would resolve pending query, matcher has to be configured
+    default_response_matcher = "none"
     def __init__(self,message_broker_queue:Queue,config:dict):
         super().__init__(message_broker_queue,config)
 
@@ -25,26 +44,73 @@ class UART_node_thread(abstract_node):
     
     def create_sub_threads(self):
         self.manipulator_thread = UART_node_manipulator_thread(self.own_que,self.bus)
-        self.listener_thread = UART_node_listener_thread(self.message_broker_queue,self.bus,self.name_of_node)
+        self.listener_thread = UART_node_listener_thread(self.message_broker_queue,self.bus,self.name_of_node,self.create_uart_framer())
+        self.listener_thread.console_mirror = create_console_mirror(self.config,self.name_of_node)
+        if self.config.get("uart_mode","line") != "raw":
+            self.listener_thread.line_classifier = create_line_classifier(self.config)
+            self.listener_thread.publish_base_topic = self.config.get("classify_publish_base","0") == "1"
+
+    def create_uart_framer(self):
+        if self.config.get("uart_mode","line") == "raw":
+            return raw_framer(encoding="bytes")
+        return create_framer(self.config,self.default_framing)
 
     def end_func(self):
         self.bus.close()
 
+    #Serial port can be registered in selector only where it is file descriptor
+    def reactor_supported(self):
+        return os.name == "posix"
+
+    def reactor_prepare(self):
+        self.bus.timeout = 0
+        self.bus.write_timeout = 0
+
+    def reactor_fileobj(self):
+        return self.bus
+
+    def reactor_read(self):
+        return self.bus.read(self.bus.in_waiting or 1)
+
+    def reactor_framer(self):
+        return self.create_uart_framer()
+
+    def reactor_write(self,data):
+        return self.bus.write(data) or 0
+
+    def reactor_message(self,frame_data):
+        if isinstance(frame_data,str):
+            frame_data = frame_data.strip()
+        return message_(topic=self.name_of_node,source="UART",data=frame_data)
+
+    def reactor_bind_writer(self,writer):
+        self.manipulator_thread.bus = writer
+
 
 class UART_node_listener_thread(abstract_node_listener_thread):
-    def __init__(self,message_broker_queue, bus:Serial,name_of_node): #*args
+    def __init__(self,message_broker_queue, bus:Serial,name_of_node,framer:stream_framer=None): #*args
         super().__init__()
         self.message_broker_queue = message_broker_queue
         self.bus = bus
         self.name = name_of_node
+        self.framer = framer if framer is not None else line_framer()
+        self.console_mirror = None
         self.bus.timeout=None
         
     def main_func(self):
-        msg_from_bus = self.bus.readline()
-        msg_from_bus = msg_from_bus.decode('utf-8').strip()
-        print("received: " + msg_from_bus )
-        msg_to_send = message_(topic=self.name,source="UART",data=msg_from_bus)
-        self.message_broker_queue.put(msg_to_send)
+        #blocks for first byte, then takes everything already received in one call
+        data = self.bus.read(self.bus.in_waiting or 1)
+        if len(data) == 1 and self.bus.in_waiting:
+            data += self.bus.read(self.bus.in_waiting)
+        capture_ns = time.monotonic_ns()
+        msgs_to_send = []
+        for msg_from_bus in self.framer.feed(data):
+            if isinstance(msg_from_bus,str):
+                msg_from_bus = msg_from_bus.strip()
+            if self.console_mirror is not None:
+                self.console_mirror.echo(msg_from_bus)
+            msgs_to_send.append(message_(topic=self.name,source="UART",data=msg_from_bus,timestamp_ns=capture_ns))
+        self.publish_lines(msgs_to_send)
     
 
 
@@ -65,7 +131,10 @@ class UART_node_manipulator_thread(abstract_node_manipulator_thread):
 
     def send_message(self,payload_to_send):
         # str= "01 02 03" -> bytes = b"\x01\x02\x03"
-        #takes hex string and converts to bytes
+        #takes hex string and converts to bytes, bytes payload is written as is
+        if isinstance(payload_to_send,(bytes,bytearray)):
+            self.bus.write(payload_to_send)
+            return
         result_bytes = bytes.fromhex(payload_to_send)
         self.bus.write(result_bytes)
     
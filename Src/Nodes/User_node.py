@@ -1,12 +1,16 @@
 from Nodes.nodes_abstract import *
 import csv
 import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from itertools import count
 from User.private_libraries import *
 
 #User script 
 ###################################################################################
 class user_script_thread(abstract_node):
     script_ended = pyqtSignal()
+    supports_reconnect = False
+    terminate_on_stop_timeout = True
     def __init__(self,data_model,message_broker_queue:Queue,topic_que_dict_class,us_file_name):
         super().__init__(message_broker_queue,None)
         self.name = "User_script"
@@ -39,6 +43,12 @@ class user_script_receiver_thread(abstract_node_manipulator_thread):
 
 
     def route_msg_to_buffer(self,msg):
+        #response to pending query goes directly to waiting future, late responses land in buffer
+        if msg.correlation_id is not None:
+            future = self.US_message_buffer.pending_requests.pop(msg.correlation_id,None)
+            if future is not None:
+                future.set_result(msg.data)
+                return
         if self.US_message_buffer.buffer_topic_que_dict.get(msg.topic):
             self.US_message_buffer.buffer_topic_que_dict[msg.topic].put(msg.data)
 
@@ -58,6 +68,7 @@ class user_script_main_thread(abstract_node_listener_thread):
         self.data_model = data_model
         self.topic_que_dict_class = topic_que_dict_class
         self.us_buffer_handler = us_buffer_handler
+        self.correlation_counter = count()
         self.us_file_name = us_file_name
 
     #################################################################################################
@@ -81,9 +92,13 @@ class user_script_main_thread(abstract_node_listener_thread):
 
     #API
     #################################################################################################    
-    def add_sub(self,topic:str):
+    def add_sub(self,topic:str,queue_size:int=0,overflow_policy:str="drop_oldest"):
+        """
+        queue_size > 0 bounds buffer of topic, overflow_policy: drop_oldest, drop_newest, keep_latest (only latest message of topic)
+        block is not available, one receiver thread fills buffers of all topics
+        """
+        self.us_buffer_handler.add_buffer(topic,queue_size,overflow_policy)
         self.topic_que_dict_class.add_sub({(topic):self.us_queue})
-        self.us_buffer_handler.add_buffer(topic)
 
 
     def del_sub(self,topic:str):
@@ -91,15 +106,66 @@ class user_script_main_thread(abstract_node_listener_thread):
         self.us_buffer_handler.del_buffer(topic)
 
 
+    def get_drop_counters(self):
+        """topic -> number of dropped messages (broker subscriber queues and script buffers)"""
+        counters = self.topic_que_dict_class.drop_counters()
+        for topic, dropped in self.us_buffer_handler.drop_counters().items():
+            counters[topic] = counters.get(topic,0) + dropped
+        return counters
+
+
+    def get_metrics(self,previous:dict=None):
+        """Broker metrics snapshot, pass previous snapshot to get per second rates"""
+        snapshot = broker_metrics_instance.snapshot(previous,self.topic_que_dict_class.subscriber_labels())
+        snapshot["drops"] = self.get_drop_counters()
+        return snapshot
+
+
+    def get_node_health(self,node_name:str=None):
+        """'connected' / 'degraded' / 'down' of node, dict of all nodes when node_name is None"""
+        return get_node_health(node_name)
+
+
     def send_message(self,topic:str,data,optional_params="SEND_MSG"):
         msg = message_(topic=(topic+"_Tx"),source=self.name,data=data,optional_params=optional_params)
         self.message_broker_queue.put(msg)
 
 
     def send_querry(self,topic:str,data,optional_params="SEND_MSG",time_for_timeout=None,blocking=False,data_to_search=None):
-        self.clear_queue(topic=topic)
-        self.send_message(topic=topic,data=data,optional_params=optional_params)
-        return self.read_message(topic=topic,time_for_timeout=time_for_timeout,blocking=blocking,data_to_search=data_to_search)
+        if data_to_search != None or not query_supported(topic,optional_params):
+            #searching in stream of lines or node without response matcher, next message of topic is the answer
+            self.clear_queue(topic=topic)
+            self.send_message(topic=topic,data=data,optional_params=optional_params)
+            return self.read_message(topic=topic,time_for_timeout=time_for_timeout,blocking=blocking,data_to_search=data_to_search)
+
+        future = self.send_querry_async(topic=topic,data=data,optional_params=optional_params)
+        if time_for_timeout == None:
+            time_for_timeout = None if blocking else 0.01
+        try:
+            return True, future.result(timeout=time_for_timeout)
+        except FutureTimeoutError:
+            return False, "Empty"
+        finally:
+            self.us_buffer_handler.pending_requests.pop(future.correlation_id,None)
+
+
+    def send_querry_async(self,topic:str,data,optional_params="SEND_MSG"):
+        """
+        Returns concurrent.futures.Future resolved with response data, several queries can be in flight at once.
+        Response is matched by node (response_matcher in node config), topic has to be subscribed.
+        Raises ValueError for node without response matcher (CAN data, replay, UART without response_matcher),
+        send_querry falls back to reading next message of topic for such node.
+        """
+        if not query_supported(topic,optional_params):
+            #answer would only land in buffer after timeout
+            raise ValueError(f"Node {topic} does not match responses to queries (response_matcher = none), "
+                             "use send_message + read_message, send_querry with data_to_search or set response_matcher in node config")
+        future = Future()
+        future.correlation_id = f"{self.name}:{next(self.correlation_counter)}"
+        self.us_buffer_handler.pending_requests[future.correlation_id] = future
+        msg = message_(topic=(topic+"_Tx"),source=self.name,data=data,optional_params=optional_params,correlation_id=future.correlation_id)
+        self.message_broker_queue.put(msg)
+        return future
 
 
     def read_message(self,topic,time_for_timeout=None,blocking=False,data_to_search=None):
@@ -180,10 +246,23 @@ class user_script_main_thread(abstract_node_listener_thread):
 class US_message_buffer():
     def __init__(self):
         self.buffer_topic_que_dict = {}
+        #correlation_id -> Future of send_querry waiting for response
+        self.pending_requests = {}
 
-    def add_buffer(self,topic):
+    def add_buffer(self,topic,queue_size:int=0,overflow_policy:str="drop_oldest"):
+        if queue_size > 0 and overflow_policy == "block":
+            raise ValueError("Script buffer can not block, full buffer of one topic would stop all topics, use drop_oldest / drop_newest / keep_latest")
         if not self.buffer_topic_que_dict.get(topic):
-            self.buffer_topic_que_dict[topic] = Queue()
+            #buffer keeps msg.data of one topic, keep_latest key is topic of buffer
+            self.buffer_topic_que_dict[topic] = create_queue(maxsize=queue_size,overflow_policy=overflow_policy,key_attribute=None,label=topic)
+
+    def drop_counters(self):
+        counters = {}
+        for topic, buffer_queue in list(self.buffer_topic_que_dict.items()):
+            dropped = getattr(buffer_queue,"dropped",0)
+            if dropped:
+                counters[topic] = dropped
+        return counters
         
     def del_buffer(self,topic):
         if self.buffer_topic_que_dict.get(topic):
@@ -1,8 +1,4 @@
 from Nodes.nodes_abstract import *
-from Nodes.UART_node import *
-from Nodes.CAN_node import *
-from Nodes.ETH_HTTP_node import *
-from Nodes.ETH_SOCKET_node import *
-from Nodes.GPIB_node import *
+from Nodes.transport import *
 from Nodes.User_node import *
-from Nodes.ADB_node import *
+from Nodes.node_types import *
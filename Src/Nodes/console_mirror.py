@@ -0,0 +1,45 @@
+import sys
+import time
+
+
+# ****************************************************************************
+#
+# Opt-in mirror of received data to console. Printing every line of fast
+# DUT log costs real CPU, so mirror is off by default and rate limited:
+# lines over limit are counted and reported as one summary line.
+#
+# Node config keys:
+#   console_echo = 0 | 1
+#   console_echo_max_lines_per_s = 20
+#
+# ****************************************************************************
+
+
+class console_mirror():
+    def __init__(self,name:str,max_lines_per_s:float=20):
+        self.name = name
+        self.max_lines_per_s = max_lines_per_s
+        #token bucket, burst of one second is allowed
+        self.tokens = max_lines_per_s
+        self.last_refill = time.monotonic()
+        self.suppressed = 0
+
+    def echo(self,data):
+        now = time.monotonic()
+        self.tokens = min(self.max_lines_per_s,self.tokens + (now - self.last_refill) * self.max_lines_per_s)
+        self.last_refill = now
+        if self.tokens < 1:
+            self.suppressed += 1
+            return
+        self.tokens -= 1
+        if self.suppressed:
+            sys.stdout.write(f"{self.name}: ... {self.suppressed} lines not shown (console_echo_max_lines_per_s)\n")
+            self.suppressed = 0
+        #bytes are shown as repr, binary data can not break console
+        sys.stdout.write(f"{self.name}: {data if isinstance(data,str) else repr(data)}\n")
+
+
+def create_console_mirror(config:dict,name:str):
+    if not config or config.get("console_echo","0") != "1":
+        return None
+    return console_mirror(name,float(config.get("console_echo_max_lines_per_s",20)))
@@ -0,0 +1,142 @@
+from collections import deque
+from threading import Lock
+import json
+import re
+import time
+
+
+# ****************************************************************************
+#
+# Request/response correlation. Query sent by user script carries
+# message_.correlation_id, node manipulator registers it in response matcher
+# before writing to bus and node listener asks matcher which request is answered
+# by received data. Tagged response resolves waiting request in user script.
+#
+# Node config keys:
+#   response_matcher = fifo | jsonrpc | regex | none
+#   response_pattern = ^(OK|ERR)      - regex matcher, only matching data is response
+#   response_timeout_s = 30           - pending request is forgotten after this time
+#
+# Node with 'none' (CAN, replay, UART unless configured) does not answer
+# queries, send_querry to it is rejected before sending, except commands
+# which node answers itself (abstract_node.answered_commands).
+#
+# ****************************************************************************
+
+
+class fifo_response_matcher():
+    """Instrument answers queries in order they were sent (SCPI)"""
+    def __init__(self,config:dict):
+        self.max_age_s = float(config.get("response_timeout_s",30))
+        self.pending = deque()
+        self.lock = Lock()
+
+    def has_pending(self):
+        return len(self.pending) > 0
+
+    def on_request(self,msg):
+        with self.lock:
+            self.pending.append((msg.correlation_id,time.monotonic() + self.max_age_s))
+
+    def is_response(self,data):
+        return True
+
+    def match(self,data):
+        if not self.is_response(data):
+            return None
+        now = time.monotonic()
+        with self.lock:
+            while self.pending:
+                correlation_id, deadline = self.pending.popleft()
+                if deadline >= now:
+                    return correlation_id
+        return None
+
+
+class regex_response_matcher(fifo_response_matcher):
+    """FIFO order, but only data matching response_pattern is response (rest is eg. DUT logging)"""
+    def __init__(self,config:dict):
+        super().__init__(config)
+        self.response_pattern = re.compile(config["response_pattern"])
+
+    def is_response(self,data):
+        if isinstance(data,(bytes,bytearray)):
+            data = data.decode("utf-8","replace")
+        return self.response_pattern.search(str(data)) is not None
+
+
+class jsonrpc_response_matcher():
+    """Response carries 'id' of request, answers can come in any order"""
+    def __init__(self,config:dict):
+        self.max_age_s = float(config.get("response_timeout_s",30))
+        #JSON-RPC id -> (correlation_id, deadline)
+        self.pending = {}
+        self.lock = Lock()
+
+    def has_pending(self):
+        return len(self.pending) > 0
+
+    def on_request(self,msg):
+        request = msg.data
+        if isinstance(request,str):
+            request = json.loads(request)
+        if "id" not in request:
+            request = dict(request,id=msg.correlation_id)
+            msg.data = request
+        with self.lock:
+            self.pending[str(request["id"])] = (msg.correlation_id,time.monotonic() + self.max_age_s)
+
+    def match(self,data):
+        if isinstance(data,(str,bytes)):
+            try:
+                data = json.loads(data)
+            except ValueError:
+                return None
+        if not isinstance(data,dict) or "id" not in data:
+            return None
+        now = time.monotonic()
+        with self.lock:
+            for request_id in [request_id for request_id, (_, deadline) in self.pending.items() if deadline < now]:
+                self.pending.pop(request_id)
+            entry = self.pending.pop(str(data["id"]),None)
+        return entry[0] if entry else None
+
+
+
+response_matchers = {
+    "fifo": fifo_response_matcher,
+    "regex": regex_response_matcher,
+    "jsonrpc": jsonrpc_response_matcher,
+}
+
+
+def register_response_matcher(name:str,matcher_class):
+    """matcher_class(config) with has_pending(), on_request(msg) and match(data) -> correlation_id or None"""
+    response_matchers[name] = matcher_class
+
+
+#node name -> (response matcher name, commands answered by node itself)
+node_query_support = {}
+
+def register_node_query_support(node_name:str,matcher_name:str,answered_commands:tuple=()):
+    node_query_support[node_name] = (matcher_name,tuple(answered_commands))
+
+def query_supported(node_name:str,optional_params=None):
+    """False when response to query of node can not be matched, unknown node is not rejected"""
+    support = node_query_support.get(node_name)
+    if support is None:
+        return True
+    matcher_name, answered_commands = support
+    return matcher_name not in (None,"none") or optional_params in answered_commands
+
+
+def create_response_matcher(config:dict,default:str="fifo"):
+    if config is None:
+        return None
+    name = config.get("response_matcher",default)
+    if name in (None,"none"):
+        return None
+    try:
+        return response_matchers[name](config)
+    except KeyError:
+        raise ValueError(f"Unknown response matcher: {name}, available: {list(response_matchers)}")
@@ -0,0 +1,89 @@
+from bisect import bisect_left, bisect_right
+import re
+
+
+# ****************************************************************************
+#
+# Classification of console lines (DHU/IHU SCP, HKP, VIP...) at node listener.
+# Every line is published on sub-topic of its class, eg. SCP/ack, SCP/log,
+# SCP/error, so user script subscribes only to lines it waits for instead of
+# searching through megabytes of debug log in its buffer.
+#
+# Rules are tried in config order, first rule with match anywhere in line wins,
+# '^' at start of rule anchors it to start of line.
+# Lines received by one read are classified together: every rule runs one
+# finditer over whole chunk, so cost of lines without match stays in regex engine.
+#
+# Node config keys:
+#   classify_ack = ^(OK|ACK)\b           - classify_<class> = regex, any number of classes
+#   classify_error = (?i)error|fail
+#   classify_default = log               - class of lines without match
+#   classify_publish_base = 0            - 1 = line is also published on node topic (old subscribers)
+#
+# ****************************************************************************
+
+
+class line_classifier():
+    def __init__(self,rules:list,default_class:str="log"):
+        """rules - [(class name, regex)] in priority order"""
+        self.default_class = default_class
+        #(class name, compiled pattern, match starts at newline before line)
+        self.rules = []
+        for class_name, pattern in rules:
+            anchored = pattern.startswith("^")
+            if anchored:
+                #'\n' prefix lets regex engine use fast literal search, MULTILINE '^' is tested at every position
+                pattern = "\n" + pattern[1:]
+            try:
+                self.rules.append((class_name,re.compile(pattern,re.MULTILINE),anchored))
+            except re.error as e:
+                raise ValueError(f"Invalid classify_{class_name} pattern: {e}")
+
+    def classify(self,lines:list):
+        """class name for every line"""
+        if not lines:
+            return []
+        #every line is preceded by '\n', so anchored rules match at line start
+        chunk = "\n" + "\n".join(lines)
+        if len(lines) == 1:
+            for class_name, pattern, anchored in self.rules:
+                if self.line_matches(pattern,anchored,chunk,0,len(chunk)):
+                    return [class_name]
+            return [self.default_class]
+        #line i is chunk[starts[i]:ends[i]] together with '\n' before it, lines can contain '\n' themselves
+        starts = []
+        position = 0
+        for line in lines:
+            starts.append(position)
+            position += len(line) + 1
+        ends = starts[1:] + [len(chunk)]
+        classes = [self.default_class] * len(lines)
+        #each rule scans whole chunk in C, Python touches only matching lines
+        #rules are applied from lowest priority, so first rule of config wins
+        for class_name, pattern, anchored in reversed(self.rules):
+            for match in pattern.finditer(chunk):
+                index = bisect_right(starts,match.start()) - 1
+                if match.end() <= ends[index] and (anchored or match.start() > starts[index]):
+                    classes[index] = class_name
+                    continue
+                #match crosses separator (eg. '\s' matched '\n' between lines), touched lines are searched one by one
+                last = max(bisect_left(starts,match.end()) - 1,index)
+                for line_index in range(index,last + 1):
+                    if self.line_matches(pattern,anchored,chunk,starts[line_index],ends[line_index]):
+                        classes[line_index] = class_name
+        return classes
+
+    @staticmethod
+    def line_matches(pattern,anchored:bool,chunk:str,start:int,end:int):
+        #anchored rule starts with '\n' before line, other rules see only text of line
+        return pattern.search(chunk,start if anchored else start + 1,end) is not None
+
+
+def create_line_classifier(config:dict):
+    if not config:
+        return None
+    rules = [(key[len("classify_"):],pattern) for key, pattern in config.items()
+             if key.startswith("classify_") and key not in ("classify_default","classify_publish_base")]
+    if not rules:
+        return None
+    return line_classifier(rules,config.get("classify_default","log"))
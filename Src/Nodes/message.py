@@ -0,0 +1,187 @@
+from itertools import count
+from time import monotonic_ns
+import json
+import pickle
+import struct
+
+
+#Per source sequence numbers, next() on itertools.count is atomic under GIL
+source_counters = {}
+
+def next_sequence_number(source):
+    counter = source_counters.get(source)
+    if counter is None:
+        counter = source_counters.setdefault(source,count())
+    return next(counter)
+
+
+
+class message_():
+    """
+    Message passed between nodes, broker and user script.
+    timestamp_ns - time.monotonic_ns() at capture (creation of message)
+    seq - sequence number per source
+    correlation_id - optional id used to match response with request
+    Slots keep it smaller than dict-backed object with same fields, it is still
+    ~40 B and ~130 ns more than old 4-field message_ (timestamp and seq int
+    objects), see Dev/code_samples/backend_samples/message_alloc_bench.py
+    """
+    __slots__ = ("topic","source","data","optional_params","timestamp_ns","seq","correlation_id")
+
+    def __init__(self,topic:str=None,source:str=None,data=None,optional_params=None,correlation_id=None,timestamp_ns:int=None,seq:int=None):
+        self.topic = topic
+        self.data = data
+        self.source = source
+        self.optional_params = optional_params
+        self.correlation_id = correlation_id
+        self.timestamp_ns = monotonic_ns() if timestamp_ns is None else timestamp_ns
+        if seq is None:
+            counter = source_counters.get(source)
+            seq = next(counter) if counter is not None else next_sequence_number(source)
+        self.seq = seq
+
+    def __repr__(self):
+        return f"message_(topic={self.topic!r}, source={self.source!r}, seq={self.seq}, data={self.data!r})"
+
+    #Process boundary - compact binary form instead of pickled object
+    def __reduce__(self):
+        return (message_from_bytes,(self.to_bytes(),))
+
+    def to_bytes(self):
+        return encode_message(self)
+
+    @staticmethod
+    def from_bytes(buffer):
+        return message_from_bytes(buffer)
+
+
+
+#Messages delivered by broker in batch mode with one put per subscriber
+class message_batch():
+    __slots__ = ("messages",)
+    def __init__(self,messages:list):
+        self.messages = messages
+
+
+#Put on queue to wake up blocking consumer and end its loop
+class stop_sentinel():
+    pass
+
+
+
+#Binary serialization
+#header | topic | source | optional_params | correlation_id | payload
+#strings are utf-8, flags mark fields which are None or pickled (not str)
+###################################################################################
+message_header = struct.Struct("<BqQBIIIIBI")
+message_format_version = 2
+#version 1 (traces recorded before) - 16 bit lengths, 0xFFFF = None, no flags
+message_header_v1 = struct.Struct("<BqQHHHHBI")
+none_length_v1 = 0xFFFF
+FIELD_NONE = 0x01
+FIELD_PICKLE = 0x10
+
+PAYLOAD_NONE = 0
+PAYLOAD_BYTES = 1
+PAYLOAD_STR = 2
+#decoded only, JSON lost int keys and tuples, containers are pickled now
+PAYLOAD_JSON = 3
+PAYLOAD_PICKLE = 4
+
+#tag -> (type, encode func, decode func), tags from 16 up are free for nodes (eg. CAN frames)
+payload_codecs = {}
+payload_codecs_by_type = {}
+
+def register_payload_codec(tag:int,data_type:type,encode,decode):
+    if tag < 16:
+        raise ValueError("Payload codec tags below 16 are reserved")
+    payload_codecs[tag] = (data_type,encode,decode)
+    payload_codecs_by_type[data_type] = tag
+
+
+def encode_payload(data):
+    if data is None:
+        return PAYLOAD_NONE, b""
+    data_type = type(data)
+    if data_type is bytes:
+        return PAYLOAD_BYTES, data
+    if data_type is str:
+        return PAYLOAD_STR, data.encode("utf-8")
+    if data_type in (bytearray,memoryview):
+        return PAYLOAD_BYTES, bytes(data)
+    tag = payload_codecs_by_type.get(data_type)
+    if tag is not None:
+        return tag, payload_codecs[tag][1](data)
+    return PAYLOAD_PICKLE, pickle.dumps(data,protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def decode_payload(tag:int,payload):
+    if tag == PAYLOAD_NONE:
+        return None
+    if tag == PAYLOAD_BYTES:
+        return bytes(payload)
+    if tag == PAYLOAD_STR:
+        return str(payload,"utf-8")
+    if tag == PAYLOAD_JSON:
+        return json.loads(str(payload,"utf-8"))
+    if tag == PAYLOAD_PICKLE:
+        return pickle.loads(payload)
+    return payload_codecs[tag][2](payload)
+
+
+def encode_field(value,number:int):
+    """(bytes, flags) of optional message field"""
+    if value is None:
+        return b"", FIELD_NONE << number
+    if type(value) is str:
+        return value.encode("utf-8"), 0
+    #eg. optional_params dict of command, tuple correlation id
+    return pickle.dumps(value,protocol=pickle.HIGHEST_PROTOCOL), FIELD_PICKLE << number
+
+
+def encode_message(msg:message_):
+    topic, topic_flags = encode_field(msg.topic,0)
+    source, source_flags = encode_field(msg.source,1)
+    optional_params, optional_params_flags = encode_field(msg.optional_params,2)
+    correlation_id, correlation_id_flags = encode_field(msg.correlation_id,3)
+    payload_tag, payload = encode_payload(msg.data)
+    header = message_header.pack(message_format_version,msg.timestamp_ns,msg.seq,
+                                 topic_flags | source_flags | optional_params_flags | correlation_id_flags,
+                                 len(topic),len(source),len(optional_params),len(correlation_id),
+                                 payload_tag,len(payload))
+    return b"".join((header,topic,source,optional_params,correlation_id,payload))
+
+
+def message_from_bytes(buffer):
+    buffer = memoryview(buffer)
+    version = buffer[0]
+    if version == message_format_version:
+        (_,timestamp_ns,seq,flags,topic_length,source_length,optional_params_length,correlation_id_length,
+         payload_tag,payload_length) = message_header.unpack_from(buffer)
+        offset = message_header.size
+    elif version == 1:
+        (_,timestamp_ns,seq,topic_length,source_length,optional_params_length,correlation_id_length,
+         payload_tag,payload_length) = message_header_v1.unpack_from(buffer)
+        offset = message_header_v1.size
+        flags = 0
+        lengths = [topic_length,source_length,optional_params_length,correlation_id_length]
+        for number, length in enumerate(lengths):
+            if length == none_length_v1:
+                flags |= FIELD_NONE << number
+                lengths[number] = 0
+        topic_length, source_length, optional_params_length, correlation_id_length = lengths
+    else:
+        raise ValueError(f"Unsupported message format version: {version}")
+    fields = []
+    for number, length in enumerate((topic_length,source_length,optional_params_length,correlation_id_length)):
+        if flags & (FIELD_NONE << number):
+            fields.append(None)
+        elif flags & (FIELD_PICKLE << number):
+            fields.append(pickle.loads(buffer[offset:offset + length]))
+        else:
+            fields.append(str(buffer[offset:offset + length],"utf-8"))
+        offset += length
+    data = decode_payload(payload_tag,buffer[offset:offset + payload_length])
+    topic, source, optional_params, correlation_id = fields
+    return message_(topic=topic,source=source,data=data,optional_params=optional_params,
+                    correlation_id=correlation_id,timestamp_ns=timestamp_ns,seq=seq)
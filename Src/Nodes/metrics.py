@@ -0,0 +1,209 @@
+from threading import Thread, Event
+from time import monotonic_ns
+import json
+import time
+
+
+# ****************************************************************************
+#
+# Cheap counters of message plumbing, kept on in production:
+#   - messages and bytes per topic (counted by message_broker)
+#   - current and high-water depth of every subscriber queue (message_broker)
+#   - latency histogram from capture (message_.timestamp_ns) to delivery
+#     to node manipulator / user script receiver (abstract_node_manipulator_thread)
+#
+# Counters are plain ints updated without lock, under heavy contention single
+# increments can be lost, which is accepted for statistics.
+#
+# ****************************************************************************
+
+
+class latency_histogram():
+    """
+    HDR-style log-linear histogram of ns values.
+    Values below 16 ns have own buckets, above every power of two is split into 8 sub-buckets (~12% precision).
+    """
+    sub_bucket_bits = 3
+    sub_bucket_count = 1 << sub_bucket_bits
+    linear_limit = 1 << (sub_bucket_bits + 1)
+    number_of_buckets = linear_limit + 64 * sub_bucket_count
+
+    def __init__(self):
+        self.counts = [0] * self.number_of_buckets
+        self.total_count = 0
+        self.max_value = 0
+
+    def record(self,value_ns:int):
+        if value_ns < self.linear_limit:
+            if value_ns < 0:
+                value_ns = 0
+            index = value_ns
+        else:
+            shift = value_ns.bit_length() - self.sub_bucket_bits - 1
+            index = self.linear_limit + (shift - 1) * self.sub_bucket_count + (value_ns >> shift) - self.sub_bucket_count
+            if value_ns > self.max_value:
+                self.max_value = value_ns
+        self.counts[index] += 1
+        self.total_count += 1
+
+    def min_value(self):
+        for index, count in enumerate(self.counts):
+            if count:
+                return self.bucket_lower_bound(index)
+        return None
+
+    @classmethod
+    def bucket_lower_bound(cls,index:int):
+        if index < cls.linear_limit:
+            return index
+        shift = (index - cls.linear_limit) // cls.sub_bucket_count + 1
+        top = (index - cls.linear_limit) % cls.sub_bucket_count + cls.sub_bucket_count
+        return top << shift
+
+    @classmethod
+    def bucket_upper_bound(cls,index:int):
+        if index < cls.linear_limit:
+            return index
+        shift = (index - cls.linear_limit) // cls.sub_bucket_count + 1
+        top = (index - cls.linear_limit) % cls.sub_bucket_count + cls.sub_bucket_count
+        return ((top + 1) << shift) - 1
+
+    def percentile(self,percent:float):
+        if self.total_count == 0:
+            return None
+        threshold = self.total_count * percent / 100
+        running_count = 0
+        for index, count in enumerate(self.counts):
+            running_count += count
+            if count and running_count >= threshold:
+                return min(self.bucket_upper_bound(index),max(self.max_value,self.linear_limit))
+        return self.max_value
+
+    def summary_us(self):
+        if self.total_count == 0:
+            return {"count":0}
+        return {
+            "count": self.total_count,
+            "min": self.min_value() / 1000,
+            "p50": self.percentile(50) / 1000,
+            "p90": self.percentile(90) / 1000,
+            "p99": self.percentile(99) / 1000,
+            "max": self.max_value / 1000,
+        }
+
+
+
+sized_payload_types = (bytes,str,bytearray,memoryview)
+
+
+class topic_counters():
+    __slots__ = ("messages","bytes","latency")
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+        self.latency = latency_histogram()
+
+
+class broker_metrics():
+    def __init__(self):
+        self.enabled = True
+        self.topics = {}
+        #id(queue) -> [queue, high_water]
+        self.subscriber_queues = {}
+
+    def get_topic_counters(self,topic):
+        counters = self.topics.get(topic)
+        if counters is None:
+            counters = self.topics.setdefault(topic,topic_counters())
+        return counters
+
+    def count_message(self,msg):
+        if self.enabled:
+            counters = self.topics.get(msg.topic) or self.get_topic_counters(msg.topic)
+            counters.messages += 1
+            data = msg.data
+            if type(data) in sized_payload_types:
+                counters.bytes += len(data)
+
+    def record_queue_depth(self,subscriber_queue):
+        if not self.enabled:
+            return
+        try:
+            depth = subscriber_queue.qsize()
+        except NotImplementedError:
+            return
+        entry = self.subscriber_queues.get(id(subscriber_queue))
+        if entry is None:
+            self.subscriber_queues[id(subscriber_queue)] = [subscriber_queue,depth]
+        elif depth > entry[1]:
+            entry[1] = depth
+
+    def record_delivery(self,msg):
+        if self.enabled:
+            counters = self.topics.get(msg.topic) or self.get_topic_counters(msg.topic)
+            counters.latency.record(monotonic_ns() - msg.timestamp_ns)
+
+    def reset(self):
+        self.topics.clear()
+        self.subscriber_queues.clear()
+
+    def snapshot(self,previous:dict=None,queue_labels:dict=None):
+        """
+        previous - earlier snapshot of same caller, used to compute per second rates
+        queue_labels - id(queue) -> name shown for subscriber queue
+        """
+        now_ns = monotonic_ns()
+        topics = {}
+        for topic, counters in list(self.topics.items()):
+            topics[str(topic)] = {
+                "messages": counters.messages,
+                "bytes": counters.bytes,
+                "latency_us": counters.latency.summary_us(),
+            }
+
+        if previous is not None:
+            elapsed_s = (now_ns - previous["time_ns"]) / 1e9
+            for topic, counters in topics.items():
+                previous_counters = previous["topics"].get(topic,{"messages":0,"bytes":0})
+                counters["messages_per_s"] = (counters["messages"] - previous_counters["messages"]) / elapsed_s if elapsed_s else 0
+                counters["bytes_per_s"] = (counters["bytes"] - previous_counters["bytes"]) / elapsed_s if elapsed_s else 0
+
+        queues = {}
+        queue_labels = queue_labels or {}
+        for queue_id, (subscriber_queue, high_water) in list(self.subscriber_queues.items()):
+            try:
+                depth = subscriber_queue.qsize()
+            except NotImplementedError:
+                depth = None
+            queues[queue_labels.get(queue_id,f"queue_{queue_id:x}")] = {"depth":depth,"high_water":high_water}
+
+        return {"time_ns":now_ns,"time":time.time(),"topics":topics,"queues":queues}
+
+
+#Shared by message_broker and all nodes of process
+broker_metrics_instance = broker_metrics()
+
+
+
+class metrics_snapshot_writer(Thread):
+    """Appends one JSON line with metrics snapshot to file every period_s"""
+    def __init__(self,file_path,period_s:float,snapshot_func):
+        super().__init__(daemon=True)
+        self.file_path = file_path
+        self.period_s = period_s
+        self.snapshot_func = snapshot_func
+        self.stop_event = Event()
+
+    def run(self):
+        previous = None
+        while not self.stop_event.wait(self.period_s):
+            try:
+                snapshot = self.snapshot_func(previous)
+                with open(self.file_path,"a") as file_handler:
+                    file_handler.write(json.dumps(snapshot) + "\n")
+                previous = snapshot
+            except Exception as e:
+                print(f"Metrics snapshot error: {e}")
+
+    def stop_process(self):
+        self.stop_event.set()
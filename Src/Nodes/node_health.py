@@ -0,0 +1,87 @@
+from threading import Lock
+import socket
+import time
+
+
+# ****************************************************************************
+#
+# Health of node seen by its listener:
+#   connected - last read succeeded (or timed out without data)
+#   degraded  - I/O errors, listener retries with exponential backoff
+#   down      - init failed or too many consecutive errors
+#
+# Node config keys:
+#   error_backoff_max_s = 2        - longest pause between retries
+#   errors_until_down = 5          - consecutive errors after which node is down
+#
+# ****************************************************************************
+
+HEALTH_CONNECTED = "connected"
+HEALTH_DEGRADED = "degraded"
+HEALTH_DOWN = "down"
+
+ERROR_TIMEOUT = "timeout"
+ERROR_IO = "io"
+ERROR_OTHER = "other"
+
+#pyvisa VI_ERROR_TMO, compared by value so pyvisa does not have to be imported
+VISA_TIMEOUT_CODE = -1073807339
+
+
+def classify_error(error:Exception):
+    if isinstance(error,(TimeoutError,socket.timeout)) or getattr(error,"error_code",None) == VISA_TIMEOUT_CODE:
+        return ERROR_TIMEOUT
+    #serial.SerialException and socket errors are OSError, closed connection is EOFError
+    if isinstance(error,(OSError,EOFError)) or type(error).__name__ in ("VisaIOError","SerialException","CanError","UsbReadFailedError"):
+        return ERROR_IO
+    return ERROR_OTHER
+
+
+class node_health():
+    def __init__(self,errors_until_down:int=5):
+        self.state = HEALTH_CONNECTED
+        self.since = time.time()
+        self.consecutive_errors = 0
+        self.total_errors = 0
+        self.last_error = None
+        self.errors_until_down = errors_until_down
+
+    def set_state(self,state:str):
+        if state != self.state:
+            self.state = state
+            self.since = time.time()
+
+    def mark_ok(self):
+        if self.consecutive_errors or self.state != HEALTH_CONNECTED:
+            self.consecutive_errors = 0
+            self.set_state(HEALTH_CONNECTED)
+
+    def mark_error(self,error:Exception):
+        self.consecutive_errors += 1
+        self.total_errors += 1
+        self.last_error = f"{type(error).__name__}: {error}"
+        self.set_state(HEALTH_DOWN if self.consecutive_errors >= self.errors_until_down else HEALTH_DEGRADED)
+
+    def mark_down(self,reason:str):
+        self.last_error = reason
+        self.set_state(HEALTH_DOWN)
+
+    def as_dict(self):
+        return {"state":self.state,"since":self.since,"consecutive_errors":self.consecutive_errors,
+                "total_errors":self.total_errors,"last_error":self.last_error}
+
+
+#node name -> node_health, cheap lookup for backend and user scripts
+node_health_registry = {}
+node_health_registry_lock = Lock()
+
+def register_node_health(node_name:str,health:node_health):
+    with node_health_registry_lock:
+        node_health_registry[node_name] = health
+
+def get_node_health(node_name:str=None):
+    """State of one node, or dict of all nodes when node_name is None"""
+    if node_name is None:
+        return {name:health.state for name, health in list(node_health_registry.items())}
+    health = node_health_registry.get(node_name)
+    return health.state if health is not None else None
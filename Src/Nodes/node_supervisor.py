@@ -0,0 +1,93 @@
+from Nodes.priv_dependencies import *
+from Nodes.node_health import HEALTH_DOWN
+from threading import Lock
+import random
+
+
+# ****************************************************************************
+#
+# Lifecycle of nodes:
+#
+#   stopped -> starting -> running -> stopping -> stopped
+#                  |           |
+#                  v           v  (health down: socket closed, VISA errors...)
+#              reconnecting <--+
+#                  |
+#                  v  (max_reconnect_attempts reached)
+#                failed
+#
+# Stop is graceful: manipulator drains its queue and ends on stop_sentinel,
+# listener ends on control flag, end_func closes I/O which also unblocks
+# listener waiting in read. Threads are never terminated in the middle of write.
+#
+# node_supervisor checks all nodes and reconnects down nodes with jittered
+# exponential backoff, so instrument reboot during long run needs no restart.
+#
+# Node config keys:
+#   auto_reconnect = 1
+#   reconnect_backoff_s = 1            - delay before first reconnect attempt
+#   reconnect_backoff_max_s = 60
+#   max_reconnect_attempts = 0         - 0 = try forever
+#   stop_timeout_ms = 2000             - wait for threads to end on stop
+#
+# State changes are published on topic <node_name>/status
+#
+# ****************************************************************************
+
+NODE_STOPPED = "stopped"
+NODE_STARTING = "starting"
+NODE_RUNNING = "running"
+NODE_RECONNECTING = "reconnecting"
+NODE_STOPPING = "stopping"
+NODE_FAILED = "failed"
+
+
+def reconnect_delay(attempt:int,backoff_s:float,backoff_max_s:float):
+    """Exponential backoff with jitter, nodes which went down together do not reconnect in lockstep"""
+    delay = min(backoff_s * 2 ** max(attempt - 1,0),backoff_max_s)
+    return random.uniform(delay / 2,delay)
+
+
+class node_supervisor(QThread):
+    def __init__(self,check_period_s:float=0.5):
+        super().__init__()
+        self.check_period_s = check_period_s
+        self.nodes = []
+        self.nodes_lock = Lock()
+        self.stop_event = Event()
+
+    def add_node(self,node):
+        with self.nodes_lock:
+            self.nodes.append(node)
+
+    def remove_node(self,node):
+        with self.nodes_lock:
+            if node in self.nodes:
+                self.nodes.remove(node)
+
+    def run(self):
+        while not self.stop_event.wait(self.check_period_s):
+            with self.nodes_lock:
+                nodes = list(self.nodes)
+            for node in nodes:
+                try:
+                    self.check_node(node)
+                except Exception as e:
+                    print(f"Node supervisor: {type(e).__name__}: {e}")
+
+    def check_node(self,node):
+        if node.state == NODE_RUNNING and node.health.state == HEALTH_DOWN and node.auto_reconnect:
+            node.schedule_reconnect()
+        if node.state == NODE_RECONNECTING and time.monotonic() >= node.next_reconnect_time:
+            if self.stop_event.is_set():
+                return
+            if node.restart_node():
+                return
+            if node.max_reconnect_attempts and node.reconnect_attempts >= node.max_reconnect_attempts:
+                node.set_state(NODE_FAILED,f"{node.reconnect_attempts} reconnect attempts failed")
+            else:
+                node.schedule_reconnect()
+
+    def stop_process(self):
+        self.stop_event.set()
+        self.quit()
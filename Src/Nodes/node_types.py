@@ -0,0 +1,93 @@
+from Nodes.nodes_abstract import *
+from Nodes.process_host import *
+import importlib
+import importlib.util
+
+
+# ****************************************************************************
+#
+# Registry of node types. Node module (and bus library it needs) is imported
+# only when simulation config uses its type, so config with two sockets does
+# not pay for can, pyvisa, adb_shell or http.client at startup.
+#
+# User defined node type can be registered:
+#   - from python code:  register_node_type("MY_TYPE","User.device_drivers.my_node","my_node_thread")
+#   - from simulation config section:
+#         node_type = MY_TYPE
+#         node_module = User.device_drivers.my_node
+#         node_class = my_node_thread
+#
+# ****************************************************************************
+
+
+class node_type_entry():
+    __slots__ = ("module_path","class_name","dependencies","node_class")
+    def __init__(self,module_path:str,class_name:str,dependencies:tuple=(),node_class=None):
+        self.module_path = module_path
+        self.class_name = class_name
+        #top level modules needed by node, checked before import for clear error
+        self.dependencies = tuple(dependencies)
+        self.node_class = node_class
+
+
+node_types = {}
+
+
+def register_node_type(node_type:str,module_path:str=None,class_name:str=None,dependencies:tuple=(),node_class=None):
+    """Node class is given directly or by module path and class name (imported on first use)"""
+    if node_class is None and (module_path is None or class_name is None):
+        raise ValueError(f"Node type {node_type}: node_class or module_path and class_name are needed")
+    node_types[node_type] = node_type_entry(module_path,class_name,dependencies,node_class)
+
+
+register_node_type("CAN","Nodes.CAN_node","Can_node_thread",("can",))
+register_node_type("UART","Nodes.UART_node","UART_node_thread",("serial",))
+register_node_type("ETH_socket","Nodes.ETH_SOCKET_node","Eth_socket_node_thread")
+register_node_type("ETH_http","Nodes.ETH_HTTP_node","Eth_http_node_thread")
+register_node_type("GPIB","Nodes.GPIB_node","gpib_node_thread",("pyvisa",))
+register_node_type("LAN","Nodes.LAN_node","lan_node_thread",("pyvisa",))
+register_node_type("ADB","Nodes.ADB_node","ADB_node_thread",("adb_shell",))
+register_node_type("REPLAY","Nodes.Replay_node","Replay_node_thread")
+
+
+def missing_dependencies(node_type:str):
+    entry = node_types.get(node_type)
+    if entry is None:
+        return []
+    return [dependency for dependency in entry.dependencies if importlib.util.find_spec(dependency) is None]
+
+
+def node_class_for_type(node_type:str):
+    entry = node_types.get(node_type)
+    if entry is None:
+        return None
+    if entry.node_class is None:
+        missing = missing_dependencies(node_type)
+        if missing:
+            raise ImportError(f"Node type {node_type} needs missing packages: {', '.join(missing)}")
+        entry.node_class = getattr(importlib.import_module(entry.module_path),entry.class_name)
+    return entry.node_class
+
+
+def register_node_type_from_config(node_data:dict):
+    """Node type defined by node_module/node_class keys of simulation config section"""
+    node_type = node_data["node_type"]
+    if node_type in node_types or "node_module" not in node_data:
+        return
+    module = importlib.import_module(node_data["node_module"])
+    #module can register its types itself on import
+    if node_type not in node_types:
+        register_node_type(node_type,node_data["node_module"],node_data["node_class"])
+    node_types[node_type].node_class = node_types[node_type].node_class or getattr(module,node_types[node_type].class_name)
+
+
+def create_node(message_broker_queue:Queue,node_data:dict):
+    """Node from simulation config section, 'host = process' runs it in worker process"""
+    register_node_type_from_config(node_data)
+    node_class = node_class_for_type(node_data["node_type"])
+    if node_class is None:
+        print(f"Unknown node type: {node_data['node_type']}, available: {list(node_types)}")
+        return None
+    if node_data.get("host") == "process":
+        return process_node_thread(message_broker_queue,node_data)
+    return node_class(message_broker_queue,node_data)
@@ -1,29 +1,153 @@
 from Nodes.priv_dependencies import *
+from Nodes.transport import *
+from Nodes.message import *
+from Nodes.metrics import *
+from Nodes.correlation import *
+from Nodes.payload_pool import *
+from Nodes.node_health import *
+from Nodes.stream_framing import *
+from Nodes.reactor import *
+from Nodes.node_supervisor import *
+from Nodes.scpi_coalescing import *
+from Nodes.console_mirror import *
+from Nodes.line_classifier import *
+#payload codecs of CAN frames are registered in every process which decodes messages
+from Nodes.CAN_frames import *
+from threading import Lock
 
 
-class message_():
-    def __init__(self,topic:str=None,source:str=None,data=None,optional_params=None):
-        self.topic = topic
-        self.data = data
-        self.source = source
-        self.optional_params = optional_params
-
 
 
 class abstract_node(QThread):
     script_finished = pyqtSignal()
+    #how responses are matched with queries when config has no 'response_matcher' key
+    default_response_matcher = "fifo"
+    #commands (optional_params) answered by node itself with correlation_id, send_querry works without matcher
+    answered_commands = ()
+    #node implements reactor_* hooks and can run with 'io_mode = reactor'
+    reactor_capable = False
+    #stream nodes (socket, UART) split received bytes into messages with framer, see Nodes/stream_framing.py
+    default_framing = "raw"
+    #node can be stopped and initialized again by node_supervisor after connection loss
+    supports_reconnect = True
+    #exec'd user script can not be interrupted, its thread is terminated when it does not end in time
+    terminate_on_stop_timeout = False
     def __init__(self, message_broker_queue:Queue, config: dict):
         super().__init__()
-        self.own_que = Queue()
+        self.own_que = create_queue(node_transport_type(config),**node_queue_options(config))
+        self.reactor_connection = None
+        if self.uses_reactor(config):
+            self.own_que = reactor_outbox(self.own_que)
         self.message_broker_queue = message_broker_queue
         self.manipulator_thread = None
         self.listener_thread = None
         self.config = config
+        self.response_matcher = create_response_matcher(config,self.default_response_matcher)
+        self.health = node_health(int(config.get("errors_until_down",5)) if config else 5)
+        self.init_lifecycle(config or {})
         self.init_status = self.init_configuration()
+        self.register_health()
+
+    def init_lifecycle(self,config:dict):
+        self.state = NODE_STOPPED
+        self.lifecycle_lock = Lock()
+        self.auto_reconnect = self.supports_reconnect and config.get("auto_reconnect","1") == "1"
+        self.reconnect_backoff_s = float(config.get("reconnect_backoff_s",1))
+        self.reconnect_backoff_max_s = float(config.get("reconnect_backoff_max_s",60))
+        self.max_reconnect_attempts = int(config.get("max_reconnect_attempts",0))
+        self.stop_timeout_ms = int(config.get("stop_timeout_ms",2000))
+        self.reconnect_attempts = 0
+        self.next_reconnect_time = 0
+
+    def node_label(self):
+        return getattr(self,"name_of_node",None) or getattr(self,"node_name",None) or getattr(self,"name",None)
+
+    def register_health(self):
+        node_name = self.node_label()
+        if node_name:
+            register_node_health(node_name,self.health)
+            if self.config is not None:
+                register_node_query_support(node_name,self.response_matcher_name(),self.answered_commands)
+        if self.init_status is False:
+            self.health.mark_down("init_configuration failed")
+
+    def response_matcher_name(self):
+        return self.config.get("response_matcher",self.default_response_matcher)
 
     def run(self):
         self.create_sub_threads()
-        self.start_sub_threads()
+        if self.reactor_connection is None and isinstance(self.own_que,reactor_outbox):
+            self.attach_to_reactor()
+        else:
+            self.start_sub_threads()
+        self.set_state(NODE_RUNNING)
+
+    #Lifecycle, see Nodes/node_supervisor.py
+    #############################################
+    def set_state(self,state:str,detail=None):
+        if state == self.state:
+            return
+        self.state = state
+        node_name = self.node_label()
+        if node_name and self.message_broker_queue is not None:
+            data = {"status":state,"reconnects":self.reconnect_attempts,"detail":detail}
+            try:
+                self.message_broker_queue.put(message_(topic=node_name + "/status",source=node_name,data=data))
+            except Exception as e:
+                pass
+
+    def start_node(self):
+        """Start node threads, node which failed to init is left to node_supervisor to reconnect"""
+        with self.lifecycle_lock:
+            self.set_state(NODE_STARTING)
+            if self.init_status is False:
+                if self.auto_reconnect:
+                    self.schedule_reconnect()
+                else:
+                    self.set_state(NODE_FAILED,"init_configuration failed")
+                return
+            self.start()
+
+    def stop_node(self):
+        """Graceful stop: pending messages are sent, I/O is closed, threads end on their own"""
+        with self.lifecycle_lock:
+            self.set_state(NODE_STOPPING)
+            self.close_sub_threads()
+            self.set_state(NODE_STOPPED)
+
+    def restart_node(self):
+        """Close connection and initialize node again, returns False when init failed"""
+        with self.lifecycle_lock:
+            self.set_state(NODE_RECONNECTING)
+            self.close_sub_threads()
+            self.reconnect_attempts += 1
+            try:
+                self.init_status = self.init_configuration()
+            except Exception as e:
+                self.init_status = False
+            if self.init_status is False:
+                self.health.mark_down("reconnect failed")
+                return False
+            self.reactor_connection = None
+            self.health.mark_ok()
+            #sub threads are created on node thread again, not on thread of caller (node_supervisor, GUI)
+            self.wait(self.stop_timeout_ms)
+            self.set_state(NODE_STARTING)
+            self.start()
+            self.reconnect_attempts = 0
+            return True
+
+    def schedule_reconnect(self):
+        delay = reconnect_delay(self.reconnect_attempts + 1,self.reconnect_backoff_s,self.reconnect_backoff_max_s)
+        self.next_reconnect_time = time.monotonic() + delay
+        self.set_state(NODE_RECONNECTING,f"next attempt in {delay:.1f} s")
+
+    def uses_reactor(self,config:dict):
+        return self.reactor_capable and node_io_mode(config) == "reactor" and self.reactor_supported()
+
+    #override when reactor mode depends on platform
+    def reactor_supported(self):
+        return True
 
     #Override this with init configuration of node eg. open uart port 
     def init_configuration(self):
@@ -37,47 +161,171 @@ class abstract_node(QThread):
     def end_func(self):
         pass
 
+    def configure_sub_threads(self):
+        self.manipulator_thread.response_matcher = self.response_matcher
+        self.listener_thread.response_matcher = self.response_matcher
+        self.listener_thread.health = self.health
+        self.manipulator_thread.coalescer = create_scpi_coalescer(self.config)
+        if self.config:
+            self.listener_thread.error_backoff_max_s = float(self.config.get("error_backoff_max_s",2))
+
     def start_sub_threads(self):
+        self.configure_sub_threads()
         self.manipulator_thread.start()
         self.listener_thread.start()
 
+    #Listener and manipulator are not started, their work is done by shared io_reactor
+    def attach_to_reactor(self):
+        self.configure_sub_threads()
+        self.reactor_prepare()
+        reactor = get_io_reactor()
+        self.reactor_connection = reactor_connection(self,reactor)
+        self.reactor_bind_writer(self.reactor_connection.writer)
+        reactor.add_connection(self.reactor_connection)
+
+    #Reactor hooks, override in nodes with reactor_capable = True
+    #switch connection to non-blocking mode
+    def reactor_prepare(self):
+        pass
+
+    #object with fileno() registered in selector
+    def reactor_fileobj(self):
+        return None
+
+    #bytes available now, raise EOFError when connection was closed by peer
+    def reactor_read(self):
+        return b""
+
+    #alternative to reactor_read: receive into framer buffer, return number of bytes, None = use reactor_read
+    def reactor_read_into(self,view):
+        return None
+
+    #write as much as possible without blocking, return number of written bytes
+    def reactor_write(self,data):
+        return 0
+
+    #framing of node config, default_framing when config has no 'framing' key
+    def reactor_framer(self):
+        return create_framer(self.config,self.default_framing)
+
+    #message_ published for received frame (decoded by framer)
+    def reactor_message(self,frame_data):
+        return None
+
+    #messages of frames from one read
+    def reactor_publish(self,msgs:list):
+        self.listener_thread.publish_lines(msgs)
+
+    #give manipulator reactor_writer in place of its socket / port
+    def reactor_bind_writer(self,writer:reactor_writer):
+        pass
+
     def close_sub_threads(self):
-        self.manipulator_thread.stop_process()
-        self.listener_thread.stop_process()
-        self.manipulator_thread.terminate()
-        self.listener_thread.terminate()
+        if self.manipulator_thread is not None:
+            if self.reactor_connection is not None:
+                self.close_reactor_connection()
+            elif self.manipulator_thread.isRunning():
+                #stop_sentinel is queued after pending messages, manipulator sends them and ends
+                self.manipulator_thread.stop_process()
+                self.manipulator_thread.wait(self.stop_timeout_ms)
+            self.listener_thread.stop_process()
+        #closing I/O also wakes up listener blocked in read
         try:
             self.end_func()
         except Exception as e:
-            pass
+            print(f"{self.node_label()}: end_func error: {e}")
+        if self.manipulator_thread is not None:
+            for thread in (self.manipulator_thread,self.listener_thread):
+                if not thread.wait(self.stop_timeout_ms):
+                    if self.terminate_on_stop_timeout:
+                        thread.terminate()
+                    else:
+                        print(f"{self.node_label()}: {type(thread).__name__} did not stop in {self.stop_timeout_ms} ms")
+
+    def close_reactor_connection(self):
+        connection = self.reactor_connection
+        if connection.registered:
+            #stop_sentinel ends connection after pending writes
+            self.own_que.put(stop_sentinel())
+            connection.closed_event.wait(self.stop_timeout_ms / 1000)
+        connection.reactor.remove_connection(connection)
+        connection.closed_event.wait(self.stop_timeout_ms / 1000)
+        self.own_que.connection = None
 
     def stop_process(self):
-        self.close_sub_threads()
+        self.stop_node()
         self.quit()
-        self.terminate()
 
 
 class abstract_node_listener_thread(QThread):
+    error_backoff_start_s = 0.01
     def __init__(self):
         super().__init__()
         self.control_flag = [True]
+        self.stop_event = Event()
+        self.response_matcher = None
+        self.health = node_health()
+        self.error_backoff_max_s = 2
+        #text lines are published on '<topic>/<class>' sub-topics, see Nodes/line_classifier.py
+        self.line_classifier = None
+        self.publish_base_topic = False
         
     def run(self):
-        while True:
-            if self.control_flag[0]:
-                try:
-                    self.main_func()
-                except Exception as e:
-                    pass
-            else:
-                break
+        backoff_s = self.error_backoff_start_s
+        while self.control_flag[0]:
+            try:
+                self.main_func()
+                self.health.mark_ok()
+                backoff_s = self.error_backoff_start_s
+            except Exception as e:
+                if not self.control_flag[0]:
+                    break
+                error_class = classify_error(e)
+                if error_class == ERROR_TIMEOUT:
+                    #no data in read timeout is not an error
+                    continue
+                if isinstance(e,EOFError):
+                    #peer closed connection, node_supervisor reconnects
+                    self.health.mark_down(str(e) or "connection closed")
+                    self.stop_event.wait(self.error_backoff_max_s)
+                    continue
+                if error_class == ERROR_OTHER and self.health.total_errors == 0:
+                    print(f"{type(self).__name__}: {traceback.format_exc()}")
+                self.health.mark_error(e)
+                #closed socket or failed VISA read would otherwise spin at 100% CPU
+                self.stop_event.wait(backoff_s)
+                backoff_s = min(backoff_s * 2,self.error_backoff_max_s)
 
     #override -> main communication spefific func
     def main_func(self):
         pass
 
+    #Send received data to broker, data answering pending query is tagged with its correlation id
+    #answer of command handled by node itself already has correlation id
+    def publish(self,msg:message_):
+        if msg.correlation_id is None and self.response_matcher is not None and self.response_matcher.has_pending():
+            msg.correlation_id = self.response_matcher.match(msg.data)
+        self.message_broker_queue.put(msg)
+
+    #Send messages of one read, lines are classified together
+    def publish_lines(self,msgs:list):
+        if self.line_classifier is None:
+            for msg in msgs:
+                self.publish(msg)
+            return
+        classes = self.line_classifier.classify([msg.data if isinstance(msg.data,str) else "" for msg in msgs])
+        for msg, class_name in zip(msgs,classes):
+            base_topic = msg.topic
+            msg.topic = f"{base_topic}/{class_name}"
+            self.publish(msg)
+            if self.publish_base_topic:
+                #same line for subscribers of node topic, already matched with query
+                self.message_broker_queue.put(message_(topic=base_topic,source=msg.source,data=msg.data,correlation_id=msg.correlation_id,
+                                                       timestamp_ns=msg.timestamp_ns,seq=msg.seq))
+
     def stop_process(self):
         self.control_flag[0] = False
+        self.stop_event.set()
         self.quit()
 
 
@@ -85,25 +333,72 @@ class abstract_node_manipulator_thread(QThread):
     def __init__(self,node_queue:Queue):
         super().__init__()
         self.node_queue = node_queue
-        self.control_flag = [True]
+        self.response_matcher = None
+        #merges consecutive SCPI writes, see Nodes/scpi_coalescing.py
+        self.coalescer = None
 
     def run(self):
-        while self.control_flag[0]:
+        #Blocking get - thread sleeps until message arrives, stop_process wakes it with sentinel
+        while True:
             try:
-                if self.node_queue.empty():
-                    time.sleep(0.001)
-                else:
+                timeout = self.idle_timeout()
+                msg = self.node_queue.get() if timeout is None else self.node_queue.get(timeout=timeout)
+            except Empty:
+                self.run_on_idle()
+                continue
+            except Exception as e:
+                continue
+            if isinstance(msg,stop_sentinel):
+                self.run_on_idle()
+                break
+            if isinstance(msg,message_batch):
+                for batched_msg in msg.messages:
                     try:
-                        self.callback_router(self.node_queue.get())
+                        self.dispatch(batched_msg)
                     except Exception as e:
                         pass
-            except Exception as e:
-                pass
+            else:
+                try:
+                    self.dispatch(msg)
+                except Exception as e:
+                    pass
+
+    def dispatch(self,msg):
+        broker_metrics_instance.record_delivery(msg)
+        #query is registered before it is written, so its answer can not be missed by listener
+        if msg.correlation_id is not None and self.response_matcher is not None:
+            self.response_matcher.on_request(msg)
+        self.callback_router(msg)
 
     #Override for different options in sending data out
     def callback_router(self,msg):
         pass
 
+    #seconds to wait for next message before on_idle(), None = wait forever
+    def idle_timeout(self):
+        if self.coalescer is not None:
+            return self.coalescer.timeout()
+        return None
+
+    #called when idle_timeout passed without message, when queue is drained in reactor mode and before stop
+    def on_idle(self):
+        if self.coalescer is not None:
+            self.coalescer.flush()
+
+    def run_on_idle(self):
+        try:
+            self.on_idle()
+        except Exception as e:
+            print(f"{type(self).__name__}: {type(e).__name__}: {e}")
+
+    def write_scpi(self,msg,write_func):
+        """write_func(data) sends data to instrument, consecutive writes are joined when scpi_coalesce is on"""
+        if self.coalescer is None:
+            write_func(msg.data)
+        else:
+            self.coalescer.write(msg.data,msg.correlation_id is not None,write_func)
+
     def stop_process(self):
-        self.control_flag[0] = False
+        #messages queued before sentinel are still sent
+        self.node_queue.put(stop_sentinel())
         self.quit()
\ No newline at end of file
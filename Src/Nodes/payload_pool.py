@@ -0,0 +1,174 @@
+from Nodes.message import register_payload_codec
+from multiprocessing import shared_memory
+from threading import Lock
+
+
+# ****************************************************************************
+#
+# Zero-copy path for bulk payloads (VNA traces, waveform catalogs, ADB dumps,
+# CAN bursts). Payload is written once into shared memory block from pool and
+# only small payload_handle travels through broker and subscriber queues.
+#
+# Reference counting:
+#   - producer gets handle with 1 reference
+#   - message_broker adds reference for every additional subscriber
+#   - every consumer calls handle.release() (or uses "with handle as view:")
+#   - block returns to pool when last reference is released
+#
+# Blocks are owned by pool of process which allocated them. At process
+# boundary (ring of hosted worker, 'process' transport) payload is copied into
+# message bytes and reference of that message is released, other process gets
+# bytes. Handle dropped by full bounded queue is released by the queue.
+#
+# Handles are published only by producers whose every subscriber releases them
+# (trace recorder does), node listeners publish plain bytes - user script
+# buffers, manipulators and GUI keep payload and never release it.
+#
+# ****************************************************************************
+
+
+class payload_block():
+    __slots__ = ("shm","size_class","references")
+    def __init__(self,shm,size_class:int):
+        self.shm = shm
+        self.size_class = size_class
+        self.references = 0
+
+
+class payload_pool():
+    min_block_size = 64 * 1024
+    max_free_blocks_per_class = 8
+
+    def __init__(self):
+        self.lock = Lock()
+        #size class -> free blocks
+        self.free_blocks = {}
+        #shm name -> block in use
+        self.used_blocks = {}
+
+    def size_class_for(self,nbytes:int):
+        size_class = self.min_block_size
+        while size_class < nbytes:
+            size_class <<= 1
+        return size_class
+
+    def allocate(self,nbytes:int,dtype:str=None,shape:tuple=None):
+        """Handle to uninitialized block, producer writes directly into handle.view() (eg. recv_into)"""
+        size_class = self.size_class_for(nbytes)
+        with self.lock:
+            free_blocks = self.free_blocks.get(size_class)
+            block = free_blocks.pop() if free_blocks else None
+        if block is None:
+            block = payload_block(shared_memory.SharedMemory(create=True,size=size_class),size_class)
+        block.references = 1
+        with self.lock:
+            self.used_blocks[block.shm.name] = block
+        return payload_handle(block.shm.name,nbytes,dtype,shape,self)
+
+    def store(self,data,dtype:str=None,shape:tuple=None):
+        """Copy bytes-like data (or NumPy array) into pool, the only copy on the way to consumers"""
+        source = memoryview(data).cast("B")
+        if dtype is None and hasattr(data,"dtype"):
+            dtype = data.dtype.str
+            shape = data.shape
+        handle = self.allocate(source.nbytes,dtype,shape)
+        handle.view()[:] = source
+        return handle
+
+    def retain(self,shm_name:str,count:int):
+        with self.lock:
+            block = self.used_blocks.get(shm_name)
+            if block is None:
+                return
+            block.references += count
+            if block.references > 0:
+                return
+            self.used_blocks.pop(shm_name)
+            free_blocks = self.free_blocks.setdefault(block.size_class,[])
+            if len(free_blocks) < self.max_free_blocks_per_class:
+                free_blocks.append(block)
+                return
+        self.destroy_block(block)
+
+    def buffer_of(self,shm_name:str):
+        return self.used_blocks[shm_name].shm.buf
+
+    def destroy_block(self,block:payload_block):
+        try:
+            block.shm.close()
+            block.shm.unlink()
+        except BufferError:
+            #consumer still holds view of released block, memory is freed with process
+            pass
+
+    def close(self):
+        with self.lock:
+            blocks = [block for free_blocks in self.free_blocks.values() for block in free_blocks]
+            self.free_blocks.clear()
+        for block in blocks:
+            self.destroy_block(block)
+
+
+
+class payload_handle():
+    __slots__ = ("shm_name","length","dtype","shape","pool")
+
+    def __init__(self,shm_name:str,length:int,dtype:str=None,shape:tuple=None,pool:payload_pool=None):
+        self.shm_name = shm_name
+        self.length = length
+        self.dtype = dtype
+        self.shape = shape
+        self.pool = pool
+
+    #block can not be shared with other process, eg. handle inside pickled dict arrives as bytes
+    def __reduce__(self):
+        return (bytes,(self.tobytes(),))
+
+    def __len__(self):
+        return self.length
+
+    def __repr__(self):
+        return f"payload_handle({self.shm_name!r}, length={self.length}, dtype={self.dtype!r}, shape={self.shape!r})"
+
+    def view(self):
+        """memoryview of payload, valid until release()"""
+        return self.pool.buffer_of(self.shm_name)[:self.length]
+
+    def as_array(self):
+        """NumPy view of payload without copy, valid until release()"""
+        import numpy as np
+        array = np.frombuffer(self.view(),dtype=np.dtype(self.dtype or "u1"))
+        return array.reshape(self.shape) if self.shape is not None else array
+
+    def tobytes(self):
+        return bytes(self.view())
+
+    def retain(self,count:int=1):
+        if self.pool is not None:
+            self.pool.retain(self.shm_name,count)
+
+    def release(self):
+        self.retain(-1)
+
+    def __enter__(self):
+        return self.view()
+
+    def __exit__(self,*args):
+        self.release()
+
+
+
+#Process boundary - copy of payload, reference of serialized message is consumed
+PAYLOAD_POOLED_BYTES = 18
+
+def encode_pooled_payload(handle:payload_handle):
+    data = handle.tobytes()
+    handle.release()
+    return data
+
+
+register_payload_codec(PAYLOAD_POOLED_BYTES,payload_handle,encode_pooled_payload,bytes)
+
+
+#Shared by all nodes of process
+payload_pool_instance = payload_pool()
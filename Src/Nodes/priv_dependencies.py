@@ -1,18 +1,13 @@
 #Modules import
+#Bus libraries (can, pyvisa, serial, adb_shell, http.client) are imported by node modules, see Nodes/node_types.py
 from PyQt5.QtCore import QThread, pyqtSignal,QTimer
 from multiprocessing import Queue
-from threading import Thread
+from queue import Empty
+from threading import Thread, Event
 import time
-from can import interface
 import json
-import http.client as http
-import ssl
 import socket
-from serial import Serial
 import sys
-import debugpy
 import traceback
-import pyvisa
 import os
 from pathlib import Path
-from adb_shell.adb_device import AdbDeviceTcp, AdbDeviceUsb
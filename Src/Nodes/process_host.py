@@ -0,0 +1,202 @@
+from Nodes.nodes_abstract import *
+from Nodes.shm_ring_buffer import shm_ring_buffer
+import multiprocessing
+import queue
+
+# ****************************************************************************
+#
+# Hosting of node in worker process. Node selected with 'host = process' in
+# simulation config runs in its own process (own GIL) and is connected to broker
+# through two shared memory rings. In GUI process it is represented by
+# process_node_thread, which forwards messages and supervises worker process.
+#
+# Node config keys:
+#   host = process
+#   ring_size = 4194304      - bytes of each ring
+#   max_restarts = 3         - restarts of crashed worker before node is marked failed
+#   ring_put_timeout_s = 1   - message for stalled worker is dropped (counted) after this time
+#
+# Worker status is published on topic <node_name>/status
+#
+# ****************************************************************************
+
+STOP_HOSTED_NODE = "STOP_HOSTED_NODE"
+
+
+#Worker process
+###################################################################################
+def hosted_node_main(config:dict,to_node_ring:shm_ring_buffer,from_node_ring:shm_ring_buffer,status_queue:Queue):
+    from Nodes.node_types import node_class_for_type, register_node_type_from_config
+    pid = os.getpid()
+    node = None
+    try:
+        register_node_type_from_config(config)
+        node_class = node_class_for_type(config["node_type"])
+        node = node_class(from_node_ring,config)
+        if node.init_status is False:
+            raise RuntimeError(f"init_configuration of {config['node_name']} failed")
+        node.start()
+        status_queue.put(("running",pid,None))
+        while True:
+            msg = to_node_ring.get()
+            if msg.optional_params == STOP_HOSTED_NODE:
+                break
+            node.own_que.put(msg)
+        node.stop_process()
+        status_queue.put(("stopped",pid,None))
+    except Exception:
+        status_queue.put(("error",pid,traceback.format_exc()))
+        sys.exit(1)
+    finally:
+        to_node_ring.close()
+        from_node_ring.close()
+
+
+
+#GUI process side
+###################################################################################
+class process_node_thread(abstract_node):
+    #worker process is restarted by process_node_supervisor_thread
+    supports_reconnect = False
+    def __init__(self,message_broker_queue:Queue,config:dict):
+        super().__init__(message_broker_queue,config)
+
+    def init_configuration(self):
+        self.name_of_node = self.config["node_name"]
+        #queries are matched with responses by node in worker process
+        self.response_matcher = None
+        ring_size = int(self.config.get("ring_size",4 * 1024 * 1024))
+        self.max_restarts = int(self.config.get("max_restarts",3))
+        self.to_node_ring = shm_ring_buffer(ring_size)
+        self.from_node_ring = shm_ring_buffer(ring_size)
+        self.status_queue = Queue()
+        self.process = None
+        self.stopping = False
+        self.restarts = 0
+        try:
+            self.start_hosted_process()
+            return True
+        except Exception as e:
+            print(f"Process node {self.name_of_node}: start of worker failed: {e}")
+            return False
+
+    #queries are matched by node in worker, send_querry check uses its matcher
+    def response_matcher_name(self):
+        from Nodes.node_types import node_class_for_type
+        try:
+            hosted_class = node_class_for_type(self.config["node_type"])
+        except ImportError:
+            #dependencies of hosted node can be installed only for worker interpreter
+            hosted_class = None
+        if hosted_class is None:
+            return super().response_matcher_name()
+        self.answered_commands = hosted_class.answered_commands
+        return self.config.get("response_matcher",hosted_class.default_response_matcher)
+
+    def start_hosted_process(self):
+        self.process = multiprocessing.Process(target=hosted_node_main,
+                                               args=(self.config,self.to_node_ring,self.from_node_ring,self.status_queue),
+                                               name=f"node_{self.name_of_node}",daemon=True)
+        self.process.start()
+
+    def create_sub_threads(self):
+        self.manipulator_thread = process_node_manipulator_thread(self.own_que,self.to_node_ring,self.name_of_node,
+                                                                  float(self.config.get("ring_put_timeout_s",1)))
+        self.listener_thread = process_node_listener_thread(self.message_broker_queue,self.from_node_ring)
+        self.supervisor_thread = process_node_supervisor_thread(self)
+
+    def start_sub_threads(self):
+        super().start_sub_threads()
+        self.supervisor_thread.start()
+
+    def publish_status(self,status:str,detail=None):
+        data = {"status":status,"restarts":self.restarts,"detail":detail}
+        if status == "running":
+            self.health.mark_ok()
+        elif status in ("error","failed"):
+            self.health.mark_down(f"worker {status}")
+        self.message_broker_queue.put(message_(topic=self.name_of_node + "/status",source=self.name_of_node,data=data))
+
+    def end_func(self):
+        self.stopping = True
+        self.supervisor_thread.stop_process()
+        self.supervisor_thread.wait(1000)
+        try:
+            self.to_node_ring.put(message_(source=self.name_of_node,optional_params=STOP_HOSTED_NODE),timeout=1)
+        except queue.Full:
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            #worker did not stop on request, it is separate process so it can be killed safely
+            self.process.terminate()
+            self.process.join(1)
+        self.to_node_ring.close()
+        self.from_node_ring.close()
+
+
+class process_node_supervisor_thread(QThread):
+    def __init__(self,node:process_node_thread):
+        super().__init__()
+        self.node = node
+        self.control_flag = [True]
+
+    def run(self):
+        while self.control_flag[0]:
+            try:
+                status, pid, detail = self.node.status_queue.get(timeout=0.5)
+                if status == "error":
+                    print(f"Process node {self.node.name_of_node} error:\n{detail}")
+                self.node.publish_status(status,detail)
+            except queue.Empty:
+                pass
+            if not self.node.process.is_alive() and not self.node.stopping and self.control_flag[0]:
+                self.handle_crash()
+
+    def handle_crash(self):
+        exitcode = self.node.process.exitcode
+        if self.node.restarts >= self.node.max_restarts:
+            self.node.publish_status("failed",f"exit code {exitcode}")
+            self.control_flag[0] = False
+            return
+        self.node.restarts += 1
+        self.node.publish_status("restarting",f"exit code {exitcode}")
+        time.sleep(min(2 ** self.node.restarts,30))
+        if self.control_flag[0]:
+            self.node.start_hosted_process()
+
+    def stop_process(self):
+        self.control_flag[0] = False
+        self.quit()
+
+
+class process_node_listener_thread(abstract_node_listener_thread):
+    def __init__(self,message_broker_queue,from_node_ring:shm_ring_buffer):
+        super().__init__()
+        self.message_broker_queue = message_broker_queue
+        self.from_node_ring = from_node_ring
+
+    def main_func(self):
+        try:
+            msg = self.from_node_ring.get(timeout=0.2)
+        except queue.Empty:
+            #idle read, health stays as set by worker status (mark_ok would hide crashed worker)
+            raise TimeoutError
+        self.message_broker_queue.put(msg)
+
+
+class process_node_manipulator_thread(abstract_node_manipulator_thread):
+    def __init__(self,node_queue:Queue,to_node_ring:shm_ring_buffer,name_of_node:str=None,put_timeout_s:float=1.0):
+        super().__init__(node_queue)
+        self.to_node_ring = to_node_ring
+        self.name_of_node = name_of_node
+        self.put_timeout_s = put_timeout_s
+        self.dropped = 0
+
+    def callback_router(self,msg):
+        try:
+            self.to_node_ring.put(msg,timeout=self.put_timeout_s)
+        except queue.Full:
+            #stalled worker must not block manipulator (and stop of node) forever
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 100 == 0:
+                print(f"Process node {self.name_of_node}: worker does not read, {self.dropped} messages dropped")
@@ -0,0 +1,294 @@
+from Nodes.message import message_batch, stop_sentinel
+from Nodes.node_health import *
+from Nodes.stream_framing import *
+from threading import Thread, Lock, Event
+import selectors
+import socket
+import queue
+
+
+# ****************************************************************************
+#
+# Single thread I/O reactor. Node with 'io_mode = reactor' in simulation config
+# does not start its listener and manipulator threads, its connection is
+# multiplexed with all other reactor nodes on one selectors loop:
+#   - readable connection -> non-blocking read -> framer (Nodes/stream_framing.py) -> node.reactor_publish()
+#   - message in node queue -> manipulator.dispatch() -> write buffer -> non-blocking write
+#
+# Listener and manipulator objects of node are still created and reused, so
+# callback_router, response matching, metrics and health work as in thread mode.
+#
+# Supported: ETH_socket (all platforms), UART (POSIX, serial port has file descriptor).
+# ETH_http keeps threads, http.client has no non-blocking API.
+#
+# Node config keys:
+#   io_mode = thread | reactor
+#
+# ****************************************************************************
+
+
+#Queue of node in reactor mode, put wakes up reactor so message is written without polling
+###################################################################################
+class reactor_outbox():
+    def __init__(self,inner_queue):
+        self.inner_queue = inner_queue
+        self.connection = None
+
+    def put(self,item,block:bool=True,timeout:float=None):
+        self.inner_queue.put(item,block,timeout)
+        connection = self.connection
+        if connection is not None:
+            connection.reactor.notify(connection)
+
+    def get(self,block:bool=True,timeout:float=None):
+        return self.inner_queue.get(block,timeout)
+
+    def get_nowait(self):
+        return self.inner_queue.get_nowait()
+
+    def empty(self):
+        return self.inner_queue.empty()
+
+    def qsize(self):
+        return self.inner_queue.qsize()
+
+    @property
+    def dropped_per_topic(self):
+        return getattr(self.inner_queue,"dropped_per_topic",{})
+
+
+#Replaces socket / serial port in manipulator, writes go to write buffer of connection
+class reactor_writer():
+    def __init__(self,connection):
+        self.connection = connection
+
+    def write(self,data):
+        self.connection.write_buffer += data
+        return len(data)
+
+    def send(self,data):
+        return self.write(data)
+
+    def sendall(self,data):
+        self.write(data)
+
+
+
+class reactor_connection():
+    read_size = 65536
+
+    def __init__(self,node,reactor):
+        self.node = node
+        self.reactor = reactor
+        self.fileobj = node.reactor_fileobj()
+        self.framer = node.reactor_framer()
+        self.write_buffer = bytearray()
+        self.writer = reactor_writer(self)
+        self.registered = False
+        self.closing = False
+        self.closed_event = Event()
+
+    def events(self):
+        return selectors.EVENT_READ | (selectors.EVENT_WRITE if self.write_buffer else 0)
+
+    def update_events(self):
+        if self.registered:
+            self.reactor.selector.modify(self.fileobj,self.events(),self)
+
+    def handle_readable(self):
+        try:
+            with self.framer.write_view() as view:
+                received = self.node.reactor_read_into(view)
+            data = self.node.reactor_read() if received is None else None
+        except (BlockingIOError,InterruptedError):
+            #readiness was spurious, nothing to read yet
+            return
+        except Exception as e:
+            self.handle_error(e)
+            return
+        if not received and not data:
+            return
+        try:
+            frames = self.framer.commit(received) if received else self.framer.feed(data)
+            self.node.reactor_publish([self.node.reactor_message(frame_data) for frame_data in frames])
+        except Exception as e:
+            print(f"Reactor {self.node.name_of_node}: {type(e).__name__}: {e}")
+        self.node.health.mark_ok()
+
+    def drain_outbox(self):
+        manipulator = self.node.manipulator_thread
+        while True:
+            try:
+                msg = self.node.own_que.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(msg,stop_sentinel):
+                self.closing = True
+                continue
+            for msg in (msg.messages if isinstance(msg,message_batch) else (msg,)):
+                try:
+                    manipulator.dispatch(msg)
+                except Exception as e:
+                    print(f"Reactor {self.node.name_of_node}: {type(e).__name__}: {e}")
+        #eg. coalesced SCPI writes of whole drained burst go out as one line
+        manipulator.run_on_idle()
+        self.flush()
+
+    def flush(self):
+        while self.write_buffer:
+            try:
+                written = self.node.reactor_write(self.write_buffer)
+            except (BlockingIOError,InterruptedError):
+                written = 0
+            except Exception as e:
+                self.handle_error(e)
+                return
+            if not written:
+                break
+            del self.write_buffer[:written]
+        if self.closing and not self.write_buffer:
+            self.reactor.unregister_connection(self)
+        else:
+            self.update_events()
+
+    def handle_error(self,error:Exception):
+        error_class = classify_error(error)
+        if error_class == ERROR_TIMEOUT:
+            return
+        first_error = self.node.health.total_errors == 0
+        if isinstance(error,EOFError):
+            self.node.health.mark_down(str(error) or "connection closed")
+        else:
+            self.node.health.mark_error(error)
+        if error_class == ERROR_OTHER and first_error:
+            print(f"Reactor {self.node.name_of_node}: {type(error).__name__}: {error}")
+        if error_class == ERROR_IO or self.node.health.state == HEALTH_DOWN:
+            #broken connection (or read failing every time) would be reported readable forever and spin reactor,
+            #node_supervisor reconnects node which is down
+            self.reactor.unregister_connection(self)
+
+
+
+class io_reactor(Thread):
+    def __init__(self):
+        super().__init__(daemon=True,name="io_reactor")
+        self.selector = selectors.DefaultSelector()
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.wakeup_reader.setblocking(False)
+        self.wakeup_writer.setblocking(False)
+        self.selector.register(self.wakeup_reader,selectors.EVENT_READ,None)
+        self.wakeup_pending = False
+        self.pending_calls = queue.SimpleQueue()
+        self.ready_connections = queue.SimpleQueue()
+        self.connections = set()
+        self.running = True
+
+    #Thread safe part, called by broker, nodes and GUI
+    def wakeup(self):
+        if not self.wakeup_pending:
+            self.wakeup_pending = True
+            try:
+                self.wakeup_writer.send(b"\0")
+            except OSError:
+                #socket buffer full, reactor is already woken up
+                pass
+
+    def call_soon(self,func,*args):
+        self.pending_calls.put((func,args))
+        self.wakeup()
+
+    def notify(self,connection:reactor_connection):
+        self.ready_connections.put(connection)
+        self.wakeup()
+
+    def add_connection(self,connection:reactor_connection):
+        self.call_soon(self.register_connection,connection)
+
+    def remove_connection(self,connection:reactor_connection):
+        self.call_soon(self.unregister_connection,connection)
+
+    def stop_process(self):
+        self.running = False
+        self.wakeup()
+
+    #Reactor thread
+    def register_connection(self,connection:reactor_connection):
+        self.selector.register(connection.fileobj,connection.events(),connection)
+        connection.registered = True
+        self.connections.add(connection)
+        connection.node.own_que.connection = connection
+        #messages queued before node was attached
+        connection.drain_outbox()
+
+    def unregister_connection(self,connection:reactor_connection):
+        if connection.registered:
+            connection.registered = False
+            self.connections.discard(connection)
+            try:
+                self.selector.unregister(connection.fileobj)
+            except (KeyError,ValueError):
+                pass
+        connection.closed_event.set()
+
+    def handle_wakeup(self):
+        try:
+            while self.wakeup_reader.recv(4096):
+                pass
+        except (BlockingIOError,InterruptedError):
+            pass
+        #cleared before draining, so put after drain sends new wakeup
+        self.wakeup_pending = False
+        while True:
+            try:
+                func, args = self.pending_calls.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                func(*args)
+            except Exception as e:
+                print(f"Reactor: {type(e).__name__}: {e}")
+        while True:
+            try:
+                connection = self.ready_connections.get_nowait()
+            except queue.Empty:
+                break
+            if connection.registered:
+                connection.drain_outbox()
+
+    def run(self):
+        while self.running:
+            for key, mask in self.selector.select():
+                connection = key.data
+                if connection is None:
+                    self.handle_wakeup()
+                    continue
+                if mask & selectors.EVENT_READ and connection.registered:
+                    connection.handle_readable()
+                if mask & selectors.EVENT_WRITE and connection.registered:
+                    connection.flush()
+        for connection in list(self.connections):
+            self.unregister_connection(connection)
+        self.selector.close()
+        self.wakeup_reader.close()
+        self.wakeup_writer.close()
+
+
+
+#One reactor shared by all nodes of process, started with first reactor node
+io_reactor_instance = None
+io_reactor_lock = Lock()
+
+def get_io_reactor():
+    global io_reactor_instance
+    with io_reactor_lock:
+        if io_reactor_instance is None or not io_reactor_instance.is_alive():
+            io_reactor_instance = io_reactor()
+            io_reactor_instance.start()
+        return io_reactor_instance
+
+
+def node_io_mode(config:dict):
+    """'thread' (listener + manipulator thread per node) or 'reactor', set by 'io_mode' key in node config"""
+    if config:
+        return config.get("io_mode","thread")
+    return "thread"
@@ -0,0 +1,92 @@
+import time
+
+
+# ****************************************************************************
+#
+# SCPI write coalescing. Drivers send setup sequences as many tiny writes,
+# every one is separate message, broker round and instrument write. With
+# coalescing on, consecutive writes to instrument are joined into one
+# ';'-separated SCPI line:
+#
+#   ROUT1;PORT:RES RF1A,VSA1    \
+#   VSA1;RFC:USE "RF1A"          >  ROUT1;PORT:RES RF1A,VSA1;:VSA1;RFC:USE "RF1A";:CHAN1;...
+#   CHAN1;...                   /
+#
+# Commands after first are prefixed with ':' (absolute header path), so
+# joining does not change meaning of commands. Query (correlation_id or '?')
+# ends line and is written together with writes before it, so order around
+# queries is kept and response matching is unchanged.
+#
+# Line is written when:
+#   - query is added
+#   - line would exceed max_bytes
+#   - max_delay after first pending write passed (next write or manipulator idle timeout)
+#   - node queue is drained (reactor mode) or node stops
+#
+# Node config keys (GPIB, LAN, ETH_socket):
+#   scpi_coalesce = 0 | 1
+#   scpi_coalesce_max_bytes = 512
+#   scpi_coalesce_max_delay_ms = 2
+#
+# ****************************************************************************
+
+
+class scpi_coalescer():
+    def __init__(self,max_bytes:int=512,max_delay_s:float=0.002):
+        self.max_bytes = max_bytes
+        self.max_delay_s = max_delay_s
+        self.pending = []
+        self.pending_bytes = 0
+        self.terminator = ""
+        self.write_func = None
+        self.deadline = None
+        self.lines_written = 0
+        self.commands_written = 0
+
+    def write(self,command:str,is_query:bool,write_func):
+        """write_func(line) sends line to instrument"""
+        if type(command) is not str:
+            self.flush()
+            write_func(command)
+            return
+        stripped = command.rstrip("\r\n")
+        terminator = command[len(stripped):]
+        #steady stream of writes never lets manipulator idle timeout fire, deadline is checked here too
+        if self.pending and (terminator != self.terminator or write_func != self.write_func
+                             or self.pending_bytes + len(stripped) + 2 > self.max_bytes
+                             or time.monotonic() >= self.deadline):
+            self.flush()
+        if self.pending and not stripped.startswith(("*",":")):
+            stripped = ":" + stripped
+        if not self.pending:
+            self.terminator = terminator
+            self.write_func = write_func
+            self.deadline = time.monotonic() + self.max_delay_s
+        self.pending.append(stripped)
+        self.pending_bytes += len(stripped) + 1
+        if is_query or "?" in stripped or self.pending_bytes >= self.max_bytes:
+            self.flush()
+
+    def timeout(self):
+        """Seconds until pending line has to be written, None when nothing is pending"""
+        if not self.pending:
+            return None
+        return max(self.deadline - time.monotonic(),0)
+
+    def flush(self):
+        if not self.pending:
+            return
+        line = ";".join(self.pending) + self.terminator
+        self.commands_written += len(self.pending)
+        self.lines_written += 1
+        self.pending = []
+        self.pending_bytes = 0
+        self.deadline = None
+        self.write_func(line)
+
+
+def create_scpi_coalescer(config:dict):
+    if not config or config.get("scpi_coalesce","0") != "1":
+        return None
+    return scpi_coalescer(int(config.get("scpi_coalesce_max_bytes",512)),
+                          float(config.get("scpi_coalesce_max_delay_ms",2)) / 1000)
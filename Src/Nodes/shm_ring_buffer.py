@@ -0,0 +1,126 @@
+from Nodes.message import message_
+from multiprocessing import shared_memory, Event
+from threading import Lock
+import queue
+import struct
+import time
+
+
+#Single producer process / single consumer process ring buffer in multiprocessing.shared_memory
+#Producer moves only write position, consumer moves only read position, so no lock is shared between processes.
+#Threads of one process writing to same ring are serialized by local lock.
+#Records: 4 byte length + message_.to_bytes(), record may wrap around end of buffer
+###################################################################################
+ring_header = struct.Struct("<QQ")
+record_length = struct.Struct("<I")
+WRITE_POS_OFFSET = 0
+READ_POS_OFFSET = 8
+RING_DATA_OFFSET = 64
+
+
+class shm_ring_buffer():
+    def __init__(self,capacity:int=4*1024*1024,name:str=None,data_event=None,space_event=None):
+        self.capacity = capacity
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True,size=RING_DATA_OFFSET + capacity)
+            ring_header.pack_into(self.shm.buf,0,0,0)
+        else:
+            #child processes share resource tracker of parent, so memory is unlinked once by owner
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.buf = self.shm.buf
+        #set by producer after write, by consumer after read
+        self.data_event = data_event if data_event is not None else Event()
+        self.space_event = space_event if space_event is not None else Event()
+        self.write_lock = Lock()
+
+    #Passed to child process by name, child attaches to same memory
+    def __reduce__(self):
+        return (shm_ring_buffer,(self.capacity,self.name,self.data_event,self.space_event))
+
+    def write_pos(self):
+        return struct.unpack_from("<Q",self.buf,WRITE_POS_OFFSET)[0]
+
+    def read_pos(self):
+        return struct.unpack_from("<Q",self.buf,READ_POS_OFFSET)[0]
+
+    def copy_in(self,position:int,data):
+        start = position % self.capacity
+        first_part = min(len(data),self.capacity - start)
+        self.buf[RING_DATA_OFFSET + start:RING_DATA_OFFSET + start + first_part] = data[:first_part]
+        if first_part < len(data):
+            rest = len(data) - first_part
+            self.buf[RING_DATA_OFFSET:RING_DATA_OFFSET + rest] = data[first_part:]
+
+    def copy_out(self,position:int,length:int):
+        start = position % self.capacity
+        first_part = min(length,self.capacity - start)
+        data = bytes(self.buf[RING_DATA_OFFSET + start:RING_DATA_OFFSET + start + first_part])
+        if first_part < length:
+            data += bytes(self.buf[RING_DATA_OFFSET:RING_DATA_OFFSET + length - first_part])
+        return data
+
+    def put(self,msg:message_,block:bool=True,timeout:float=None):
+        record = msg.to_bytes()
+        total_length = record_length.size + len(record)
+        if total_length > self.capacity:
+            raise ValueError(f"Message of {len(record)} B does not fit ring of {self.capacity} B")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.write_lock:
+            while True:
+                write_pos = self.write_pos()
+                if self.capacity - (write_pos - self.read_pos()) >= total_length:
+                    break
+                if not block:
+                    raise queue.Full
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise queue.Full
+                self.space_event.clear()
+                #re-check after clear, consumer could free space in between
+                if self.capacity - (write_pos - self.read_pos()) >= total_length:
+                    break
+                self.space_event.wait(0.05 if remaining is None else min(remaining,0.05))
+            self.copy_in(write_pos,record_length.pack(len(record)))
+            self.copy_in(write_pos + record_length.size,record)
+            struct.pack_into("<Q",self.buf,WRITE_POS_OFFSET,write_pos + total_length)
+        self.data_event.set()
+
+    def get(self,block:bool=True,timeout:float=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            read_pos = self.read_pos()
+            if self.write_pos() != read_pos:
+                break
+            if not block:
+                raise queue.Empty
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise queue.Empty
+            self.data_event.clear()
+            if self.write_pos() != read_pos:
+                break
+            self.data_event.wait(0.05 if remaining is None else min(remaining,0.05))
+        length = record_length.unpack(self.copy_out(read_pos,record_length.size))[0]
+        record = self.copy_out(read_pos + record_length.size,length)
+        struct.pack_into("<Q",self.buf,READ_POS_OFFSET,read_pos + record_length.size + length)
+        self.space_event.set()
+        return message_.from_bytes(record)
+
+    def get_nowait(self):
+        return self.get(False)
+
+    def empty(self):
+        return self.write_pos() == self.read_pos()
+
+    def qsize(self):
+        """Bytes waiting in ring"""
+        return self.write_pos() - self.read_pos()
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
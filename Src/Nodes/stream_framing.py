@@ -0,0 +1,260 @@
+import codecs
+import json
+import re
+import struct
+
+
+# ****************************************************************************
+#
+# Framing of byte streams (TCP socket, UART) into messages. OS delivers
+# stream in chunks which can split or merge messages, framer collects bytes
+# in reusable buffer and returns only complete frames.
+#
+# Listener reads directly into framer buffer:
+#     with framer.write_view() as view:
+#         received = sock.recv_into(view)
+#     for data in framer.commit(received): ...
+# or passes bytes it already has with framer.feed(data).
+#
+# Node config keys:
+#   framing = raw | line | stx_etx | length_prefixed | ndjson | regex
+#   framing_delimiter = \n            - line: frame terminator (escapes allowed, eg. \r\n)
+#   framing_stx = \x02                - stx_etx: start byte
+#   framing_etx = \x03                - stx_etx: end byte
+#   framing_length_bytes = 2          - length_prefixed: 1, 2 or 4 byte length header
+#   framing_byteorder = big           - length_prefixed: big | little
+#   framing_pattern = \r?\n>          - regex: terminator of frame (eg. shell prompt)
+#   framing_encoding = utf-8          - frames are published as str, 'bytes' = no decoding
+#   framing_max_frame = 65536         - longer frame is dropped (counted in dropped_frames)
+#
+# Published data: raw/line/stx_etx/regex -> str without delimiters,
+# length_prefixed -> payload bytes without header, ndjson -> parsed JSON object
+#
+# ****************************************************************************
+
+
+class stream_framer():
+    min_free_space = 4096
+
+    def __init__(self,max_frame:int=65536,encoding:str="utf-8"):
+        self.max_frame = max_frame
+        self.encoding = encoding
+        self.buffer = bytearray(max(max_frame,self.min_free_space) + self.min_free_space)
+        #unprocessed data is buffer[start:end], search for end of frame continues from scan
+        self.start = 0
+        self.end = 0
+        self.scan = 0
+        self.dropped_frames = 0
+
+    def write_view(self):
+        """memoryview of free space at end of buffer, release it (with statement) before commit()"""
+        if len(self.buffer) - self.end < self.min_free_space:
+            self.compact()
+        return memoryview(self.buffer)[self.end:]
+
+    def commit(self,received:int):
+        """received bytes were written into write_view(), returns complete frames"""
+        self.end += received
+        frames = []
+        while True:
+            frame = self.next_frame()
+            if frame is None:
+                break
+            if len(frame) > self.max_frame:
+                self.dropped_frames += 1
+                continue
+            frames.append(self.decode(frame))
+        if self.end - self.start > self.max_frame:
+            #no end of frame in max_frame bytes, data can not be framed
+            self.dropped_frames += 1
+            self.resync()
+        return frames
+
+    def feed(self,data):
+        frames = []
+        data = memoryview(data)
+        while len(data):
+            with self.write_view() as view:
+                received = min(len(view),len(data))
+                view[:received] = data[:received]
+            frames += self.commit(received)
+            data = data[received:]
+        return frames
+
+    def compact(self):
+        remaining = self.end - self.start
+        self.buffer[:remaining] = self.buffer[self.start:self.end]
+        self.scan -= self.start
+        self.start = 0
+        self.end = remaining
+
+    #skip buffered data, framing starts again with next received byte
+    def resync(self):
+        self.start = self.scan = self.end
+
+    #Override - bytes of next complete frame (moves self.start behind it) or None
+    def next_frame(self):
+        return None
+
+    def decode(self,frame:bytes):
+        if self.encoding == "bytes":
+            return frame
+        return frame.decode(self.encoding,"replace")
+
+
+class raw_framer(stream_framer):
+    """Every received chunk is one frame"""
+    def __init__(self,**kwargs):
+        super().__init__(**kwargs)
+        #multibyte character can be split between reads, its start waits in decoder for next chunk
+        self.decoder = codecs.getincrementaldecoder(self.encoding)("replace") if self.encoding != "bytes" else None
+
+    def next_frame(self):
+        if self.end == self.start:
+            return None
+        frame = bytes(self.buffer[self.start:self.end])
+        self.start = self.scan = self.end
+        return frame
+
+    def decode(self,frame:bytes):
+        if self.decoder is None:
+            return frame
+        return self.decoder.decode(frame)
+
+    def commit(self,received:int):
+        #chunk with only start of character gives no text yet
+        return [frame for frame in super().commit(received) if frame != ""]
+
+
+class delimiter_framer(stream_framer):
+    """Frame ends with delimiter (line, ndjson)"""
+    def __init__(self,delimiter:bytes=b"\n",**kwargs):
+        super().__init__(**kwargs)
+        self.delimiter = delimiter
+
+    def next_frame(self):
+        position = self.buffer.find(self.delimiter,self.scan,self.end)
+        if position < 0:
+            #delimiter can be split between reads
+            self.scan = max(self.start,self.end - len(self.delimiter) + 1)
+            return None
+        frame = bytes(self.buffer[self.start:position])
+        self.start = self.scan = position + len(self.delimiter)
+        return frame
+
+
+class line_framer(delimiter_framer):
+    def decode(self,frame:bytes):
+        #readline() compatibility, '\r' of '\r\n' terminated lines is removed
+        if frame.endswith(b"\r"):
+            frame = frame[:-1]
+        return super().decode(frame)
+
+
+class ndjson_framer(delimiter_framer):
+    def decode(self,frame:bytes):
+        try:
+            return json.loads(frame)
+        except ValueError:
+            self.dropped_frames += 1
+            return super().decode(frame)
+
+
+class stx_etx_framer(stream_framer):
+    """STX payload ETX, bytes outside of frame are skipped"""
+    def __init__(self,stx:bytes=b"\x02",etx:bytes=b"\x03",**kwargs):
+        super().__init__(**kwargs)
+        self.stx = stx
+        self.etx = etx
+        self.in_frame = False
+
+    def resync(self):
+        super().resync()
+        self.in_frame = False
+
+    def next_frame(self):
+        if not self.in_frame:
+            position = self.buffer.find(self.stx,self.start,self.end)
+            if position < 0:
+                self.start = self.scan = self.end
+                return None
+            self.in_frame = True
+            self.start = self.scan = position + len(self.stx)
+        position = self.buffer.find(self.etx,self.scan,self.end)
+        if position < 0:
+            self.scan = self.end
+            return None
+        frame = bytes(self.buffer[self.start:position])
+        self.start = self.scan = position + len(self.etx)
+        self.in_frame = False
+        return frame
+
+
+class length_prefixed_framer(stream_framer):
+    """Length header (payload size) followed by payload"""
+    def __init__(self,length_bytes:int=2,byteorder:str="big",**kwargs):
+        kwargs.setdefault("encoding","bytes")
+        super().__init__(**kwargs)
+        self.header = struct.Struct(("<" if byteorder == "little" else ">") + {1:"B",2:"H",4:"I"}[length_bytes])
+
+    def next_frame(self):
+        if self.end - self.start < self.header.size:
+            return None
+        length = self.header.unpack_from(self.buffer,self.start)[0]
+        if length > self.max_frame:
+            #stream lost synchronization, nothing after this header can be trusted
+            self.dropped_frames += 1
+            self.resync()
+            return None
+        frame_end = self.start + self.header.size + length
+        if frame_end > self.end:
+            return None
+        frame = bytes(self.buffer[self.start + self.header.size:frame_end])
+        self.start = self.scan = frame_end
+        return frame
+
+
+class regex_framer(stream_framer):
+    """Frame ends with match of terminator pattern"""
+    def __init__(self,pattern:bytes,**kwargs):
+        super().__init__(**kwargs)
+        self.pattern = re.compile(pattern)
+
+    def next_frame(self):
+        #pattern can span reads, search starts at beginning of unprocessed data
+        match = self.pattern.search(self.buffer,self.start,self.end)
+        if match is None or match.end() == match.start():
+            return None
+        frame = bytes(self.buffer[self.start:match.start()])
+        self.start = self.scan = match.end()
+        return frame
+
+
+
+def config_bytes(value:str):
+    """Config value with escapes (\\n, \\x02) to bytes"""
+    return value.encode("latin-1","backslashreplace").decode("unicode_escape").encode("latin-1")
+
+
+def create_framer(config:dict,default:str="raw"):
+    config = config or {}
+    framing = config.get("framing",default)
+    common = {"max_frame":int(config.get("framing_max_frame",65536))}
+    if "framing_encoding" in config:
+        common["encoding"] = config["framing_encoding"]
+    match framing:
+        case "raw":
+            return raw_framer(**common)
+        case "line":
+            return line_framer(config_bytes(config.get("framing_delimiter","\\n")),**common)
+        case "ndjson":
+            return ndjson_framer(config_bytes(config.get("framing_delimiter","\\n")),**common)
+        case "stx_etx":
+            return stx_etx_framer(config_bytes(config.get("framing_stx","\\x02")),config_bytes(config.get("framing_etx","\\x03")),**common)
+        case "length_prefixed":
+            return length_prefixed_framer(int(config.get("framing_length_bytes",2)),config.get("framing_byteorder","big"),**common)
+        case "regex":
+            #regex escapes are handled by re itself
+            return regex_framer(config["framing_pattern"].encode("utf-8"),**common)
+        case _:
+            raise ValueError(f"Unknown framing: {framing}, available: raw, line, stx_etx, length_prefixed, ndjson, regex")
@@ -0,0 +1,226 @@
+from Nodes.message import message_, message_from_bytes
+from bisect import bisect_left
+from fnmatch import fnmatchcase
+import mmap
+import struct
+import time
+
+
+# ****************************************************************************
+#
+# Binary trace log of bus traffic. Messages are stored in their binary form
+# (message_.to_bytes()) and grouped into chunks, every chunk header has number
+# of records and min/max capture timestamp, so reader skips to requested time
+# without decoding messages before it.
+#
+#   file header | chunk | chunk | ... | index | footer
+#   chunk  = chunk header | (record length, message bytes) * record count
+#   index  = chunk offsets and time ranges, written by close()
+#
+# File without index (recorder killed) is still readable, reader walks chunk
+# headers and ignores last chunk if it was not written completely.
+#
+# Timestamps are message_.timestamp_ns (time.monotonic_ns() of recording
+# process), file header keeps wall clock at start for conversion.
+#
+# Writer: Backend/trace_recorder.py, replay: Nodes/Replay_node.py
+#
+# ****************************************************************************
+
+
+TRACE_MAGIC = b"PTRC"
+TRACE_VERSION = 1
+CHUNK_MAGIC = b"CHNK"
+INDEX_MAGIC = b"CIDX"
+FOOTER_MAGIC = b"PEND"
+
+#magic, version, reserved, wall clock ns, monotonic ns at start
+trace_file_header = struct.Struct("<4sHHqq")
+#magic, length of records, record count, min timestamp, max timestamp
+trace_chunk_header = struct.Struct("<4sIIqq")
+trace_record_header = struct.Struct("<I")
+#magic, number of entries
+trace_index_header = struct.Struct("<4sI")
+#chunk offset, record count, min timestamp, max timestamp
+trace_index_entry = struct.Struct("<QIqq")
+#index offset, magic
+trace_footer = struct.Struct("<Q4s")
+#timestamp_ns of message_header (Nodes/message.py), after format version byte
+record_timestamp = struct.Struct("<q")
+record_timestamp_offset = 1
+
+
+class trace_writer():
+    def __init__(self,path,chunk_bytes:int=256 * 1024,chunk_max_age_s:float=1.0):
+        self.path = path
+        self.chunk_bytes = chunk_bytes
+        self.chunk_max_age_s = chunk_max_age_s
+        self.file = open(path,"wb")
+        self.file.write(trace_file_header.pack(TRACE_MAGIC,TRACE_VERSION,0,time.time_ns(),time.monotonic_ns()))
+        self.offset = trace_file_header.size
+        #(offset, count, min timestamp, max timestamp) of written chunks
+        self.index = []
+        self.chunk = bytearray()
+        self.chunk_count = 0
+        self.chunk_min_ns = 0
+        self.chunk_max_ns = 0
+        self.chunk_started = 0.0
+        self.records_written = 0
+
+    def write(self,msg:message_):
+        self.write_record(msg.to_bytes(),msg.timestamp_ns)
+
+    def write_record(self,record:bytes,timestamp_ns:int):
+        if not self.chunk_count:
+            self.chunk_min_ns = self.chunk_max_ns = timestamp_ns
+            self.chunk_started = time.monotonic()
+        elif timestamp_ns < self.chunk_min_ns:
+            self.chunk_min_ns = timestamp_ns
+        elif timestamp_ns > self.chunk_max_ns:
+            self.chunk_max_ns = timestamp_ns
+        self.chunk += trace_record_header.pack(len(record))
+        self.chunk += record
+        self.chunk_count += 1
+        if len(self.chunk) >= self.chunk_bytes:
+            self.write_chunk()
+
+    def flush_if_old(self):
+        """Writes open chunk older than chunk_max_age_s, so recording of slow bus reaches disk"""
+        if self.chunk_count and time.monotonic() - self.chunk_started >= self.chunk_max_age_s:
+            self.write_chunk()
+
+    def write_chunk(self):
+        if not self.chunk_count:
+            return
+        self.file.write(trace_chunk_header.pack(CHUNK_MAGIC,len(self.chunk),self.chunk_count,self.chunk_min_ns,self.chunk_max_ns))
+        self.file.write(self.chunk)
+        self.file.flush()
+        self.index.append((self.offset,self.chunk_count,self.chunk_min_ns,self.chunk_max_ns))
+        self.offset += trace_chunk_header.size + len(self.chunk)
+        self.records_written += self.chunk_count
+        self.chunk = bytearray()
+        self.chunk_count = 0
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.write_chunk()
+        index = [trace_index_header.pack(INDEX_MAGIC,len(self.index))]
+        index += [trace_index_entry.pack(*entry) for entry in self.index]
+        self.file.write(b"".join(index))
+        self.file.write(trace_footer.pack(self.offset,FOOTER_MAGIC))
+        self.file.close()
+
+
+
+class trace_reader():
+    def __init__(self,path):
+        self.path = path
+        with open(path,"rb") as file:
+            self.mmap = mmap.mmap(file.fileno(),0,access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mmap)
+        magic, version, _, self.start_wall_time_ns, self.start_monotonic_ns = trace_file_header.unpack_from(self.view,0)
+        if magic != TRACE_MAGIC or version != TRACE_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not trace log version {TRACE_VERSION}")
+        self.chunks = self.read_index()
+        if not self.chunks:
+            self.chunks = self.scan_chunks()
+        #running max of chunk max timestamps is sorted, first chunk with records after start_ns is found by bisect
+        self.chunk_max_ns = []
+        for _, _, _, max_ns in self.chunks:
+            self.chunk_max_ns.append(max(max_ns,self.chunk_max_ns[-1]) if self.chunk_max_ns else max_ns)
+
+    def read_index(self):
+        if len(self.view) < trace_file_header.size + trace_footer.size:
+            return []
+        index_offset, magic = trace_footer.unpack_from(self.view,len(self.view) - trace_footer.size)
+        if magic != FOOTER_MAGIC:
+            return []
+        magic, count = trace_index_header.unpack_from(self.view,index_offset)
+        if magic != INDEX_MAGIC:
+            return []
+        offset = index_offset + trace_index_header.size
+        return [trace_index_entry.unpack_from(self.view,offset + number * trace_index_entry.size) for number in range(count)]
+
+    def scan_chunks(self):
+        chunks = []
+        offset = trace_file_header.size
+        while offset + trace_chunk_header.size <= len(self.view):
+            magic, length, count, min_ns, max_ns = trace_chunk_header.unpack_from(self.view,offset)
+            if magic != CHUNK_MAGIC or offset + trace_chunk_header.size + length > len(self.view):
+                break
+            chunks.append((offset,count,min_ns,max_ns))
+            offset += trace_chunk_header.size + length
+        return chunks
+
+    def __len__(self):
+        return sum(count for _, count, _, _ in self.chunks)
+
+    def time_range(self):
+        """(first, last) capture timestamp_ns, None for empty trace"""
+        if not self.chunks:
+            return None
+        return min(min_ns for _, _, min_ns, _ in self.chunks), self.chunk_max_ns[-1]
+
+    def wall_time_ns(self,timestamp_ns:int):
+        return self.start_wall_time_ns + timestamp_ns - self.start_monotonic_ns
+
+    def records(self,start_ns:int=None,end_ns:int=None):
+        """(timestamp_ns, memoryview of message bytes), views are valid until close()"""
+        first_chunk = 0 if start_ns is None else bisect_left(self.chunk_max_ns,start_ns)
+        view = self.view
+        for offset, count, min_ns, _ in self.chunks[first_chunk:]:
+            if end_ns is not None and min_ns > end_ns:
+                #chunks are only roughly in time order (capture time of different nodes), later chunk can still match
+                continue
+            offset += trace_chunk_header.size
+            for _ in range(count):
+                length = trace_record_header.unpack_from(view,offset)[0]
+                offset += trace_record_header.size
+                record = view[offset:offset + length]
+                offset += length
+                timestamp_ns = record_timestamp.unpack_from(record,record_timestamp_offset)[0]
+                if (start_ns is None or timestamp_ns >= start_ns) and (end_ns is None or timestamp_ns <= end_ns):
+                    yield timestamp_ns, record
+
+    def messages(self,start_ns:int=None,end_ns:int=None,topics:list=None):
+        """Decoded message_ objects, topics - patterns ('CAN1', 'SCP/#', 'UART*')"""
+        topic_matches = topic_filter(topics)
+        for _, record in self.records(start_ns,end_ns):
+            msg = message_from_bytes(record)
+            if topic_matches is None or topic_matches(msg.topic):
+                yield msg
+
+    def close(self):
+        if self.view is None:
+            return
+        try:
+            self.view.release()
+            self.mmap.close()
+        except BufferError:
+            #record views are still used, mapping is closed when they are garbage collected
+            pass
+        self.view = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+
+
+def topic_filter(patterns:list):
+    """Same wildcards as broker subscriptions: '#', 'SCP/#', '*', '?'"""
+    if not patterns:
+        return None
+    globs = []
+    for pattern in patterns:
+        if pattern == "#":
+            return None
+        if pattern.endswith("/#"):
+            globs += [pattern[:-2],pattern[:-1] + "*"]
+        else:
+            globs.append(pattern)
+    return lambda topic: topic is not None and any(fnmatchcase(topic,glob) for glob in globs)
@@ -0,0 +1,166 @@
+from Nodes.priv_dependencies import *
+from Nodes.message import message_batch, stop_sentinel
+from Nodes.payload_pool import payload_handle
+from collections import OrderedDict, defaultdict, deque
+from threading import Condition, Lock
+import queue
+
+
+#Transport between nodes, broker and user script
+#All nodes live in GUI process as QThreads, so default transport passes messages by reference (no pickling, no pipe)
+#"process" transport (multiprocessing.Queue) is only needed when node runs in other process
+###################################################################################
+class in_process_queue(queue.SimpleQueue):
+    """Same put/get/get_nowait/empty/qsize API as multiprocessing.Queue"""
+    pass
+
+
+#Bounded queue for slow consumers (GUI trace, user script which stopped reading)
+#overflow_policy:
+#   block       - put waits until consumer makes space, not for queues filled by message_broker
+#   drop_oldest - oldest item is removed to make space
+#   drop_newest - new item is rejected
+#   keep_latest - only latest item per key (key_attribute of message, default topic) is kept,
+#                 key_attribute None = one key (label) for whole queue, eg. buffer of one topic
+#stop_sentinel bypasses capacity and policy, consumer always gets it
+###################################################################################
+overflow_policies = ("block","drop_oldest","drop_newest","keep_latest")
+
+
+class bounded_queue():
+    def __init__(self,maxsize:int,overflow_policy:str="block",key_attribute:str="topic",label:str=None):
+        if overflow_policy not in overflow_policies:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}, available: {overflow_policies}")
+        self.maxsize = maxsize
+        self.overflow_policy = overflow_policy
+        self.key_attribute = key_attribute
+        #used as topic in drop counters for items without topic (eg. raw data in user script buffers)
+        self.label = label
+        self.items = OrderedDict() if overflow_policy == "keep_latest" else deque()
+        self.next_item_id = 0
+        self.lock = Lock()
+        self.not_empty = Condition(self.lock)
+        self.not_full = Condition(self.lock)
+        self.dropped = 0
+        self.dropped_per_topic = defaultdict(int)
+
+    def put(self,item,block:bool=True,timeout:float=None):
+        #batches are split so that capacity and keys apply per message
+        if isinstance(item,message_batch):
+            for msg in item.messages:
+                self.put(msg,block,timeout)
+            return
+        with self.lock:
+            if isinstance(item,stop_sentinel):
+                if self.overflow_policy == "keep_latest":
+                    self.items[item] = item
+                else:
+                    self.items.append(item)
+            elif self.overflow_policy == "keep_latest":
+                self.put_keep_latest(item)
+            elif len(self.items) >= self.maxsize:
+                if self.overflow_policy == "drop_newest":
+                    self.count_drop(item)
+                    return
+                if self.overflow_policy == "drop_oldest":
+                    self.count_drop(self.items.popleft())
+                elif not self.wait_for_space(block,timeout):
+                    raise queue.Full
+                self.items.append(item)
+            else:
+                self.items.append(item)
+            self.not_empty.notify()
+
+    def put_keep_latest(self,item):
+        key = getattr(item,self.key_attribute,None) if self.key_attribute is not None else self.label
+        if key in self.items:
+            self.count_drop(self.items.pop(key))
+        elif len(self.items) >= self.maxsize:
+            self.count_drop(self.items.popitem(last=False)[1])
+        self.items[key] = item
+
+    def wait_for_space(self,block:bool,timeout:float):
+        if not block:
+            return False
+        return self.not_full.wait_for(lambda: len(self.items) < self.maxsize,timeout)
+
+    def get(self,block:bool=True,timeout:float=None):
+        with self.lock:
+            if not self.items:
+                if not block or not self.not_empty.wait_for(lambda: len(self.items) > 0,timeout):
+                    raise queue.Empty
+            if self.overflow_policy == "keep_latest":
+                item = self.items.popitem(last=False)[1]
+            else:
+                item = self.items.popleft()
+            self.not_full.notify()
+            return item
+
+    def get_nowait(self):
+        return self.get(False)
+
+    def put_nowait(self,item):
+        return self.put(item,False)
+
+    def empty(self):
+        return len(self.items) == 0
+
+    def qsize(self):
+        return len(self.items)
+
+    #Call with lock taken
+    def count_drop(self,item):
+        self.dropped += 1
+        self.dropped_per_topic[getattr(item,"topic",self.label)] += 1
+        #reference of dropped message would keep shared memory block from pool forever
+        data = item if type(item) is payload_handle else getattr(item,"data",None)
+        if type(data) is payload_handle:
+            data.release()
+
+
+
+transport_types = {
+    "in_process": in_process_queue,
+    "process": Queue,
+}
+
+
+def create_queue(transport_type:str="in_process",maxsize:int=0,overflow_policy:str="block",key_attribute:str="topic",label:str=None):
+    if transport_type not in transport_types:
+        raise ValueError(f"Unknown transport type: {transport_type}, available: {list(transport_types)}")
+    if maxsize <= 0:
+        return transport_types[transport_type]()
+    if transport_type == "process":
+        if overflow_policy != "block":
+            raise ValueError("process transport supports only 'block' overflow policy")
+        return Queue(maxsize)
+    return bounded_queue(maxsize,overflow_policy,key_attribute,label)
+
+
+def node_transport_type(config:dict):
+    """Transport of node own queue, set by 'transport' key in node config"""
+    if config:
+        return config.get("transport","in_process")
+    return "in_process"
+
+
+def check_broker_fed_queue(maxsize:int,overflow_policy:str,label:str=None):
+    """Broker puts into all subscriber queues from one thread, full blocking queue would stop every topic"""
+    if maxsize > 0 and overflow_policy == "block":
+        raise ValueError(f"Queue {label} is filled by message broker and can not block, use drop_oldest / drop_newest / keep_latest")
+
+
+def node_queue_options(config:dict):
+    """Capacity of node own queue, set by 'queue_size', 'overflow_policy' and 'overflow_key' keys in node config"""
+    if not config:
+        return {}
+    options = {
+        "maxsize": int(config.get("queue_size",0)),
+        "overflow_policy": config.get("overflow_policy","drop_oldest"),
+        "key_attribute": config.get("overflow_key","topic"),
+        "label": config.get("node_name"),
+    }
+    if options["maxsize"] > 0 and node_transport_type(config) == "process":
+        raise ValueError(f"Queue {options['label']}: queue_size is not available with transport = process, bounded process queue blocks broker")
+    check_broker_fed_queue(options["maxsize"],options["overflow_policy"],options["label"])
+    return options
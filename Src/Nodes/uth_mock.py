@@ -1,13 +1,25 @@
 
 class User_thread_mock():
     @staticmethod
-    def add_sub(topic:str):
+    def add_sub(topic:str,queue_size:int=0,overflow_policy:str="drop_oldest"):
         print(f"Added sub on {topic}")
     
     @staticmethod
     def del_sub( topic:str):
         print(f"Removed sub from {topic}")
 
+    @staticmethod
+    def get_drop_counters():
+        return {}
+
+    @staticmethod
+    def get_metrics(previous:dict=None):
+        return {}
+
+    @staticmethod
+    def get_node_health(node_name:str=None):
+        return "connected" if node_name is not None else {}
+
     @staticmethod
     def send_message(topic:str,data:str,optional_params="SEND_MSG"):
         pass
@@ -16,6 +28,10 @@ class User_thread_mock():
     def send_querry(topic:str,data:str,optional_params="SEND_MSG",time_for_timeout=None,blocking=False,data_to_search=None):
         pass
 
+    @staticmethod
+    def send_querry_async(topic:str,data:str,optional_params="SEND_MSG"):
+        pass
+
     @staticmethod
     def read_message(topic:str,time_for_timeout=None,blocking=False,data_to_search=None):
         pass
\ No newline at end of file
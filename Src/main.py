@@ -25,5 +25,6 @@ class MainWindow(QMainWindow):
 if __name__ == '__main__':
     app = QApplication(sys.argv)
     main_window = MainWindow()
+    app.aboutToQuit.connect(main_window.backend.shutdown)
     main_window.show()
     app.exec_()
\ No newline at end of file